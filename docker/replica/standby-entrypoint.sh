@@ -0,0 +1,11 @@
+#!/bin/bash
+# Clones the primary on first start and runs the copy as a hot standby.
+set -euo pipefail
+
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+  until pg_isready -h db -U "$POSTGRES_USER"; do sleep 1; done
+  export PGPASSWORD="$REPLICATION_PASSWORD"
+  pg_basebackup -h db -U "$REPLICATION_USER" -D "$PGDATA" -X stream -R
+  chmod 700 "$PGDATA"
+fi
+exec postgres -c hot_standby=on
@@ -15,14 +15,28 @@ start_admin() {
   ADMIN_PID=$!
 }
 
+start_sub() {
+  echo "Starting subscription gateway..."
+  (cd "$ROOT_DIR/services/sub" && PYTHONPATH=. uvicorn app.main:app --port 8002) &
+  SUB_PID=$!
+}
+
+start_miniapp() {
+  echo "Starting miniapp..."
+  (cd "$ROOT_DIR/services/miniapp" && PYTHONPATH=. uvicorn app.main:app --port 8010) &
+  MINIAPP_PID=$!
+}
+
 stop_all() {
   echo "Stopping services..."
-  kill "${BOT_PID:-0}" "${ADMIN_PID:-0}" 2>/dev/null || true
+  kill "${BOT_PID:-0}" "${ADMIN_PID:-0}" "${SUB_PID:-0}" "${MINIAPP_PID:-0}" 2>/dev/null || true
 }
 
 trap stop_all EXIT INT TERM
 
 start_bot
 start_admin
+start_sub
+start_miniapp
 
-wait "$BOT_PID" "$ADMIN_PID"
+wait "$BOT_PID" "$ADMIN_PID" "$SUB_PID" "$MINIAPP_PID"
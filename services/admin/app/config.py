@@ -35,3 +35,25 @@ def get_admin_pass() -> str:
 
 def get_database_url() -> str:
     return _require("DATABASE_URL")
+
+
+def get_replica_urls() -> tuple[str, ...]:
+    """Read-only Postgres replicas, comma separated; empty reads the primary."""
+    load_env()
+    raw = os.getenv("DATABASE_REPLICA_URLS", "")
+    return tuple(url.strip() for url in raw.split(",") if url.strip())
+
+
+def get_replica_max_lag_seconds() -> float:
+    load_env()
+    return float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+
+
+def get_replica_check_seconds() -> float:
+    load_env()
+    return float(os.getenv("REPLICA_CHECK_SECONDS", "5"))
+
+
+def get_replica_sticky_seconds() -> float:
+    load_env()
+    return float(os.getenv("REPLICA_STICKY_SECONDS", "10"))
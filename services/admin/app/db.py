@@ -8,6 +8,7 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 
 from app.config import get_database_url
+from app.replicas import connect_read, note_write
 
 
 @dataclass(frozen=True)
@@ -22,6 +23,10 @@ def _connect():
     return psycopg2.connect(get_database_url())
 
 
+def _connect_read(tg_id: int | None = None):
+    return connect_read(get_database_url(), tg_id)
+
+
 def fetch_users(search: str | None, limit: int, offset: int) -> Page:
     query = """
         SELECT tg_id, username, balance, referral_balance, created_at
@@ -42,7 +47,7 @@ def fetch_users(search: str | None, limit: int, offset: int) -> Page:
             where = "WHERE username ILIKE %s"
             params.append(f"%{search}%")
 
-    with _connect() as conn:
+    with _connect_read() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(count_query.format(where=where), params)
             total = int(cur.fetchone()["count"])
@@ -52,7 +57,7 @@ def fetch_users(search: str | None, limit: int, offset: int) -> Page:
 
 
 def get_user(tg_id: int) -> dict | None:
-    with _connect() as conn:
+    with _connect_read(tg_id) as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
                 """
@@ -68,21 +73,56 @@ def get_user(tg_id: int) -> dict | None:
 def update_user(
     tg_id: int, username: str | None, balance: int, referral_balance: int
 ) -> None:
+    note_write(tg_id)
     with _connect() as conn:
         with conn.cursor() as cur:
+            # The old balance is read from the statement snapshot, so the
+            # ledger row carries the exact adjustment made here.
+            cur.execute(
+                """
+                WITH old AS (
+                    SELECT balance FROM users WHERE tg_id = %(tg_id)s
+                ),
+                updated AS (
+                    UPDATE users
+                    SET username = %(username)s,
+                        balance = %(balance)s,
+                        referral_balance = %(referral_balance)s
+                    WHERE tg_id = %(tg_id)s
+                    RETURNING balance
+                )
+                INSERT INTO balance_ledger (tg_id, delta, balance_after, reason)
+                SELECT %(tg_id)s, updated.balance - old.balance, updated.balance, 'admin'
+                FROM old, updated
+                WHERE updated.balance <> old.balance
+                """,
+                {
+                    "tg_id": tg_id,
+                    "username": username,
+                    "balance": balance,
+                    "referral_balance": referral_balance,
+                },
+            )
+
+
+def fetch_balance_history(tg_id: int, limit: int = 50) -> list[dict]:
+    with _connect_read(tg_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
                 """
-                UPDATE users
-                SET username = %s,
-                    balance = %s,
-                    referral_balance = %s
+                SELECT delta, balance_after, reason, created_at
+                FROM balance_ledger
                 WHERE tg_id = %s
+                ORDER BY id DESC
+                LIMIT %s
                 """,
-                (username, balance, referral_balance, tg_id),
+                (tg_id, limit),
             )
+            return list(cur.fetchall())
 
 
 def delete_user(tg_id: int) -> None:
+    note_write(tg_id)
     with _connect() as conn:
         with conn.cursor() as cur:
             cur.execute("DELETE FROM subscriptions WHERE tg_id = %s", (tg_id,))
@@ -98,7 +138,7 @@ def fetch_subscriptions(limit: int, offset: int) -> Page:
     """
     count_query = "SELECT COUNT(*) FROM subscriptions"
 
-    with _connect() as conn:
+    with _connect_read() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(count_query)
             total = int(cur.fetchone()["count"])
@@ -108,7 +148,7 @@ def fetch_subscriptions(limit: int, offset: int) -> Page:
 
 
 def get_subscription(tg_id: int) -> dict | None:
-    with _connect() as conn:
+    with _connect_read(tg_id) as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
                 """
@@ -128,6 +168,7 @@ def update_subscription(
     subscription_link: str | None,
     instructions: str | None,
 ) -> None:
+    note_write(tg_id)
     with _connect() as conn:
         with conn.cursor() as cur:
             cur.execute(
@@ -142,3 +183,51 @@ def update_subscription(
                 """,
                 (start_at, end_at, subscription_link, instructions, tg_id),
             )
+
+
+def fetch_traffic_top(since: datetime, limit: int) -> list[dict]:
+    """Heaviest clients by bytes in ``traffic_stats`` buckets since ``since``."""
+    with _connect_read() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                WITH top AS (
+                    SELECT email,
+                           string_agg(DISTINCT server, ', ') AS servers,
+                           SUM(up_bytes) AS up_bytes,
+                           SUM(down_bytes) AS down_bytes,
+                           MAX(last_online) AS last_online
+                    FROM traffic_stats
+                    WHERE bucket >= %s
+                    GROUP BY email
+                    ORDER BY SUM(up_bytes + down_bytes) DESC
+                    LIMIT %s
+                )
+                SELECT top.*, u.tg_id
+                FROM top
+                LEFT JOIN users u
+                  ON '@' || COALESCE(u.username, 'tg_' || u.tg_id) = top.email
+                ORDER BY top.up_bytes + top.down_bytes DESC
+                """,
+                (since, limit),
+            )
+            return list(cur.fetchall())
+
+
+def fetch_traffic_by_server(since: datetime) -> list[dict]:
+    with _connect_read() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                SELECT server,
+                       COUNT(DISTINCT email) AS clients,
+                       SUM(up_bytes) AS up_bytes,
+                       SUM(down_bytes) AS down_bytes
+                FROM traffic_stats
+                WHERE bucket >= %s
+                GROUP BY server
+                ORDER BY server
+                """,
+                (since,),
+            )
+            return list(cur.fetchall())
@@ -0,0 +1,100 @@
+"""Read-only queries on a Postgres replica, with a fallback to the primary.
+
+A replica is used while its replay lag stays under ``REPLICA_MAX_LAG_SECONDS``.
+After the admin edits a user, that user's pages read the primary for
+``REPLICA_STICKY_SECONDS`` so the edit is visible right away.
+"""
+
+from __future__ import annotations
+
+import itertools
+import logging
+import threading
+import time
+
+import psycopg2
+
+from app.config import (
+    get_replica_check_seconds,
+    get_replica_max_lag_seconds,
+    get_replica_sticky_seconds,
+    get_replica_urls,
+)
+
+logger = logging.getLogger(__name__)
+
+# NULL unless the standby is streaming: a disconnected standby also has
+# receive LSN == replay LSN and would otherwise look fresh.
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN NULL
+        WHEN NOT EXISTS (
+            SELECT 1 FROM pg_stat_wal_receiver
+            WHERE COALESCE(status, 'streaming') = 'streaming'
+        ) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+_checked: dict[str, tuple[float, bool]] = {}
+_writes: dict[int, float] = {}
+_order: itertools.cycle | None = None
+_lock = threading.Lock()
+
+
+def note_write(tg_id: int) -> None:
+    if not get_replica_urls():
+        return
+    now = time.monotonic()
+    sticky = get_replica_sticky_seconds()
+    with _lock:
+        for key in [key for key, at in _writes.items() if now - at >= sticky]:
+            del _writes[key]
+        _writes[tg_id] = now
+
+
+def _wrote_recently(tg_id: int) -> bool:
+    at = _writes.get(tg_id)
+    return at is not None and time.monotonic() - at < get_replica_sticky_seconds()
+
+
+def _is_usable(dsn: str) -> bool:
+    now = time.monotonic()
+    checked = _checked.get(dsn)
+    if checked and now - checked[0] < get_replica_check_seconds():
+        return checked[1]
+    try:
+        conn = psycopg2.connect(dsn, connect_timeout=2)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(LAG_QUERY)
+                lag = cur.fetchone()[0]
+        finally:
+            conn.close()
+    except psycopg2.Error as exc:
+        logger.warning("Replica unavailable: %s", exc)
+        lag = None
+    usable = lag is not None and float(lag) <= get_replica_max_lag_seconds()
+    _checked[dsn] = (now, usable)
+    return usable
+
+
+def connect_read(primary_dsn: str, tg_id: int | None = None):
+    """Connection for a read-only query: a fresh-enough replica or the primary."""
+    global _order
+    urls = get_replica_urls()
+    if urls and not (tg_id is not None and _wrote_recently(tg_id)):
+        with _lock:
+            if _order is None:
+                _order = itertools.cycle(urls)
+        for _ in range(len(urls)):
+            with _lock:
+                dsn = next(_order)
+            if not _is_usable(dsn):
+                continue
+            try:
+                return psycopg2.connect(dsn, connect_timeout=2)
+            except psycopg2.OperationalError:
+                _checked[dsn] = (time.monotonic(), False)
+    return psycopg2.connect(primary_dsn)
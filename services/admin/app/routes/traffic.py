@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from fastapi import APIRouter, Request
+from fastapi.responses import HTMLResponse
+from fastapi.templating import Jinja2Templates
+
+from app.db import fetch_traffic_by_server, fetch_traffic_top
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+router = APIRouter(prefix="/admin", tags=["traffic"])
+templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
+
+
+def _gib(value: int | None) -> str:
+    return f"{(value or 0) / 1024 ** 3:.2f}"
+
+
+@router.get("/traffic", response_class=HTMLResponse)
+async def traffic_overview(request: Request, hours: int = 24, limit: int = 50):
+    hours = min(max(hours, 1), 24 * 90)
+    limit = min(max(limit, 1), 200)
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    return templates.TemplateResponse(
+        "traffic.html",
+        {
+            "request": request,
+            "hours": hours,
+            "limit": limit,
+            "servers": fetch_traffic_by_server(since),
+            "clients": fetch_traffic_top(since, limit),
+            "gib": _gib,
+        },
+    )
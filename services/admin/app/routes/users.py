@@ -6,7 +6,13 @@ from fastapi import APIRouter, Form, HTTPException, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 
-from app.db import delete_user, fetch_users, get_user, update_user
+from app.db import (
+    delete_user,
+    fetch_balance_history,
+    fetch_users,
+    get_user,
+    update_user,
+)
 
 BASE_DIR = Path(__file__).resolve().parents[2]
 router = APIRouter(prefix="/admin", tags=["users"])
@@ -49,7 +55,11 @@ async def user_detail(request: Request, tg_id: int):
         raise HTTPException(status_code=404, detail="User not found")
     return templates.TemplateResponse(
         "user_detail.html",
-        {"request": request, "user": user},
+        {
+            "request": request,
+            "user": user,
+            "ledger": fetch_balance_history(tg_id),
+        },
     )
 
 
@@ -0,0 +1,62 @@
+"""add provisioning jobs queue
+
+Revision ID: 003_provisioning_jobs
+Revises: 002_add_subscription_country
+Create Date: 2026-10-19 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "003_provisioning_jobs"
+down_revision = "002_add_subscription_country"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "provisioning_jobs",
+        sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=True),
+        sa.Column("idempotency_key", sa.Text(), nullable=False, unique=True),
+        sa.Column("tg_id", sa.BigInteger(), nullable=False),
+        sa.Column("kind", sa.Text(), nullable=False),
+        sa.Column("country", sa.Text(), nullable=False),
+        sa.Column("email", sa.Text(), nullable=False),
+        sa.Column("days", sa.Integer(), nullable=False),
+        sa.Column("amount", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("sub_id", sa.Text(), nullable=False),
+        sa.Column("status", sa.Text(), nullable=False, server_default="pending"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("last_error", sa.Text()),
+        sa.Column(
+            "run_after",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.text("NOW()"),
+        ),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.text("NOW()"),
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.text("NOW()"),
+        ),
+    )
+    op.create_index(
+        "ix_provisioning_jobs_status_run_after",
+        "provisioning_jobs",
+        ["status", "run_after"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_provisioning_jobs_status_run_after", table_name="provisioning_jobs"
+    )
+    op.drop_table("provisioning_jobs")
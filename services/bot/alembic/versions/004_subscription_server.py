@@ -0,0 +1,26 @@
+"""record placement server on subscriptions and jobs
+
+Revision ID: 004_subscription_server
+Revises: 003_provisioning_jobs
+Create Date: 2026-10-19 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "004_subscription_server"
+down_revision = "003_provisioning_jobs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("subscriptions", sa.Column("server", sa.Text(), nullable=True))
+    op.add_column("provisioning_jobs", sa.Column("server", sa.Text(), nullable=True))
+    op.create_index("ix_subscriptions_server", "subscriptions", ["server"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_subscriptions_server", table_name="subscriptions")
+    op.drop_column("provisioning_jobs", "server")
+    op.drop_column("subscriptions", "server")
@@ -0,0 +1,50 @@
+"""add time-bucketed traffic stats
+
+Revision ID: 005_traffic_stats
+Revises: 004_subscription_server
+Create Date: 2026-10-19 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "005_traffic_stats"
+down_revision = "004_subscription_server"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "traffic_counters",
+        sa.Column("server", sa.Text(), nullable=False),
+        sa.Column("email", sa.Text(), nullable=False),
+        sa.Column("up_bytes", sa.BigInteger(), nullable=False),
+        sa.Column("down_bytes", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.text("NOW()"),
+        ),
+        sa.PrimaryKeyConstraint("server", "email"),
+    )
+    op.create_table(
+        "traffic_stats",
+        sa.Column("bucket", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("server", sa.Text(), nullable=False),
+        sa.Column("email", sa.Text(), nullable=False),
+        sa.Column("up_bytes", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("down_bytes", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("last_online", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("bucket", "server", "email"),
+    )
+    op.create_index(
+        "ix_traffic_stats_email_bucket", "traffic_stats", ["email", "bucket"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_traffic_stats_email_bucket", table_name="traffic_stats")
+    op.drop_table("traffic_stats")
+    op.drop_table("traffic_counters")
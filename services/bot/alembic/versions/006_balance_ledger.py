@@ -0,0 +1,56 @@
+"""add append-only balance ledger and snapshots
+
+Revision ID: 006_balance_ledger
+Revises: 005_traffic_stats
+Create Date: 2026-10-19 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "006_balance_ledger"
+down_revision = "005_traffic_stats"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "balance_ledger",
+        sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=True),
+        sa.Column("tg_id", sa.BigInteger(), nullable=False),
+        sa.Column("delta", sa.Integer(), nullable=False),
+        sa.Column("balance_after", sa.Integer(), nullable=False),
+        sa.Column("reason", sa.Text(), nullable=False),
+        sa.Column("idempotency_key", sa.Text(), nullable=True, unique=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.text("NOW()"),
+        ),
+    )
+    op.create_index("ix_balance_ledger_tg_id_id", "balance_ledger", ["tg_id", "id"])
+    op.create_table(
+        "balance_snapshots",
+        sa.Column("tg_id", sa.BigInteger(), nullable=False),
+        sa.Column("snapshot_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("balance", sa.Integer(), nullable=False),
+        sa.Column("last_ledger_id", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("tg_id", "snapshot_at"),
+    )
+    # Opening entry so that every balance is explained by the ledger.
+    op.execute(
+        """
+        INSERT INTO balance_ledger (tg_id, delta, balance_after, reason)
+        SELECT tg_id, balance, balance, 'opening'
+        FROM users
+        WHERE balance <> 0
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("balance_snapshots")
+    op.drop_index("ix_balance_ledger_tg_id_id", table_name="balance_ledger")
+    op.drop_table("balance_ledger")
@@ -0,0 +1,52 @@
+"""add payment invoices for Stars and CryptoBot top-ups
+
+Revision ID: 007_payment_invoices
+Revises: 006_balance_ledger
+Create Date: 2026-10-19 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "007_payment_invoices"
+down_revision = "006_balance_ledger"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "payment_invoices",
+        sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=True),
+        sa.Column("provider", sa.Text(), nullable=False),
+        sa.Column("external_id", sa.Text(), nullable=False),
+        sa.Column("tg_id", sa.BigInteger(), nullable=False),
+        sa.Column("amount", sa.Integer(), nullable=False),
+        sa.Column("status", sa.Text(), nullable=False, server_default="pending"),
+        sa.Column("pay_url", sa.Text()),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.text("NOW()"),
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.text("NOW()"),
+        ),
+        sa.Column("paid_at", sa.DateTime(timezone=True)),
+        sa.UniqueConstraint("provider", "external_id"),
+    )
+    op.create_index(
+        "ix_payment_invoices_pending",
+        "payment_invoices",
+        ["provider", "id"],
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_payment_invoices_pending", table_name="payment_invoices")
+    op.drop_table("payment_invoices")
@@ -0,0 +1,52 @@
+"""add monthly partitioned subscription history
+
+Revision ID: 008_subscription_history
+Revises: 007_payment_invoices
+Create Date: 2026-10-19 00:00:00.000000
+"""
+
+from alembic import op
+
+revision = "008_subscription_history"
+down_revision = "007_payment_invoices"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Partitioned by archive month so old history is dropped with DROP TABLE
+    # instead of a DELETE. Monthly partitions are created ahead by the bot's
+    # archive job; the default partition only catches rows outside them.
+    op.execute(
+        """
+        CREATE TABLE subscription_history (
+            subscription_id BIGINT NOT NULL,
+            tg_id BIGINT NOT NULL,
+            start_at TIMESTAMPTZ,
+            end_at TIMESTAMPTZ,
+            subscription_link TEXT,
+            instructions TEXT,
+            country TEXT,
+            server TEXT,
+            reason TEXT NOT NULL,
+            archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        ) PARTITION BY RANGE (archived_at)
+        """
+    )
+    op.execute(
+        "CREATE TABLE subscription_history_default "
+        "PARTITION OF subscription_history DEFAULT"
+    )
+    op.execute(
+        "CREATE INDEX ix_subscription_history_tg_id "
+        "ON subscription_history (tg_id, archived_at)"
+    )
+    op.execute(
+        "CREATE INDEX ix_subscriptions_end_at ON subscriptions (end_at) "
+        "WHERE end_at IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_subscriptions_end_at")
+    op.execute("DROP TABLE subscription_history")
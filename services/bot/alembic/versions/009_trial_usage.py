@@ -0,0 +1,38 @@
+"""record trial usage on users
+
+Revision ID: 009_trial_usage
+Revises: 008_subscription_history
+Create Date: 2026-10-19 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "009_trial_usage"
+down_revision = "008_subscription_history"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "users", sa.Column("trial_used_at", sa.DateTime(timezone=True), nullable=True)
+    )
+    # Trials granted so far; before this column only the panel knew.
+    op.execute(
+        """
+        UPDATE users u
+        SET trial_used_at = j.first_at
+        FROM (
+            SELECT tg_id, MIN(updated_at) AS first_at
+            FROM provisioning_jobs
+            WHERE kind = 'trial' AND status = 'done'
+            GROUP BY tg_id
+        ) j
+        WHERE u.tg_id = j.tg_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("users", "trial_used_at")
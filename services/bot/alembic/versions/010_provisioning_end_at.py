@@ -0,0 +1,25 @@
+"""remember the expiry a provisioning job extends a client to
+
+Revision ID: 010_provisioning_end_at
+Revises: 009_trial_usage
+Create Date: 2026-10-19 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "010_provisioning_end_at"
+down_revision = "009_trial_usage"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "provisioning_jobs",
+        sa.Column("end_at", sa.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("provisioning_jobs", "end_at")
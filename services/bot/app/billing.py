@@ -0,0 +1,139 @@
+"""Balance top-ups through Telegram Stars and CryptoBot invoices.
+
+Stars are settled by the ``successful_payment`` update itself. CryptoBot
+invoices are settled by one background reconciler that checks every pending
+invoice with a single ``getInvoices`` call per batch, instead of each user's
+session polling its own invoice.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+from uuid import uuid4
+
+from aiogram import Bot
+from aiogram.types import LabeledPrice
+
+from app.config import PaymentSettings, get_payment_settings
+from app.keyboards.menu import main_menu_keyboard
+from app.outbound import TRANSACTIONAL, send_priority
+from app.services.cryptobot import CryptoBotClient
+from app.storage import (
+    create_invoice,
+    expire_invoices,
+    fetch_pending_invoices,
+    settle_invoice,
+)
+from app.tracing import start_trace
+
+logger = logging.getLogger(__name__)
+
+STARS = "stars"
+CRYPTOBOT = "cryptobot"
+TOPUP_AMOUNTS = (150, 300, 500)
+RECONCILE_BATCH = 100
+
+_STARS_PAYLOAD_PREFIX = "topup:"
+
+
+def stars_price(amount: int, settings: PaymentSettings) -> int:
+    return max(math.ceil(amount / settings.stars_rub_price), 1)
+
+
+def parse_stars_payload(payload: str) -> str | None:
+    if not payload.startswith(_STARS_PAYLOAD_PREFIX):
+        return None
+    return payload[len(_STARS_PAYLOAD_PREFIX) :] or None
+
+
+async def send_stars_invoice(bot: Bot, tg_id: int, amount: int) -> None:
+    price = stars_price(amount, get_payment_settings())
+    invoice_id = uuid4().hex
+    create_invoice(STARS, invoice_id, tg_id, amount)
+    await bot.send_invoice(
+        tg_id,
+        title="Пополнение баланса",
+        description=f"Пополнение баланса на {amount} ₽",
+        payload=f"{_STARS_PAYLOAD_PREFIX}{invoice_id}",
+        provider_token="",
+        currency="XTR",
+        prices=[LabeledPrice(label=f"{amount} ₽", amount=price)],
+    )
+
+
+async def create_cryptobot_invoice(tg_id: int, amount: int) -> str:
+    """Create a CryptoBot invoice and return its payment URL."""
+    settings = get_payment_settings()
+    client = CryptoBotClient.from_settings(settings)
+    try:
+        invoice = await client.create_invoice(
+            amount,
+            f"Пополнение баланса на {amount} ₽",
+            payload=f"{tg_id}:{amount}",
+            expires_in=settings.invoice_ttl_seconds,
+        )
+    finally:
+        await client.close()
+    pay_url = invoice.get("bot_invoice_url") or invoice.get("pay_url")
+    create_invoice(CRYPTOBOT, str(invoice["invoice_id"]), tg_id, amount, pay_url)
+    return pay_url
+
+
+async def notify_credited(bot: Bot, settled: dict) -> None:
+    try:
+        await bot.send_message(
+            settled["tg_id"],
+            f"✅ Баланс пополнен на {settled['amount']} ₽. "
+            f"Текущий баланс: {settled['balance']} ₽",
+            reply_markup=main_menu_keyboard(),
+        )
+    except Exception:
+        logger.exception("Top-up notice failed for tg_id=%s", settled["tg_id"])
+
+
+async def reconcile_cryptobot(bot: Bot, client: CryptoBotClient) -> int:
+    """Settle paid and expire stale CryptoBot invoices; returns the paid count."""
+    paid = 0
+    after_id = 0
+    while True:
+        pending = fetch_pending_invoices(CRYPTOBOT, RECONCILE_BATCH, after_id)
+        if not pending:
+            break
+        after_id = pending[-1]["id"]
+        items = await client.get_invoices([row["external_id"] for row in pending])
+        expired: list[str] = []
+        for item in items:
+            external_id = str(item["invoice_id"])
+            if item.get("status") == "paid":
+                settled = settle_invoice(CRYPTOBOT, external_id)
+                if settled is not None:
+                    paid += 1
+                    await notify_credited(bot, settled)
+            elif item.get("status") == "expired":
+                expired.append(external_id)
+        if expired:
+            expire_invoices(CRYPTOBOT, expired)
+        if len(pending) < RECONCILE_BATCH:
+            break
+    return paid
+
+
+async def run_invoice_reconciler(bot: Bot) -> None:
+    settings = get_payment_settings()
+    if not settings.enabled or not settings.cryptobot_token:
+        return
+    client = CryptoBotClient.from_settings(settings)
+    try:
+        while True:
+            try:
+                with start_trace("billing.reconcile"), send_priority(TRANSACTIONAL):
+                    paid = await reconcile_cryptobot(bot, client)
+                if paid:
+                    logger.info("CryptoBot reconciler credited %s invoices", paid)
+            except Exception:
+                logger.exception("CryptoBot reconciliation failed")
+            await asyncio.sleep(settings.reconcile_seconds)
+    finally:
+        await client.close()
@@ -2,10 +2,11 @@ import asyncio
 import logging
 import sys
 
-from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 
 from app.config import get_bot_token
+from app.main import create_bot
+from app.outbound import BROADCAST, send_priority
 from app.storage import fetch_all_user_ids
 
 
@@ -15,14 +16,15 @@ async def main() -> int:
         print('Usage: python -m app.broadcast "your message"')
         return 1
 
-    bot = Bot(token=get_bot_token())
+    bot = create_bot(get_bot_token())
     success = 0
     blocked = 0
     failed = 0
 
     for tg_id in fetch_all_user_ids():
         try:
-            await bot.send_message(tg_id, message)
+            with send_priority(BROADCAST):
+                await bot.send_message(tg_id, message)
             success += 1
         except TelegramForbiddenError:
             blocked += 1
@@ -30,7 +32,6 @@ async def main() -> int:
             failed += 1
         except Exception:
             failed += 1
-        await asyncio.sleep(0.05)
 
     await bot.session.close()
     logging.info(
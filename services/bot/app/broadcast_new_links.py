@@ -1,15 +1,16 @@
 import asyncio
 import logging
 
-from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 
 from app.config import get_bot_token
+from app.main import create_bot
+from app.outbound import BROADCAST, send_priority
 from app.storage import fetch_users_with_subscription_links
 
 
 async def main() -> int:
-    bot = Bot(token=get_bot_token())
+    bot = create_bot(get_bot_token())
     success = 0
     blocked = 0
     failed = 0
@@ -24,7 +25,8 @@ async def main() -> int:
             f"{link}"
         )
         try:
-            await bot.send_message(tg_id, text)
+            with send_priority(BROADCAST):
+                await bot.send_message(tg_id, text)
             success += 1
         except TelegramForbiddenError:
             blocked += 1
@@ -32,7 +34,6 @@ async def main() -> int:
             failed += 1
         except Exception:
             failed += 1
-        await asyncio.sleep(0.05)
 
     await bot.session.close()
     logging.info(
@@ -0,0 +1,109 @@
+"""Refill the ``subscription:{tg_id}`` cache from Postgres.
+
+After a Redis restart or eviction every key is cold and the first wave of
+users would all fall through to Postgres at once. The warm-up streams active
+subscriptions with a server-side cursor and writes them in pipelined chunks,
+paced to ``rows_per_second`` so it never competes with live traffic for the
+database. The bot runs it at startup; it can also be run on demand::
+
+    PYTHONPATH=. python -m app.cache_warmup
+    PYTHONPATH=. python -m app.cache_warmup --rows-per-second 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, replace
+
+import psycopg2
+import redis
+
+from app import metrics
+from app.config import CacheWarmupSettings, get_cache_warmup_settings
+from app.storage import prime_subscription_cache, stream_active_subscriptions
+from app.tracing import start_trace
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_SECONDS = 5.0
+
+
+@dataclass
+class WarmupReport:
+    rows: int = 0
+    written: int = 0
+    seconds: float = 0.0
+
+
+def warm_subscription_cache(settings: CacheWarmupSettings) -> WarmupReport:
+    report = WarmupReport()
+    started = time.perf_counter()
+    logged = started
+    for rows in stream_active_subscriptions(settings.chunk_size):
+        report.written += prime_subscription_cache(rows)
+        report.rows += len(rows)
+        metrics.set_gauge("cache_warmup_rows", report.rows)
+        now = time.perf_counter()
+        if now - logged >= PROGRESS_SECONDS:
+            logged = now
+            logger.info(
+                "Cache warm-up: %s rows read, %s keys written, %.1fs",
+                report.rows,
+                report.written,
+                now - started,
+            )
+        if settings.rows_per_second > 0:
+            ahead = report.rows / settings.rows_per_second - (now - started)
+            if ahead > 0:
+                time.sleep(ahead)
+    report.seconds = time.perf_counter() - started
+    metrics.inc("cache_warmup_keys_total", report.written)
+    metrics.observe("cache_warmup_seconds", report.seconds)
+    logger.info(
+        "Cache warm-up done: %s rows read, %s keys written in %.2fs",
+        report.rows,
+        report.written,
+        report.seconds,
+    )
+    return report
+
+
+async def run_cache_warmup() -> WarmupReport | None:
+    """Startup hook; a failed warm-up only logs, the cache fills on demand."""
+    settings = get_cache_warmup_settings()
+    if not settings.on_start:
+        return None
+    try:
+        with start_trace("cache.warmup"):
+            return await asyncio.to_thread(warm_subscription_cache, settings)
+    except (psycopg2.Error, redis.RedisError):
+        logger.warning("Cache warm-up aborted", exc_info=True)
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunk-size", type=int, help="rows per cursor fetch")
+    parser.add_argument(
+        "--rows-per-second", type=float, help="read pace, 0 for no limit"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    settings = get_cache_warmup_settings()
+    if args.chunk_size:
+        settings = replace(settings, chunk_size=args.chunk_size)
+    if args.rows_per_second is not None:
+        settings = replace(settings, rows_per_second=args.rows_per_second)
+    report = warm_subscription_cache(settings)
+    print(
+        f"Cache warm-up done. rows={report.rows} written={report.written} "
+        f"seconds={report.seconds:.2f}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
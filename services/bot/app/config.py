@@ -32,6 +32,11 @@ class XuiSettings:
     inbound_id: int
     sub_url: str | None
     country: str = "fi"
+    name: str = ""
+    capacity: int = 30
+    # Set when the panel runs on this host: provision through its SQLite file.
+    db_path: str | None = None
+    reload_command: str | None = None
 
 
 def get_bot_token() -> str:
@@ -42,11 +47,54 @@ def get_database_url() -> str:
     return _require("DATABASE_URL")
 
 
+@dataclass(frozen=True)
+class ReplicaSettings:
+    urls: tuple[str, ...] = ()
+    max_lag_seconds: float = 5.0
+    check_seconds: float = 5.0
+    sticky_seconds: float = 10.0
+
+
+def get_replica_settings() -> ReplicaSettings:
+    load_env()
+    raw = os.getenv("DATABASE_REPLICA_URLS", "")
+    return ReplicaSettings(
+        urls=tuple(url.strip() for url in raw.split(",") if url.strip()),
+        max_lag_seconds=float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5")),
+        check_seconds=float(os.getenv("REPLICA_CHECK_SECONDS", "5")),
+        sticky_seconds=float(os.getenv("REPLICA_STICKY_SECONDS", "10")),
+    )
+
+
 def get_redis_url() -> str:
     load_env()
     return os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
 
+def get_startup_profile() -> bool:
+    load_env()
+    return os.getenv("STARTUP_PROFILE", "").lower() in {"1", "true", "yes"}
+
+
+@dataclass(frozen=True)
+class LoopMonitorSettings:
+    interval_seconds: float = 0.1
+    block_threshold_seconds: float = 0.0
+
+
+def get_loop_monitor_settings() -> LoopMonitorSettings:
+    load_env()
+    return LoopMonitorSettings(
+        interval_seconds=float(os.getenv("LOOP_LAG_INTERVAL_MS", "100")) / 1000,
+        block_threshold_seconds=float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "0")) / 1000,
+    )
+
+
+def get_preflight_timeout() -> float:
+    load_env()
+    return float(os.getenv("PREFLIGHT_TIMEOUT", "10"))
+
+
 def get_xui_settings(country: str = "nl") -> XuiSettings:
     load_env()
     prefix = "NL_" if country == "nl" else ""
@@ -62,6 +110,329 @@ def get_xui_settings(country: str = "nl") -> XuiSettings:
         inbound_id=inbound_id,
         sub_url=sub_url,
         country=country,
+        name=country,
+        db_path=os.getenv(f"{prefix}XUI_DB_PATH") or None,
+        reload_command=os.getenv(f"{prefix}XUI_RELOAD_COMMAND") or None,
+    )
+
+
+def get_xui_local_reload_delay() -> float:
+    """Seconds to batch local panel writes into one xray reload."""
+    load_env()
+    return float(os.getenv("XUI_LOCAL_RELOAD_DELAY_SECONDS", "1"))
+
+
+def get_xui_local_busy_timeout() -> float:
+    load_env()
+    return float(os.getenv("XUI_LOCAL_BUSY_TIMEOUT_SECONDS", "5"))
+
+
+def get_xui_pool() -> list[XuiSettings]:
+    """Every configured panel inbound, from the ``XUI_SERVERS`` prefix list.
+
+    ``XUI_SERVERS=NL,NL2`` reads ``NL_XUI_*`` and ``NL2_XUI_*``; an inbound id
+    list such as ``NL2_XUI_INBOUND_ID=1,2`` yields one server per inbound.
+    Without ``XUI_SERVERS`` the pool is the single legacy ``NL_`` panel.
+    """
+    load_env()
+    prefixes = [item.strip() for item in os.getenv("XUI_SERVERS", "").split(",")]
+    prefixes = [item for item in prefixes if item]
+    if not prefixes:
+        try:
+            return [get_xui_settings("nl")]
+        except RuntimeError:
+            return []
+    servers = []
+    for prefix in prefixes:
+        env = f"{prefix.upper()}_XUI_"
+        inbound_ids = [int(item) for item in _require(f"{env}INBOUND_ID").split(",")]
+        for inbound_id in inbound_ids:
+            name = prefix.lower()
+            if len(inbound_ids) > 1:
+                name = f"{name}:{inbound_id}"
+            servers.append(
+                XuiSettings(
+                    base_url=_require(f"{env}URL"),
+                    username=_require(f"{env}USERNAME"),
+                    password=_require(f"{env}PASSWORD"),
+                    inbound_id=inbound_id,
+                    sub_url=os.getenv(f"{env}SUB_URL"),
+                    country=os.getenv(f"{env}COUNTRY", prefix).lower(),
+                    name=name,
+                    capacity=int(os.getenv(f"{env}CAPACITY", "30")),
+                    db_path=os.getenv(f"{env}DB_PATH") or None,
+                    reload_command=os.getenv(f"{env}RELOAD_COMMAND") or None,
+                )
+            )
+    return servers
+
+
+def get_pool_countries() -> list[str]:
+    countries: list[str] = []
+    for server in get_xui_pool():
+        if server.country not in countries:
+            countries.append(server.country)
+    return countries
+
+
+def get_server_settings(name: str | None, country: str = "nl") -> XuiSettings:
+    """Settings for a named pool server, falling back to the country's first one."""
+    pool = get_xui_pool()
+    for server in pool:
+        if name and server.name == name:
+            return server
+    for server in pool:
+        if server.country == country:
+            return server
+    return get_xui_settings(country)
+
+
+@dataclass(frozen=True)
+class ProvisioningSettings:
+    workers: int
+    poll_interval: float
+    max_attempts: int
+    retry_base_seconds: float
+    retry_max_seconds: float
+
+
+def get_provisioning_settings() -> ProvisioningSettings:
+    load_env()
+    return ProvisioningSettings(
+        workers=int(os.getenv("PROVISIONING_WORKERS", "2")),
+        poll_interval=float(os.getenv("PROVISIONING_POLL_INTERVAL", "2")),
+        max_attempts=int(os.getenv("PROVISIONING_MAX_ATTEMPTS", "6")),
+        retry_base_seconds=float(os.getenv("PROVISIONING_RETRY_BASE_SECONDS", "5")),
+        retry_max_seconds=float(os.getenv("PROVISIONING_RETRY_MAX_SECONDS", "300")),
+    )
+
+
+@dataclass(frozen=True)
+class NotifySettings:
+    batch_size: int = 50
+    interval_seconds: float = 5.0
+    replan_hours: int = 24
+
+
+def get_notify_settings() -> NotifySettings:
+    load_env()
+    return NotifySettings(
+        batch_size=int(os.getenv("NOTIFY_BATCH_SIZE", "50")),
+        interval_seconds=float(os.getenv("NOTIFY_INTERVAL_SECONDS", "5")),
+        replan_hours=int(os.getenv("NOTIFY_REPLAN_HOURS", "24")),
+    )
+
+
+@dataclass(frozen=True)
+class CacheWarmupSettings:
+    on_start: bool = True
+    chunk_size: int = 1000
+    rows_per_second: float = 5000.0
+
+
+def get_cache_warmup_settings() -> CacheWarmupSettings:
+    load_env()
+    return CacheWarmupSettings(
+        on_start=os.getenv("CACHE_WARMUP_ON_START", "true").lower()
+        in {"1", "true", "yes"},
+        chunk_size=max(int(os.getenv("CACHE_WARMUP_CHUNK", "1000")), 1),
+        rows_per_second=float(os.getenv("CACHE_WARMUP_ROWS_PER_SECOND", "5000")),
+    )
+
+
+@dataclass(frozen=True)
+class ArchiveSettings:
+    grace_hours: int = 24
+    batch_size: int = 1000
+    pause_seconds: float = 0.1
+    retention_months: int = 24
+
+
+def get_archive_settings() -> ArchiveSettings:
+    load_env()
+    return ArchiveSettings(
+        grace_hours=int(os.getenv("SUBSCRIPTION_PURGE_GRACE_HOURS", "24")),
+        batch_size=int(os.getenv("SUBSCRIPTION_ARCHIVE_BATCH", "1000")),
+        pause_seconds=float(os.getenv("SUBSCRIPTION_ARCHIVE_PAUSE_SECONDS", "0.1")),
+        retention_months=int(os.getenv("SUBSCRIPTION_HISTORY_MONTHS", "24")),
+    )
+
+
+@dataclass(frozen=True)
+class BreakerSettings:
+    failure_threshold: int = 5
+    slow_call_seconds: float = 3.0
+    cooldown_seconds: float = 30.0
+    half_open_probes: int = 1
+
+
+def get_xui_breaker_settings() -> BreakerSettings:
+    load_env()
+    return BreakerSettings(
+        failure_threshold=int(os.getenv("XUI_BREAKER_FAILURES", "5")),
+        slow_call_seconds=float(os.getenv("XUI_BREAKER_SLOW_SECONDS", "3")),
+        cooldown_seconds=float(os.getenv("XUI_BREAKER_COOLDOWN_SECONDS", "30")),
+        half_open_probes=int(os.getenv("XUI_BREAKER_HALF_OPEN_PROBES", "1")),
+    )
+
+
+@dataclass(frozen=True)
+class RedisSettings:
+    url: str
+    breaker: BreakerSettings
+    max_connections: int = 32
+    socket_timeout: float = 0.5
+    connect_timeout: float = 0.5
+    pool_timeout: float = 1.0
+    retries: int = 1
+
+
+def get_redis_settings() -> RedisSettings:
+    load_env()
+    return RedisSettings(
+        url=get_redis_url(),
+        max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "32")),
+        socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5")),
+        connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", "0.5")),
+        pool_timeout=float(os.getenv("REDIS_POOL_TIMEOUT", "1")),
+        retries=int(os.getenv("REDIS_RETRIES", "1")),
+        breaker=BreakerSettings(
+            failure_threshold=int(os.getenv("REDIS_BREAKER_FAILURES", "5")),
+            slow_call_seconds=float(os.getenv("REDIS_SLOW_SECONDS", "0.5")),
+            cooldown_seconds=float(os.getenv("REDIS_BREAKER_COOLDOWN_SECONDS", "10")),
+        ),
+    )
+
+
+@dataclass(frozen=True)
+class ThrottleSettings:
+    rate_per_second: float = 2.0
+    burst: int = 8
+    duplicate_window_seconds: float = 2.0
+    lock_ttl_seconds: float = 30.0
+    lock_wait_seconds: float = 5.0
+
+
+def get_throttle_settings() -> ThrottleSettings:
+    load_env()
+    return ThrottleSettings(
+        rate_per_second=float(os.getenv("USER_RATE_PER_SECOND", "2")),
+        burst=int(os.getenv("USER_RATE_BURST", "8")),
+        duplicate_window_seconds=float(os.getenv("CALLBACK_DEDUP_SECONDS", "2")),
+        lock_ttl_seconds=float(os.getenv("USER_LOCK_TTL_SECONDS", "30")),
+        lock_wait_seconds=float(os.getenv("USER_LOCK_WAIT_SECONDS", "5")),
+    )
+
+
+@dataclass(frozen=True)
+class SendSettings:
+    rate_per_second: float = 25.0
+    burst: int = 30
+    interactive_reserve: int = 5
+    chat_interval_seconds: float = 1.0
+    retry_attempts: int = 3
+    broadcast_rate_per_second: float = 20.0
+    # Redis key prefix of the bucket shared by every process of one bot;
+    # ``None`` keeps the bucket in process memory.
+    shared_key: str | None = None
+
+
+def get_send_settings() -> SendSettings:
+    load_env()
+    bot_id = os.getenv("BOT_TOKEN", "").split(":", 1)[0]
+    shared = os.getenv("TELEGRAM_SHARED_BUCKET", "true").lower() in {"1", "true", "yes"}
+    return SendSettings(
+        rate_per_second=float(os.getenv("TELEGRAM_RATE_PER_SECOND", "25")),
+        burst=int(os.getenv("TELEGRAM_RATE_BURST", "30")),
+        interactive_reserve=int(os.getenv("TELEGRAM_INTERACTIVE_RESERVE", "5")),
+        chat_interval_seconds=float(os.getenv("TELEGRAM_CHAT_INTERVAL_SECONDS", "1")),
+        retry_attempts=int(os.getenv("TELEGRAM_RETRY_ATTEMPTS", "3")),
+        broadcast_rate_per_second=float(
+            os.getenv("TELEGRAM_BROADCAST_RATE_PER_SECOND", "20")
+        ),
+        shared_key=f"telegram:send:{bot_id}" if shared and bot_id else None,
+    )
+
+
+def get_xui_read_timeout() -> float:
+    load_env()
+    return float(os.getenv("XUI_READ_TIMEOUT", "3"))
+
+
+def get_metrics_port() -> int | None:
+    load_env()
+    value = os.getenv("METRICS_PORT")
+    return int(value) if value else None
+
+
+def get_xui_batch_size() -> int:
+    load_env()
+    return max(int(os.getenv("XUI_BATCH_SIZE", "50")), 1)
+
+
+def get_placement_refresh_seconds() -> int:
+    load_env()
+    return max(int(os.getenv("PLACEMENT_REFRESH_SECONDS", "60")), 5)
+
+
+def get_traffic_sync_seconds() -> int:
+    load_env()
+    return max(int(os.getenv("TRAFFIC_SYNC_SECONDS", "300")), 30)
+
+
+def get_traffic_bucket_minutes() -> int:
+    load_env()
+    return max(int(os.getenv("TRAFFIC_BUCKET_MINUTES", "60")), 1)
+
+
+@dataclass(frozen=True)
+class ReconcileSettings:
+    interval_seconds: int = 900
+    batch_size: int = 500
+    disable_expired: bool = True
+    remove_after_days: int = 0
+    max_panel_writes: int = 200
+
+
+def get_reconcile_settings() -> ReconcileSettings:
+    """Panel/DB reconciliation; ``remove_after_days=0`` never deletes clients."""
+    load_env()
+    return ReconcileSettings(
+        interval_seconds=max(int(os.getenv("RECONCILE_INTERVAL_SECONDS", "900")), 60),
+        batch_size=int(os.getenv("RECONCILE_BATCH_SIZE", "500")),
+        disable_expired=os.getenv("RECONCILE_DISABLE_EXPIRED", "true").lower()
+        in {"1", "true", "yes"},
+        remove_after_days=int(os.getenv("RECONCILE_REMOVE_AFTER_DAYS", "0")),
+        max_panel_writes=int(os.getenv("RECONCILE_MAX_PANEL_WRITES", "200")),
+    )
+
+
+def get_balance_snapshot_hours() -> int:
+    load_env()
+    return max(int(os.getenv("BALANCE_SNAPSHOT_HOURS", "24")), 1)
+
+
+@dataclass(frozen=True)
+class PaymentSettings:
+    enabled: bool
+    cryptobot_token: str | None
+    cryptobot_api_url: str
+    stars_rub_price: float
+    invoice_ttl_seconds: int
+    reconcile_seconds: float
+
+
+def get_payment_settings() -> PaymentSettings:
+    load_env()
+    return PaymentSettings(
+        enabled=os.getenv("PAYMENTS_ENABLED", "false").lower() in {"1", "true", "yes"},
+        cryptobot_token=os.getenv("CRYPTOBOT_TOKEN") or None,
+        cryptobot_api_url=os.getenv(
+            "CRYPTOBOT_API_URL", "https://pay.crypt.bot/api"
+        ).rstrip("/"),
+        stars_rub_price=float(os.getenv("STARS_RUB_PRICE", "1.5")),
+        invoice_ttl_seconds=int(os.getenv("INVOICE_TTL_SECONDS", "3600")),
+        reconcile_seconds=float(os.getenv("CRYPTOBOT_RECONCILE_SECONDS", "10")),
     )
 
 
@@ -69,3 +440,28 @@ def get_miniapp_url() -> str:
     load_env()
     value = os.getenv("MINIAPP_URL", "http://localhost:8010")
     return value.rstrip("/")
+
+
+@dataclass(frozen=True)
+class TraceSettings:
+    exporter: str | None
+    file_path: str
+    otlp_endpoint: str
+    slow_update_ms: float
+    service_name: str = "nyx-bot"
+
+
+def get_trace_settings() -> TraceSettings:
+    load_env()
+    exporter = os.getenv("TRACE_EXPORTER", "").strip().lower() or None
+    if exporter not in {None, "jsonl", "otlp"}:
+        raise RuntimeError("TRACE_EXPORTER must be one of: jsonl, otlp")
+    return TraceSettings(
+        exporter=exporter,
+        file_path=os.getenv("TRACE_FILE", "traces.jsonl"),
+        otlp_endpoint=os.getenv(
+            "OTLP_TRACES_ENDPOINT", "http://localhost:4318/v1/traces"
+        ),
+        slow_update_ms=float(os.getenv("TRACE_SLOW_UPDATE_MS", "2000")),
+        service_name=os.getenv("TRACE_SERVICE_NAME", "nyx-bot"),
+    )
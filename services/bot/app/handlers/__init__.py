@@ -1,3 +1,11 @@
-from app.handlers import payments, start, subscription
+import importlib
 
 __all__ = ["start", "subscription", "payments"]
+
+
+def __getattr__(name: str):
+    # Submodules are imported on first access so that importing one handler
+    # module does not pull in the others.
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,7 +1,32 @@
-from aiogram import Router, F
-from aiogram.types import CallbackQuery
+import logging
+
+import httpx
+from aiogram import F, Router
+from aiogram.types import CallbackQuery, Message, PreCheckoutQuery
+
+from app.billing import (
+    STARS,
+    TOPUP_AMOUNTS,
+    create_cryptobot_invoice,
+    notify_credited,
+    parse_stars_payload,
+    send_stars_invoice,
+)
+from app.config import get_payment_settings
+from app.keyboards.menu import invoice_keyboard
+from app.storage import INVOICE_PAID, ensure_user, get_invoice, settle_invoice
 
 router = Router()
+logger = logging.getLogger(__name__)
+
+UNAVAILABLE_TEXT = "⚠️ Пополнение этим способом временно недоступно."
+
+
+def _topup_amount(data: str) -> int | None:
+    value = data.rsplit(":", 1)[-1]
+    if not value.isdigit() or int(value) not in TOPUP_AMOUNTS:
+        return None
+    return int(value)
 
 
 @router.callback_query(F.data.startswith("plan:"))
@@ -23,11 +48,69 @@ async def pay_balance_plan(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(
-    F.data.startswith("pay:stars:") | F.data.startswith("pay:crypto:")
-)
-async def pay(callback: CallbackQuery):
+@router.callback_query(F.data.startswith("pay:stars:"))
+async def pay_stars(callback: CallbackQuery):
+    amount = _topup_amount(callback.data)
+    if amount is None or not get_payment_settings().enabled:
+        await callback.message.answer(UNAVAILABLE_TEXT)
+        await callback.answer()
+        return
+    ensure_user(callback.from_user.id, callback.from_user.username)
+    await send_stars_invoice(callback.bot, callback.from_user.id, amount)
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("pay:crypto:"))
+async def pay_crypto(callback: CallbackQuery):
+    settings = get_payment_settings()
+    amount = _topup_amount(callback.data)
+    if amount is None or not settings.enabled or not settings.cryptobot_token:
+        await callback.message.answer(UNAVAILABLE_TEXT)
+        await callback.answer()
+        return
+    ensure_user(callback.from_user.id, callback.from_user.username)
+    try:
+        pay_url = await create_cryptobot_invoice(callback.from_user.id, amount)
+    except (httpx.HTTPError, RuntimeError):
+        logger.exception("CryptoBot invoice failed for tg_id=%s", callback.from_user.id)
+        await callback.message.answer("⚠️ Не удалось создать счет. Попробуйте позже.")
+        await callback.answer()
+        return
     await callback.message.answer(
-        "⚠️ Оплата Stars/Crypto временно недоступна. Доступна только оплата с баланса."
+        f"💎 Счет на {amount} ₽ создан. После оплаты баланс пополнится автоматически.",
+        reply_markup=invoice_keyboard(pay_url),
     )
     await callback.answer()
+
+
+@router.pre_checkout_query()
+async def pre_checkout(query: PreCheckoutQuery):
+    invoice_id = parse_stars_payload(query.invoice_payload)
+    invoice = get_invoice(STARS, invoice_id) if invoice_id else None
+    if (
+        invoice is None
+        or invoice["tg_id"] != query.from_user.id
+        or invoice["status"] == INVOICE_PAID
+        or query.currency != "XTR"
+    ):
+        await query.answer(ok=False, error_message="Счет недействителен, создайте новый.")
+        return
+    await query.answer(ok=True)
+
+
+@router.message(F.successful_payment)
+async def successful_payment(message: Message):
+    payment = message.successful_payment
+    invoice_id = parse_stars_payload(payment.invoice_payload)
+    if payment.currency != "XTR" or invoice_id is None:
+        logger.warning("Unexpected payment payload=%s", payment.invoice_payload)
+        return
+    settled = settle_invoice(STARS, invoice_id)
+    if settled is None:
+        logger.info(
+            "Stars invoice %s already settled, charge=%s",
+            invoice_id,
+            payment.telegram_payment_charge_id,
+        )
+        return
+    await notify_credited(message.bot, settled)
@@ -1,8 +1,10 @@
+import asyncio
 import logging
 import logging
 from pathlib import Path
 
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
+from uuid import uuid4
 
 from aiogram import F, Router
 from aiogram.filters import Command, CommandStart
@@ -20,24 +22,34 @@ from app.keyboards.menu import (
     setup_keyboard,
     tariffs_keyboard,
 )
-import httpx
-
-from app.services.xui_client import XuiClient
+from app import metrics
+from app.provisioning import wake_workers
+from app.services.placement import choose_server
+from app.services.reconcile import is_panel_reconciled
+from app.services.xui_client import XuiClient, create_xui_client
 from app.storage import (
-    add_balance,
+    JOB_DUPLICATE,
+    JOB_INSUFFICIENT_FUNDS,
+    JOB_QUEUED,
     clear_subscription,
-    deduct_balance,
+    enqueue_provisioning_job,
     ensure_user,
     get_referral_info,
     get_subscription,
     get_subscription_meta,
     get_vpn_data,
-    record_first_payment,
+    has_used_trial,
     set_referrer,
-    set_subscription,
 )
 from app.vpn_instructions import vpn_instructions
-from app.config import get_miniapp_url, get_xui_settings
+from app.billing import TOPUP_AMOUNTS
+from app.config import (
+    get_miniapp_url,
+    get_payment_settings,
+    get_pool_countries,
+    get_server_settings,
+    get_xui_read_timeout,
+)
 from app.services.xui_db import get_subscription_link
 
 router = Router()
@@ -248,7 +260,12 @@ async def connect_tariff(callback: CallbackQuery):
 @router.callback_query(F.data == "tariff:trial")
 async def trial_tariff(callback: CallbackQuery):
     ensure_user(callback.from_user.id, callback.from_user.username)
-    _, _, xui_end_at = await _fetch_xui_subscription(callback.from_user, "nl")
+    server = choose_server("nl", callback.from_user.id)
+    # Always ask the panel here: a client created on the panel alone (not in
+    # the DB) must still block a second trial.
+    _, _, xui_end_at = await _fetch_xui_subscription(
+        callback.from_user, "nl", server.name, trust_reconcile=False
+    )
     end_at = xui_end_at
     if not end_at:
         _, end_at = get_subscription(callback.from_user.id)
@@ -260,135 +277,66 @@ async def trial_tariff(callback: CallbackQuery):
         )
         await callback.answer()
         return
-
-    username = callback.from_user.username or f"tg_{callback.from_user.id}"
-    email = f"@{username}"
-    xui = XuiClient.from_settings(get_xui_settings("nl"))
-    try:
-        await xui.login()
-        sub_id = await xui.add_client(email=email, days=TRIAL_DAYS)
-        sub_link = xui.subscription_link(sub_id)
-    except httpx.TimeoutException:
+    if xui_end_at is not None or has_used_trial(callback.from_user.id):
         await callback.message.answer(
-            "⚠️ Сервис подписок временно недоступен. Попробуйте чуть позже.",
+            "🎁 Пробный период уже использован. Выберите тариф, чтобы продлить доступ.",
             reply_markup=main_menu_keyboard(),
         )
         await callback.answer()
         return
-    except RuntimeError:
-        await callback.answer()
-        return
-    finally:
-        await xui.close()
-
-    instructions = vpn_instructions(sub_link)
-    link_image = Path(__file__).resolve().parents[2] / "img" / "link.png"
-    try:
-        if link_image.exists():
-            await callback.bot.send_photo(
-                callback.from_user.id,
-                FSInputFile(str(link_image)),
-                caption=instructions,
-                reply_markup=main_menu_keyboard(),
-            )
-        else:
-            await callback.bot.send_message(
-                callback.from_user.id,
-                instructions,
-                reply_markup=main_menu_keyboard(),
-                disable_web_page_preview=True,
-            )
-    except Exception:
-        logger.exception("Trial send failed for tg_id=%s", callback.from_user.id)
 
-    start_at = datetime.now(timezone.utc)
-    end_at = start_at + timedelta(days=TRIAL_DAYS)
-    set_subscription(
+    status = enqueue_provisioning_job(
+        f"trial:{callback.from_user.id}",
         callback.from_user.id,
-        start_at,
-        end_at,
-        sub_link,
-        instructions,
-        "nl",
-    )
-    await callback.message.answer(
-        "🎉 Пробный период на 3 дня активирован.",
-        reply_markup=main_menu_keyboard(),
+        "trial",
+        server.country,
+        _email_for_user(callback.from_user),
+        TRIAL_DAYS,
+        uuid4().hex,
+        server=server.name,
     )
+    if status == JOB_QUEUED:
+        wake_workers()
+        await callback.message.answer(
+            "⏳ Активируем пробный доступ, ссылка придет через несколько секунд.",
+            reply_markup=main_menu_keyboard(),
+        )
+    elif status == JOB_DUPLICATE:
+        await callback.answer("Пробный доступ уже активируется.")
+        return
     await callback.answer()
 
 
 @router.callback_query(F.data.startswith("pay:balance:"))
 async def pay_handler(callback: CallbackQuery):
     country = callback.data.split(":", 2)[2]
-    if country not in {"nl"}:
+    if country not in get_pool_countries():
         await callback.answer()
         return
     ensure_user(callback.from_user.id, callback.from_user.username)
-    if not deduct_balance(callback.from_user.id, TARIFF_PRICE):
+    server = choose_server(country, callback.from_user.id)
+    status = enqueue_provisioning_job(
+        f"paid:{callback.from_user.id}:{callback.message.message_id}",
+        callback.from_user.id,
+        "paid",
+        country,
+        _email_for_user(callback.from_user),
+        TARIFF_DAYS,
+        uuid4().hex,
+        amount=TARIFF_PRICE,
+        server=server.name,
+    )
+    if status == JOB_INSUFFICIENT_FUNDS:
         await callback.message.answer(
             "❌ Недостаточно средств. Пополните баланс и попробуйте снова.",
             reply_markup=main_menu_keyboard(),
         )
-        await callback.answer()
-        return
-    username = callback.from_user.username or f"tg_{callback.from_user.id}"
-    email = f"@{username}"
-    settings = get_xui_settings(country)
-    xui = XuiClient.from_settings(settings)
-    try:
-        await xui.login()
-        sub_id = await xui.add_client(email=email, days=TARIFF_DAYS)
-        sub_link = xui.subscription_link(sub_id)
-    except httpx.TimeoutException:
-        add_balance(callback.from_user.id, TARIFF_PRICE)
+    elif status == JOB_QUEUED:
+        wake_workers()
         await callback.message.answer(
-            "⚠️ Сервис подписок временно недоступен. Попробуйте чуть позже.",
+            "⏳ Оплата принята, активируем подписку. Ссылка придет через несколько секунд.",
             reply_markup=main_menu_keyboard(),
         )
-        await callback.answer()
-        return
-    except RuntimeError:
-        add_balance(callback.from_user.id, TARIFF_PRICE)
-        await callback.answer()
-        return
-    except Exception:
-        add_balance(callback.from_user.id, TARIFF_PRICE)
-        await callback.answer()
-        return
-    finally:
-        await xui.close()
-    instructions = vpn_instructions(sub_link)
-    link_image = Path(__file__).resolve().parents[2] / "img" / "link.png"
-    if link_image.exists():
-        await callback.bot.send_photo(
-            callback.from_user.id,
-            FSInputFile(str(link_image)),
-            caption=instructions,
-            reply_markup=main_menu_keyboard(),
-        )
-    else:
-        await callback.bot.send_message(
-            callback.from_user.id,
-            instructions,
-            reply_markup=main_menu_keyboard(),
-            disable_web_page_preview=True,
-        )
-    start_at = datetime.now(timezone.utc)
-    end_at = start_at + timedelta(days=TARIFF_DAYS)
-    set_subscription(
-        callback.from_user.id,
-        start_at,
-        end_at,
-        sub_link,
-        instructions,
-        country,
-    )
-    if record_first_payment(callback.from_user.id, TARIFF_PRICE):
-        logger.info(
-            "Referral reward credited for tg_id=%s",
-            callback.from_user.id,
-        )
     await callback.answer()
 
 
@@ -396,9 +344,13 @@ async def _personal_cabinet_text(user) -> tuple[str, bool]:
     ensure_user(user.id, user.username)
     meta = get_subscription_meta(user.id)
     country = "nl"
+    server = None
     if meta and isinstance(meta.get("country"), str):
         country = meta["country"]
-    xui_available, xui_link, xui_end_at = await _fetch_xui_subscription(user, country)
+        server = meta.get("server")
+    xui_available, xui_link, xui_end_at = await _fetch_xui_subscription(
+        user, country, server
+    )
     if xui_available and not xui_link and not xui_end_at:
         clear_subscription(user.id)
         return "❌ Подписка не активна", False
@@ -422,27 +374,40 @@ async def _personal_cabinet_text(user) -> tuple[str, bool]:
 
 
 async def _fetch_xui_subscription(
-    user, country: str
+    user, country: str, server: str | None = None, trust_reconcile: bool = True
 ) -> tuple[bool, str | None, datetime | None]:
+    # A recent reconcile pass already brought the DB in line with the panel.
+    if trust_reconcile and is_panel_reconciled(server, country):
+        metrics.inc("cabinet_panel_lookups_total", source="cache")
+        return False, None, None
+    metrics.inc("cabinet_panel_lookups_total", source="panel")
     email = _email_for_user(user)
     try:
-        settings = get_xui_settings(country)
-        xui = XuiClient.from_settings(settings)
+        settings = get_server_settings(server, country)
+        xui = create_xui_client(settings)
     except RuntimeError:
         return False, None, None
     try:
-        await xui.login()
-        result = await xui.get_client_subscription(email)
-        if not result:
-            return True, None, None
-        sub_id, end_at = result
-        return True, xui.subscription_link(sub_id), end_at
+        return await asyncio.wait_for(
+            _lookup_xui_subscription(xui, email), get_xui_read_timeout()
+        )
     except Exception:
         return False, None, None
     finally:
         await xui.close()
 
 
+async def _lookup_xui_subscription(
+    xui: XuiClient, email: str
+) -> tuple[bool, str | None, datetime | None]:
+    await xui.login()
+    result = await xui.get_client_subscription(email)
+    if not result:
+        return True, None, None
+    sub_id, end_at = result
+    return True, xui.subscription_link(sub_id), end_at
+
+
 def _email_for_user(user) -> str:
     username = user.username or f"tg_{user.id}"
     return f"@{username}"
@@ -476,9 +441,15 @@ async def choose_country(callback: CallbackQuery):
 
 @router.callback_query(F.data == "balance:topup")
 async def balance_topup(callback: CallbackQuery):
+    settings = get_payment_settings()
+    methods: tuple[str, ...] = ()
+    if settings.enabled:
+        methods = ("stars", "crypto") if settings.cryptobot_token else ("stars",)
+    text = "💳 Выберите способ и сумму пополнения:"
+    if not methods:
+        text = "⚠️ Пополнение баланса временно недоступно."
     await callback.message.answer(
-        "⚠️ Пополнение баланса временно недоступно.",
-        reply_markup=balance_payments_keyboard(),
+        text, reply_markup=balance_payments_keyboard(methods, TOPUP_AMOUNTS)
     )
     await callback.answer()
 
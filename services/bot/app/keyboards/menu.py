@@ -1,3 +1,4 @@
+from functools import lru_cache
 from urllib.parse import quote
 
 from aiogram.types import (
@@ -8,43 +9,74 @@ from aiogram.types import (
     WebAppInfo,
 )
 
+# Keyboards that never change are built once at import time. aiogram types
+# are frozen pydantic models, so sharing one instance across replies is safe.
+_MAIN_MENU = ReplyKeyboardMarkup(
+    keyboard=[
+        [
+            KeyboardButton(text="💼 Тарифы"),
+            KeyboardButton(text="👤 Личный кабинет"),
+        ],
+        [KeyboardButton(text="ℹ️ Информация")],
+        [KeyboardButton(text="⚙️ Настройка")],
+        [KeyboardButton(text="🎁 Пригласи друга")],
+        [KeyboardButton(text="🧑‍💻 Help")],
+    ],
+    resize_keyboard=True,
+)
+
+# Fixed reply-keyboard labels: the only message texts safe to log verbatim.
+MENU_LABELS = frozenset(button.text for row in _MAIN_MENU.keyboard for button in row)
+
+_TARIFFS = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="🚀 Подключить", callback_data="tariff:connect")],
+        [InlineKeyboardButton(text="🧪 Пробный доступ", callback_data="tariff:trial")],
+    ]
+)
+
+_BALANCE = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="back:cabinet")],
+    ]
+)
+
+_BALANCE_PAYMENTS = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="back:balance")],
+    ]
+)
+
+_SETUP = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="V2rayTun", callback_data="setup:v2raytun")],
+        [InlineKeyboardButton(text="Happ", callback_data="setup:happ")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="back:setup")],
+    ]
+)
+
+_COUNTRIES = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="🇳🇱 Netherlands", callback_data="country:nl")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="back:tariffs")],
+    ]
+)
+
+_SUPPORT_URL = (
+    f"https://t.me/SkytNinja?text={quote('привет хочу купить подписку на впн')}"
+)
+
 
 def main_menu_keyboard() -> ReplyKeyboardMarkup:
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [
-                KeyboardButton(text="💼 Тарифы"),
-                KeyboardButton(text="👤 Личный кабинет"),
-            ],
-            [KeyboardButton(text="ℹ️ Информация")],
-            [KeyboardButton(text="⚙️ Настройка")],
-            [KeyboardButton(text="🎁 Пригласи друга")],
-            [KeyboardButton(text="🧑‍💻 Help")],
-        ],
-        resize_keyboard=True,
-    )
+    return _MAIN_MENU
 
 
 def tariffs_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="🚀 Подключить", callback_data="tariff:connect"
-                )
-            ],
-            [
-                InlineKeyboardButton(
-                    text="🧪 Пробный доступ", callback_data="tariff:trial"
-                )
-            ],
-        ]
-    )
+    return _TARIFFS
 
 
+@lru_cache(maxsize=32)
 def payments_keyboard(country: str = "fi") -> InlineKeyboardMarkup:
-    support_text = "привет хочу купить подписку на впн"
-    support_url = f"https://t.me/SkytNinja?text={quote(support_text)}"
     return InlineKeyboardMarkup(
         inline_keyboard=[
             [
@@ -53,25 +85,42 @@ def payments_keyboard(country: str = "fi") -> InlineKeyboardMarkup:
                     callback_data=f"pay:balance:{country}",
                 )
             ],
-            [InlineKeyboardButton(text="🏦 Оплатить через РФ банк", url=support_url)],
+            [InlineKeyboardButton(text="🏦 Оплатить через РФ банк", url=_SUPPORT_URL)],
             [InlineKeyboardButton(text="⬅️ Назад", callback_data="back:countries")],
         ]
     )
 
 
 def balance_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="⬅️ Назад", callback_data="back:cabinet")],
+    return _BALANCE
+
+
+_TOPUP_LABELS = {"stars": "⭐ Stars", "crypto": "💎 Crypto"}
+
+
+@lru_cache(maxsize=4)
+def balance_payments_keyboard(
+    methods: tuple[str, ...] = (), amounts: tuple[int, ...] = ()
+) -> InlineKeyboardMarkup:
+    if not methods:
+        return _BALANCE_PAYMENTS
+    rows = [
+        [
+            InlineKeyboardButton(
+                text=f"{_TOPUP_LABELS[method]} {amount} ₽",
+                callback_data=f"pay:{method}:{amount}",
+            )
+            for method in methods
         ]
-    )
+        for amount in amounts
+    ]
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back:balance")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
-def balance_payments_keyboard() -> InlineKeyboardMarkup:
+def invoice_keyboard(url: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="⬅️ Назад", callback_data="back:balance")],
-        ]
+        inline_keyboard=[[InlineKeyboardButton(text="💎 Оплатить", url=url)]]
     )
 
 
@@ -83,6 +132,7 @@ def connect_keyboard(url: str) -> InlineKeyboardMarkup:
     )
 
 
+@lru_cache(maxsize=2)
 def personal_cabinet_keyboard(show_buy: bool = False) -> InlineKeyboardMarkup:
     buttons = [[InlineKeyboardButton(text="💰 Баланс", callback_data="balance:open")]]
     if show_buy:
@@ -93,22 +143,11 @@ def personal_cabinet_keyboard(show_buy: bool = False) -> InlineKeyboardMarkup:
 
 
 def setup_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="V2rayTun", callback_data="setup:v2raytun")],
-            [InlineKeyboardButton(text="Happ", callback_data="setup:happ")],
-            [InlineKeyboardButton(text="⬅️ Назад", callback_data="back:setup")],
-        ]
-    )
+    return _SETUP
 
 
 def countries_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="🇳🇱 Netherlands", callback_data="country:nl")],
-            [InlineKeyboardButton(text="⬅️ Назад", callback_data="back:tariffs")],
-        ]
-    )
+    return _COUNTRIES
 
 
 def plans_keyboard(plans: list[dict]) -> InlineKeyboardMarkup:
@@ -0,0 +1,130 @@
+"""Event loop lag sampling and a blocking-call detector.
+
+The sampler sleeps ``interval`` and records how late it woke up as
+``event_loop_lag_seconds``; any synchronous psycopg2/redis call or CPU-bound
+work in a coroutine shows up there.
+
+With ``LOOP_BLOCK_THRESHOLD_MS`` set, a watchdog thread also checks the
+sampler's heartbeat. When the loop has not come back for longer than the
+threshold it logs the loop thread's current stack together with the label of
+the running task: the update being handled (set by ``TracingMiddleware``) or
+the scheduled job (``labelled``).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import logging
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterator
+
+from app import metrics
+from app.config import LoopMonitorSettings, get_loop_monitor_settings
+
+logger = logging.getLogger(__name__)
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_label: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "loop_label", default=None
+)
+
+
+@contextmanager
+def loop_label(name: str) -> Iterator[None]:
+    """Name the current task (and tasks it spawns) in blocking reports."""
+    token = _label.set(name)
+    try:
+        yield
+    finally:
+        _label.reset(token)
+
+
+def labelled(
+    name: str, func: Callable[..., Awaitable[Any]]
+) -> Callable[..., Awaitable[Any]]:
+    """Wrap a scheduled coroutine job so blocking reports name it."""
+
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with loop_label(f"job.{name}"):
+            return await func(*args, **kwargs)
+
+    return wrapper
+
+
+def task_label(task: asyncio.Task | None) -> str:
+    if task is None:
+        return "<loop callback>"
+    label = task.get_context().get(_label)
+    return label or task.get_name()
+
+
+class LoopMonitor:
+    def __init__(self, settings: LoopMonitorSettings):
+        self.settings = settings
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread: int | None = None
+        self._beat = time.monotonic()
+        self._reported_beat = 0.0
+        self._blocked_label: str | None = None
+        self._stop = threading.Event()
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        watchdog = None
+        if self.settings.block_threshold_seconds > 0:
+            watchdog = threading.Thread(
+                target=self._watch, name="loop-watchdog", daemon=True
+            )
+            watchdog.start()
+        interval = self.settings.interval_seconds
+        try:
+            while True:
+                started = time.monotonic()
+                await asyncio.sleep(interval)
+                now = time.monotonic()
+                lag = max(now - started - interval, 0.0)
+                self._beat = now
+                metrics.observe("event_loop_lag_seconds", lag, buckets=LAG_BUCKETS)
+                if self._blocked_label is not None:
+                    logger.warning(
+                        "Event loop was blocked for %.0fms by %s",
+                        lag * 1000,
+                        self._blocked_label,
+                    )
+                    self._blocked_label = None
+        finally:
+            self._stop.set()
+
+    def _watch(self) -> None:
+        threshold = self.settings.block_threshold_seconds
+        # Normal sampler wake-ups must not count as stalls.
+        allowance = threshold + self.settings.interval_seconds
+        while not self._stop.wait(threshold / 2):
+            beat = self._beat
+            if beat == self._reported_beat or time.monotonic() - beat < allowance:
+                continue
+            self._reported_beat = beat
+            self._report(time.monotonic() - beat - self.settings.interval_seconds)
+
+    def _report(self, stalled: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = "".join(traceback.format_stack(frame)) if frame else "<no frame>"
+        label = task_label(asyncio.current_task(self._loop))
+        self._blocked_label = label
+        metrics.inc("event_loop_blocked_total", label=label)
+        logger.warning(
+            "Event loop blocked for >%.0fms in %s\n%s", stalled * 1000, label, stack
+        )
+
+
+async def run_loop_monitor() -> None:
+    await LoopMonitor(get_loop_monitor_settings()).run()
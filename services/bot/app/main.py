@@ -1,29 +1,124 @@
 import asyncio
+import importlib
 import logging
-from aiogram import Bot, Dispatcher
+import time
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.types import BotCommand
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from app.config import get_bot_token
-from app.notifications import notify_subscriptions
+from app.config import (
+    get_balance_snapshot_hours,
+    get_bot_token,
+    get_metrics_port,
+    get_notify_settings,
+    get_placement_refresh_seconds,
+    get_reconcile_settings,
+    get_startup_profile,
+    get_throttle_settings,
+    get_traffic_sync_seconds,
+)
+from app.billing import run_invoice_reconciler
+from app.cache_warmup import run_cache_warmup
+from app.loop_monitor import labelled, run_loop_monitor
+from app.metrics import start_metrics_server
+from app.middlewares.startup import FirstUpdateMiddleware
+from app.middlewares.throttle import CallbackGuardMiddleware, ThrottleMiddleware
+from app.middlewares.tracing import TelegramTracingMiddleware, TracingMiddleware
+from app.notifications import replan_notifications, run_notification_drain
+from app.outbound import SendSchedulerMiddleware, get_send_scheduler
 from app.preflight import run_preflight
-from app.storage import init_db, purge_expired_subscriptions
+from app.provisioning import run_provisioning_workers
+from app.services.placement import refresh_server_loads
+from app.services.reconcile import run_reconciliation
+from app.services.traffic import sync_traffic_stats
+from app.storage import init_db, purge_expired_subscriptions, snapshot_balances
+from app.tracing import run_exporter
+
+
+def create_bot(token: str, session: AiohttpSession | None = None) -> Bot:
+    bot = Bot(token=token, session=session)
+    bot.session.middleware(TelegramTracingMiddleware())
+    bot.session.middleware(SendSchedulerMiddleware(get_send_scheduler()))
+    return bot
+
+
+HANDLER_MODULES = (
+    "app.handlers.start",
+    "app.handlers.subscription",
+    "app.handlers.payments",
+)
+
+
+def load_routers() -> list[Router]:
+    return [importlib.import_module(name).router for name in HANDLER_MODULES]
+
+
+def create_dispatcher(routers: list[Router] | None = None) -> Dispatcher:
+    dp = Dispatcher()
+    if get_startup_profile():
+        dp.update.outer_middleware(FirstUpdateMiddleware())
+    dp.update.outer_middleware(TracingMiddleware())
+    throttle = get_throttle_settings()
+    dp.update.outer_middleware(ThrottleMiddleware(throttle))
+    dp.callback_query.outer_middleware(CallbackGuardMiddleware(throttle))
+    dp.include_routers(*(routers if routers is not None else load_routers()))
+    return dp
 
 
 async def main():
     logging.basicConfig(level=logging.INFO)
+    started = time.perf_counter()
     token = get_bot_token()
+    loop_monitor_task = asyncio.create_task(run_loop_monitor(), name="loop_monitor")
 
+    # Handler modules are imported in a worker thread while preflight waits
+    # on the network.
+    routers_task = asyncio.create_task(asyncio.to_thread(load_routers))
     await run_preflight()
-    init_db()
-    bot = Bot(token=token)
+    await asyncio.to_thread(init_db)
+    warmup_task = asyncio.create_task(
+        labelled("cache_warmup", run_cache_warmup)(), name="cache_warmup"
+    )
+    bot = create_bot(token)
+
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
     scheduler = AsyncIOScheduler()
     scheduler.add_job(purge_expired_subscriptions, "interval", hours=12)
-    scheduler.add_job(notify_subscriptions, "interval", hours=6, args=[bot])
+    scheduler.add_job(
+        labelled("replan_notifications", replan_notifications),
+        "interval",
+        hours=get_notify_settings().replan_hours,
+        next_run_time=datetime.now(),
+    )
+    scheduler.add_job(
+        snapshot_balances, "interval", hours=get_balance_snapshot_hours()
+    )
+    scheduler.add_job(
+        labelled("refresh_server_loads", refresh_server_loads),
+        "interval",
+        seconds=get_placement_refresh_seconds(),
+        next_run_time=datetime.now(),
+    )
+    scheduler.add_job(
+        labelled("sync_traffic_stats", sync_traffic_stats),
+        "interval",
+        seconds=get_traffic_sync_seconds(),
+        max_instances=1,
+        coalesce=True,
+    )
+    scheduler.add_job(
+        labelled("run_reconciliation", run_reconciliation),
+        "interval",
+        seconds=get_reconcile_settings().interval_seconds,
+        next_run_time=datetime.now(),
+        max_instances=1,
+        coalesce=True,
+    )
     scheduler.start()
 
-    from app.handlers import payments, start, subscription
-
     await bot.set_my_commands(
         [
             BotCommand(command="start", description="Start"),
@@ -32,14 +127,33 @@ async def main():
             BotCommand(command="my_vpn", description="Мой VPN"),
         ]
     )
-    dp = Dispatcher()
-    dp.include_router(start.router)
-    dp.include_router(subscription.router)
-    dp.include_router(payments.router)
+    dp = create_dispatcher(await routers_task)
+    metrics_runner = await start_metrics_server(get_metrics_port())
+    exporter_task = asyncio.create_task(run_exporter(), name="trace_exporter")
+    provisioning_task = asyncio.create_task(
+        run_provisioning_workers(bot), name="provisioning"
+    )
+    reconciler_task = asyncio.create_task(
+        run_invoice_reconciler(bot), name="invoice_reconciler"
+    )
+    notifications_task = asyncio.create_task(
+        run_notification_drain(bot), name="notification_drain"
+    )
+    logging.getLogger(__name__).info(
+        "Startup finished in %.0fms", (time.perf_counter() - started) * 1000
+    )
     try:
         await dp.start_polling(bot)
     finally:
         scheduler.shutdown(wait=False)
+        exporter_task.cancel()
+        provisioning_task.cancel()
+        reconciler_task.cancel()
+        notifications_task.cancel()
+        warmup_task.cancel()
+        loop_monitor_task.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
 if __name__ == "__main__":
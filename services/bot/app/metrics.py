@@ -0,0 +1,124 @@
+"""In-process metrics registry with an optional Prometheus text endpoint."""
+
+from __future__ import annotations
+
+import bisect
+import logging
+from typing import Callable, Iterable
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = tuple[tuple[str, str], ...]
+Sample = tuple[str, dict[str, str], float]
+
+_counters: dict[tuple[str, Labels], float] = {}
+_gauges: dict[tuple[str, Labels], float] = {}
+_histograms: dict[tuple[str, Labels], "Histogram"] = {}
+_collectors: list[Callable[[], Iterable[Sample]]] = []
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bucket bound containing the ``q`` quantile."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+def _key(name: str, labels: dict[str, str]) -> tuple[str, Labels]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1.0, **labels: str) -> None:
+    key = _key(name, labels)
+    _counters[key] = _counters.get(key, 0.0) + value
+
+
+def set_gauge(name: str, value: float, **labels: str) -> None:
+    _gauges[_key(name, labels)] = value
+
+
+def observe(
+    name: str, value: float, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **labels: str
+) -> None:
+    key = _key(name, labels)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms[key] = Histogram(buckets)
+    histogram.observe(value)
+
+
+def get_histogram(name: str, **labels: str) -> Histogram | None:
+    return _histograms.get(_key(name, labels))
+
+
+def register_collector(collector: Callable[[], Iterable[Sample]]) -> None:
+    """Register a callback that yields gauge samples at scrape time."""
+    _collectors.append(collector)
+
+
+def _format_labels(labels: Iterable[tuple[str, str]]) -> str:
+    pairs = [f'{k}="{v}"' for k, v in labels]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render_prometheus() -> str:
+    lines: list[str] = []
+    for (name, labels), value in sorted(_counters.items()):
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), value in sorted(_gauges.items()):
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for collector in _collectors:
+        try:
+            for name, labels, value in collector():
+                lines.append(f"{name}{_format_labels(sorted(labels.items()))} {value}")
+        except Exception:
+            logger.exception("Metrics collector failed")
+    for (name, labels), histogram in sorted(_histograms.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            bucket_labels = labels + (("le", str(bound)),)
+            lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+        inf_labels = labels + (("le", "+Inf"),)
+        lines.append(f"{name}_bucket{_format_labels(inf_labels)} {histogram.count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {histogram.total}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render_prometheus(), content_type="text/plain")
+
+
+async def start_metrics_server(port: int | None) -> web.AppRunner | None:
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    logger.info("Metrics endpoint listening on :%s/metrics", port)
+    return runner
@@ -0,0 +1,3 @@
+from app.middlewares import startup, throttle, tracing
+
+__all__ = ["startup", "throttle", "tracing"]
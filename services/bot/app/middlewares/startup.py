@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.startup_profile import process_uptime
+
+logger = logging.getLogger(__name__)
+
+
+class FirstUpdateMiddleware(BaseMiddleware):
+    """Log cold-start-to-first-update latency once per process."""
+
+    def __init__(self) -> None:
+        self._seen = False
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if self._seen:
+            return await handler(event, data)
+        self._seen = True
+        received = process_uptime()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            logger.info(
+                "Cold start to first update: received at %.0fms, handled at %.0fms",
+                received * 1000,
+                (received + time.perf_counter() - started) * 1000,
+            )
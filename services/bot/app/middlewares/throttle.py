@@ -0,0 +1,185 @@
+"""Per-user anti-flood and serialization of mutating callbacks."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager, suppress
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+import redis
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import CallbackQuery, TelegramObject, Update
+
+from app import metrics
+from app.config import ThrottleSettings
+from app.services.redis_client import get_redis
+from app.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Callbacks that spend money or create panel clients.
+MUTATING_CALLBACKS = ("tariff:trial", "pay:")
+
+_PRUNE_THRESHOLD = 10_000
+
+
+async def _answer(callback: CallbackQuery, text: str | None = None) -> None:
+    with suppress(TelegramAPIError):
+        await callback.answer(text)
+
+
+def _is_payment(event: TelegramObject) -> bool:
+    if not isinstance(event, Update):
+        return False
+    if event.pre_checkout_query is not None:
+        return True
+    return event.message is not None and event.message.successful_payment is not None
+
+
+class ThrottleMiddleware(BaseMiddleware):
+    """Token bucket per user: ``burst`` updates, refilled at ``rate_per_second``.
+
+    Updates over the limit are dropped; a throttled callback is still answered
+    so the client stops spinning. Payment updates are never throttled: a
+    dropped ``successful_payment`` would leave the Stars charged but not
+    credited.
+    """
+
+    def __init__(self, settings: ThrottleSettings):
+        self.settings = settings
+        self._buckets: dict[int, tuple[float, float]] = {}
+
+    def _take(self, tg_id: int, now: float) -> bool:
+        tokens, updated = self._buckets.get(tg_id, (self.settings.burst, now))
+        tokens = min(
+            self.settings.burst,
+            tokens + (now - updated) * self.settings.rate_per_second,
+        )
+        allowed = tokens >= 1
+        self._buckets[tg_id] = (tokens - 1 if allowed else tokens, now)
+        return allowed
+
+    def _prune(self, now: float) -> None:
+        refill = self.settings.burst / max(self.settings.rate_per_second, 1e-9)
+        self._buckets = {
+            tg_id: bucket
+            for tg_id, bucket in self._buckets.items()
+            if now - bucket[1] < refill
+        }
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or _is_payment(event):
+            return await handler(event, data)
+        now = time.monotonic()
+        if len(self._buckets) > _PRUNE_THRESHOLD:
+            self._prune(now)
+        if self._take(user.id, now):
+            return await handler(event, data)
+        metrics.inc("updates_throttled_total")
+        if isinstance(event, Update) and event.callback_query:
+            await _answer(event.callback_query, "Слишком часто, подождите секунду.")
+        return None
+
+
+@asynccontextmanager
+async def redis_user_lock(
+    tg_id: int, settings: ThrottleSettings
+) -> AsyncIterator[bool]:
+    """Cross-replica lock for one user; yields ``False`` if it was not acquired.
+
+    When Redis is unreachable the lock is skipped (yields ``True``) and only
+    the in-process lock protects the user.
+    """
+    lock = get_redis().lock(
+        f"lock:user:{tg_id}", timeout=settings.lock_ttl_seconds
+    )
+    deadline = time.monotonic() + settings.lock_wait_seconds
+    try:
+        with span("redis.lock"):
+            acquired = lock.acquire(blocking=False)
+            while not acquired and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                acquired = lock.acquire(blocking=False)
+    except redis.RedisError:
+        logger.warning("User lock unavailable for tg_id=%s, local lock only", tg_id)
+        lock = None
+        acquired = True
+    try:
+        yield acquired
+    finally:
+        if acquired and lock is not None:
+            with suppress(redis.RedisError):
+                lock.release()
+
+
+class CallbackGuardMiddleware(BaseMiddleware):
+    """Drop repeated callbacks and run mutating ones one at a time per user.
+
+    A callback with the same data from the same user inside
+    ``duplicate_window_seconds`` is answered and dropped. Callbacks matching
+    ``MUTATING_CALLBACKS`` wait for the user's in-process lock and then the
+    Redis lock shared by all replicas.
+    """
+
+    def __init__(
+        self,
+        settings: ThrottleSettings,
+        mutating: tuple[str, ...] = MUTATING_CALLBACKS,
+    ):
+        self.settings = settings
+        self.mutating = mutating
+        self._recent: dict[tuple[int, str], float] = {}
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._waiters: dict[int, int] = {}
+
+    def _is_duplicate(self, tg_id: int, payload: str, now: float) -> bool:
+        window = self.settings.duplicate_window_seconds
+        if len(self._recent) > _PRUNE_THRESHOLD:
+            self._recent = {
+                key: seen for key, seen in self._recent.items() if now - seen < window
+            }
+        last = self._recent.get((tg_id, payload))
+        self._recent[(tg_id, payload)] = now
+        return last is not None and now - last < window
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, CallbackQuery) or event.from_user is None:
+            return await handler(event, data)
+        tg_id = event.from_user.id
+        payload = event.data or ""
+        if self._is_duplicate(tg_id, payload, time.monotonic()):
+            metrics.inc("callbacks_deduplicated_total")
+            await _answer(event)
+            return None
+        if not payload.startswith(self.mutating):
+            return await handler(event, data)
+
+        lock = self._locks.setdefault(tg_id, asyncio.Lock())
+        self._waiters[tg_id] = self._waiters.get(tg_id, 0) + 1
+        try:
+            async with lock:
+                async with redis_user_lock(tg_id, self.settings) as acquired:
+                    if not acquired:
+                        metrics.inc("callbacks_lock_timeout_total")
+                        await _answer(event, "⏳ Предыдущее действие еще выполняется.")
+                        return None
+                    return await handler(event, data)
+        finally:
+            self._waiters[tg_id] -= 1
+            if not self._waiters[tg_id]:
+                del self._waiters[tg_id]
+                self._locks.pop(tg_id, None)
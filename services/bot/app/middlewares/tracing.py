@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject, Update
+
+from app.keyboards.menu import MENU_LABELS
+from app.loop_monitor import loop_label
+from app.tracing import span, start_trace
+
+
+def _message_attributes(text: str) -> dict[str, Any]:
+    """What a span may keep of a message: commands and menu buttons, not free text.
+
+    Spans are exported and logged, so user-typed content (support messages,
+    payment details) must never reach them.
+    """
+    if text.startswith("/"):
+        return {"command": text.split(maxsplit=1)[0].split("@", 1)[0][:32]}
+    if text in MENU_LABELS:
+        return {"button": text}
+    return {"text_length": len(text)}
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Open a root trace span for every incoming Telegram update."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        attributes: dict[str, Any] = {}
+        name = label = "update"
+        if isinstance(event, Update):
+            name = label = f"update.{event.event_type}"
+            attributes["update_id"] = event.update_id
+            if event.callback_query and event.callback_query.data:
+                attributes["callback_data"] = event.callback_query.data[:64]
+                label = f"{name}:{event.callback_query.data.split(':', 1)[0]}"
+            elif event.message and event.message.text:
+                attributes.update(_message_attributes(event.message.text))
+        user = data.get("event_from_user")
+        if user is not None:
+            attributes["tg_id"] = user.id
+        with start_trace(name, **attributes), loop_label(label):
+            return await handler(event, data)
+
+
+class TelegramTracingMiddleware(BaseRequestMiddleware):
+    """Record a span for every outgoing Bot API request."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ):
+        with span(f"telegram.{method.__api_method__}"):
+            return await make_request(bot, method)
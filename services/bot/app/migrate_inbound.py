@@ -0,0 +1,212 @@
+"""Move every active subscription to a new inbound using batched addClient.
+
+Usage::
+
+    PYTHONPATH=. python -m app.migrate_inbound --country nl --inbound-id 2
+    PYTHONPATH=. python -m app.migrate_inbound --country nl --target-country nl2 --dry-run
+    PYTHONPATH=. python -m app.migrate_inbound --country nl --target-server nl2:3
+"""
+
+import argparse
+import asyncio
+import logging
+from dataclasses import replace
+
+import httpx
+
+from app.config import (
+    XuiSettings,
+    get_server_settings,
+    get_xui_batch_size,
+    get_xui_settings,
+)
+from app.services.xui_client import ClientResult, ClientSpec, create_xui_client
+from app.storage import fetch_active_subscriptions_with_users, update_subscription_record
+from app.vpn_instructions import vpn_instructions
+
+
+def _email(row: dict) -> str:
+    return f"@{row.get('username') or f'tg_{row['tg_id']}'}"
+
+
+def _same_panel(a: XuiSettings, b: XuiSettings) -> bool:
+    return a.base_url.rstrip("/") == b.base_url.rstrip("/")
+
+
+async def _move_chunk(
+    xui, specs: list[ClientSpec], originals: dict[str, tuple]
+) -> list[ClientResult]:
+    """Add ``specs`` to the target inbound, moving clients already on its panel.
+
+    3x-ui rejects an email that exists in any inbound of the panel, so such a
+    client is deleted from its source inbound first and put back there if the
+    add fails.
+    """
+    results: list[ClientResult] = []
+    ready: list[ClientSpec] = []
+    for spec in specs:
+        original = originals.get(spec.email)
+        if original is not None:
+            source, client = original
+            try:
+                await source.delete_client(client)
+            except (httpx.HTTPError, RuntimeError) as exc:
+                error = f"source delClient failed: {exc}"
+                results.append(ClientResult(spec.email, spec.sub_id, False, error))
+                continue
+        ready.append(spec)
+    if not ready:
+        return results
+    added = await xui.add_clients(ready, chunk_size=len(ready))
+    results.extend(added)
+
+    failed = {result.email for result in added if not result.ok}
+    restore: dict[int, tuple] = {}
+    for spec in ready:
+        if spec.email in failed and spec.email in originals:
+            source = originals[spec.email][0]
+            restore.setdefault(id(source), (source, []))[1].append(spec)
+    for source, lost in restore.values():
+        for result in await source.add_clients(lost, chunk_size=len(lost)):
+            if not result.ok:
+                logging.error(
+                    "Could not restore %s on its source inbound: %s",
+                    result.email,
+                    result.error,
+                )
+    return results
+
+
+async def migrate(
+    country: str,
+    target_country: str | None,
+    inbound_id: int | None,
+    chunk_size: int,
+    dry_run: bool,
+    target_server: str | None = None,
+) -> tuple[int, int]:
+    if target_server:
+        settings = get_server_settings(target_server, target_country or country)
+    else:
+        settings = get_xui_settings(target_country or country)
+    if inbound_id is not None:
+        settings = replace(settings, inbound_id=inbound_id)
+
+    sources: dict[str | None, XuiSettings] = {}
+    rows = []
+    for row in fetch_active_subscriptions_with_users(country):
+        server = row.get("server")
+        if server not in sources:
+            sources[server] = get_server_settings(server, country)
+        source = sources[server]
+        if _same_panel(source, settings) and source.inbound_id == settings.inbound_id:
+            continue
+        rows.append(row)
+    print(
+        f"Migrating {len(rows)} subscriptions from country={country} "
+        f"to {settings.base_url} inbound={settings.inbound_id}"
+    )
+    if dry_run:
+        return len(rows), 0
+
+    local_sources = {
+        source.inbound_id: source
+        for source in sources.values()
+        if _same_panel(source, settings) and source.inbound_id != settings.inbound_id
+    }
+    xui = create_xui_client(settings)
+    opened = [xui]
+    try:
+        await xui.login()
+        originals: dict[str, tuple] = {}
+        for source_settings in local_sources.values():
+            source = create_xui_client(source_settings)
+            opened.append(source)
+            await source.login()
+            for client in await source.list_clients():
+                if client.get("email"):
+                    originals[client["email"]] = (source, client)
+
+        specs = []
+        for row in rows:
+            email = _email(row)
+            client = originals.get(email, (None, {}))[1]
+            # A client moved within the panel keeps its id and subId, so the
+            # user's subscription link keeps working.
+            specs.append(
+                ClientSpec(
+                    email=email,
+                    expire_at=row["end_at"],
+                    sub_id=client.get("subId") or None,
+                    client_id=client.get("id") or None,
+                )
+            )
+        by_email = {spec.email: row for spec, row in zip(specs, rows)}
+        results: list[ClientResult] = []
+        for start in range(0, len(specs), chunk_size):
+            chunk = specs[start : start + chunk_size]
+            results.extend(await _move_chunk(xui, chunk, originals))
+    finally:
+        for client in opened:
+            await client.close()
+
+    success = 0
+    failed = 0
+    for result in results:
+        row = by_email[result.email]
+        if not result.ok:
+            failed += 1
+            logging.warning(
+                "Migration failed tg_id=%s email=%s: %s",
+                row["tg_id"],
+                result.email,
+                result.error,
+            )
+            continue
+        link = xui.subscription_link(result.sub_id)
+        update_subscription_record(
+            row["tg_id"],
+            row["start_at"],
+            row["end_at"],
+            link,
+            vpn_instructions(link),
+            target_country or country,
+            settings.name or None,
+        )
+        success += 1
+    return success, failed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--country", default="nl", help="source subscriptions country")
+    parser.add_argument("--target-country", help="panel settings to migrate to")
+    parser.add_argument("--target-server", help="pool server name to migrate to")
+    parser.add_argument("--inbound-id", type=int, help="override target inbound id")
+    parser.add_argument("--chunk-size", type=int, default=get_xui_batch_size())
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    if (
+        args.target_country is None
+        and args.inbound_id is None
+        and args.target_server is None
+    ):
+        parser.error("pass --target-country, --target-server and/or --inbound-id")
+
+    success, failed = asyncio.run(
+        migrate(
+            args.country,
+            args.target_country,
+            args.inbound_id,
+            args.chunk_size,
+            args.dry_run,
+            args.target_server,
+        )
+    )
+    logging.info("Migration done. success=%s failed=%s", success, failed)
+    print(f"Migration done. success={success} failed={failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
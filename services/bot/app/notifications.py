@@ -1,72 +1,167 @@
+"""Expiry notices drained from a Redis sorted set of planned send times.
+
+``storage.set_subscription`` and ``update_subscription_record`` plan two
+members per end date in ``notify:due``: the 3-day reminder and the expiry
+notice, scored by when they are due. ``run_notification_drain`` claims due
+members in small batches every few seconds, so notices go out on time and
+spread evenly instead of in one burst per scan.
+"""
+
 from __future__ import annotations
 
+import asyncio
+import logging
+import time
 from datetime import datetime, timedelta, timezone
 
 import redis
 from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from app import metrics
+from app.config import get_notify_settings
+from app.outbound import NOTIFICATION, send_priority
+from app.services.redis_client import get_redis
+from app.storage import (
+    NOTIFY_DUE_KEY,
+    NOTIFY_EXPIRED,
+    NOTIFY_LEAD,
+    NOTIFY_THREE_DAYS,
+    clear_subscription,
+    fetch_subscription_end_dates,
+    parse_notification_member,
+    schedule_all_expiry_notifications,
+)
+from app.tracing import start_trace
+
+logger = logging.getLogger(__name__)
 
-from app.config import get_redis_url
-from app.storage import clear_subscription, fetch_subscription_end_dates
-
-THREE_DAYS = timedelta(days=3)
 REDIS_TTL_EXTRA = timedelta(days=7)
+RETRY_DELAY_SECONDS = 60
+
+_DELAY_BUCKETS = (1, 5, 15, 60, 300, 900, 3600, 6 * 3600, 24 * 3600)
+
+MESSAGES = {
+    NOTIFY_THREE_DAYS: (
+        "⏳ До окончания подписки осталось 3 дня.\n"
+        "Продлите доступ заранее, чтобы не потерять VPN."
+    ),
+    NOTIFY_EXPIRED: (
+        "⛔️ Подписка завершилась.\n"
+        "Для продления откройте раздел тарифов и выберите оплату."
+    ),
+}
 
 
 def _redis() -> redis.Redis:
-    return redis.Redis.from_url(get_redis_url(), decode_responses=True)
+    return get_redis()
 
 
 def _notify_key(prefix: str, tg_id: int, end_at: datetime) -> str:
     return f"notify:{prefix}:{tg_id}:{end_at.isoformat()}"
 
 
-def _set_notified(key: str, end_at: datetime) -> None:
+def _notified_ttl(end_at: datetime) -> int:
     ttl = int((end_at + REDIS_TTL_EXTRA - datetime.now(timezone.utc)).total_seconds())
-    if ttl <= 0:
-        ttl = int(REDIS_TTL_EXTRA.total_seconds())
-    _redis().setex(key, ttl, "1")
-
-
-def _was_notified(key: str) -> bool:
-    return _redis().get(key) is not None
-
-
-async def notify_subscriptions(bot: Bot) -> None:
+    return ttl if ttl > 0 else int(REDIS_TTL_EXTRA.total_seconds())
+
+
+def _claim_due(client: redis.Redis, limit: int) -> list[str]:
+    """Take up to ``limit`` due members; ZREM makes each one single-owner."""
+    due = client.zrangebyscore(NOTIFY_DUE_KEY, "-inf", time.time(), start=0, num=limit)
+    if not due:
+        return []
+    pipe = client.pipeline(transaction=False)
+    for member in due:
+        pipe.zrem(NOTIFY_DUE_KEY, member)
+    return [member for member, removed in zip(due, pipe.execute()) if removed]
+
+
+async def _send(bot: Bot, kind: str, tg_id: int) -> bool:
+    """Send one notice; ``False`` means a transient failure worth retrying."""
+    try:
+        await bot.send_message(tg_id, MESSAGES[kind])
+    except (TelegramForbiddenError, TelegramBadRequest):
+        metrics.inc("notifications_undeliverable_total", kind=kind)
+    except Exception:
+        logger.exception("Expiry notice %s failed for tg_id=%s", kind, tg_id)
+        return False
+    return True
+
+
+def _utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+async def drain_due_notifications(bot: Bot, limit: int) -> int:
+    """Send the due notices of one batch; returns the number of claimed members."""
+    client = _redis()
+    claimed = await asyncio.to_thread(_claim_due, client, limit)
+    if not claimed:
+        return 0
+    planned = [parse_notification_member(member) for member in claimed]
+    rows = await asyncio.to_thread(
+        fetch_subscription_end_dates, sorted({tg_id for _, tg_id, _ in planned})
+    )
+    current = {row["tg_id"]: _utc(row["end_at"]) for row in rows}
     now = datetime.now(timezone.utc)
-    for row in fetch_subscription_end_dates():
-        tg_id = row["tg_id"]
-        end_at = row["end_at"]
-        if not end_at:
+    pending: list[tuple[str, str, int, datetime]] = []
+    for member, (kind, tg_id, end_at) in zip(claimed, planned):
+        end_now = current.get(tg_id)
+        if end_now is None or int(end_now.timestamp()) != int(end_at.timestamp()):
+            # Extended, replaced or removed since this notice was planned.
+            metrics.inc("notifications_stale_total", kind=kind)
             continue
-        if end_at.tzinfo is None:
-            end_at = end_at.replace(tzinfo=timezone.utc)
-
-        if end_at <= now:
-            key = _notify_key("expired", tg_id, end_at)
-            if _was_notified(key):
-                continue
-            try:
-                await bot.send_message(
-                    tg_id,
-                    "⛔️ Подписка завершилась.\n"
-                    "Для продления откройте раздел тарифов и выберите оплату.",
-                )
-            except Exception:
-                pass
-            _set_notified(key, end_at)
-            clear_subscription(tg_id)
+        if kind == NOTIFY_THREE_DAYS and end_now <= now:
             continue
-
-        if end_at - now <= THREE_DAYS:
-            key = _notify_key("three_days", tg_id, end_at)
-            if _was_notified(key):
-                continue
+        pending.append((member, kind, tg_id, end_now))
+    keys = [_notify_key(kind, tg_id, end_at) for _, kind, tg_id, end_at in pending]
+    sent = await asyncio.to_thread(client.mget, keys) if keys else []
+    retry: dict[str, float] = {}
+    for (member, kind, tg_id, end_at), key, seen in zip(pending, keys, sent):
+        if seen:
+            continue
+        if not await _send(bot, kind, tg_id):
+            retry[member] = time.time() + RETRY_DELAY_SECONDS
+            continue
+        await asyncio.to_thread(client.setex, key, _notified_ttl(end_at), "1")
+        due_at = end_at - NOTIFY_LEAD if kind == NOTIFY_THREE_DAYS else end_at
+        metrics.inc("notifications_sent_total", kind=kind)
+        metrics.observe(
+            "notification_delay_seconds",
+            (datetime.now(timezone.utc) - due_at).total_seconds(),
+            buckets=_DELAY_BUCKETS,
+            kind=kind,
+        )
+        if kind == NOTIFY_EXPIRED:
+            await asyncio.to_thread(clear_subscription, tg_id)
+    if retry:
+        await asyncio.to_thread(client.zadd, NOTIFY_DUE_KEY, retry)
+    return len(claimed)
+
+
+async def run_notification_drain(bot: Bot) -> None:
+    settings = get_notify_settings()
+    with send_priority(NOTIFICATION):
+        while True:
+            claimed = 0
             try:
-                await bot.send_message(
-                    tg_id,
-                    "⏳ До окончания подписки осталось 3 дня.\n"
-                    "Продлите доступ заранее, чтобы не потерять VPN.",
-                )
+                with start_trace("notifications.drain"):
+                    claimed = await drain_due_notifications(bot, settings.batch_size)
+                size = await asyncio.to_thread(_redis().zcard, NOTIFY_DUE_KEY)
+                metrics.set_gauge("notifications_planned", size)
             except Exception:
-                pass
-            _set_notified(key, end_at)
+                logger.exception("Expiry notification drain failed")
+            # A full batch means more is due: continue without waiting.
+            if claimed < settings.batch_size:
+                await asyncio.sleep(settings.interval_seconds)
+
+
+async def replan_notifications() -> None:
+    """Safety net for a lost or flushed Redis: re-plan every subscription."""
+    try:
+        planned = await asyncio.to_thread(schedule_all_expiry_notifications)
+    except Exception:
+        logger.exception("Expiry notification re-plan failed")
+        return
+    logger.info("Planned expiry notifications for %s subscriptions", planned)
@@ -0,0 +1,337 @@
+"""Prioritized scheduling of outgoing Telegram messages.
+
+Every message-producing Bot API call waits here for a slot: a token from the
+bot's bucket plus a minimum interval per chat. Waiting calls are served by
+priority class, so replies to a user who is tapping buttons overtake a
+notification run or a broadcast. The class comes from a context variable set
+by the caller (``send_priority``); update handlers keep the default
+``INTERACTIVE``.
+
+The bucket lives in Redis and is shared by every process sending as the same
+bot — the bot itself and the ``app.broadcast*`` scripts — so together they
+stay under Telegram's global limit and the interactive reserve holds across
+processes. Without Redis each process falls back to its own in-memory bucket.
+The priority queues, per-chat spacing and the broadcast rate cap are always
+per process.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+import redis
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+
+from app import metrics
+from app.config import SendSettings, get_send_settings
+from app.services.redis_client import get_redis
+from app.tracing import span
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+TRANSACTIONAL = 1
+NOTIFICATION = 2
+BROADCAST = 3
+
+PRIORITY_NAMES = {
+    INTERACTIVE: "interactive",
+    TRANSACTIONAL: "transactional",
+    NOTIFICATION: "notification",
+    BROADCAST: "broadcast",
+}
+
+# Bot API methods that count against Telegram's message limits.
+GATED_METHODS = ("send", "edit", "copy", "forward")
+
+_WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+_SCAN_LIMIT = 200
+_PRUNE_THRESHOLD = 10_000
+
+# Refill by Redis' own clock so every process agrees on elapsed time.
+# Returns {taken, wait_ms, tokens}; a live pause key blocks every class.
+_TAKE_SCRIPT = """
+local paused = redis.call('PTTL', KEYS[2])
+if paused > 0 then
+    return {0, paused, '0'}
+end
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local needed = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(state[1]) or burst
+local at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - at) * rate / 1000)
+local taken = 0
+local wait = 0
+if tokens >= needed then
+    tokens = tokens - 1
+    taken = 1
+else
+    wait = math.ceil((needed - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return {taken, wait, tostring(tokens)}
+"""
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar(
+    "send_priority", default=INTERACTIVE
+)
+
+
+@contextmanager
+def send_priority(priority: int) -> Iterator[None]:
+    """Send messages issued inside the block (and tasks it spawns) as ``priority``."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+@dataclass
+class _Waiter:
+    chat_id: int | str | None
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class SendScheduler:
+    """Bot-wide token bucket plus per-chat spacing, served by priority.
+
+    ``interactive_reserve`` tokens of the bucket can only be taken by
+    ``INTERACTIVE`` sends, so a bulk job running at the full rate still leaves
+    room for immediate replies. Interactive sends skip the per-chat interval;
+    they are already limited by ``ThrottleMiddleware``. ``BROADCAST`` sends are
+    further capped at ``broadcast_rate_per_second`` per process. A
+    ``RetryAfter`` from Telegram pauses every class, in every process sharing
+    the bucket, until it expires.
+    """
+
+    def __init__(self, settings: SendSettings):
+        self.settings = settings
+        self._queues: dict[int, deque[_Waiter]] = {
+            priority: deque() for priority in PRIORITY_NAMES
+        }
+        self._chat_ready: dict[int | str, float] = {}
+        self._tokens = float(settings.burst)
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._broadcast_ready = 0.0
+        self._script = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+    def depth(self, priority: int) -> int:
+        return sum(not waiter.future.done() for waiter in self._queues[priority])
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        if self.settings.shared_key is None:
+            return
+        try:
+            get_redis().set(
+                f"{self.settings.shared_key}:paused", 1, px=max(int(seconds * 1000), 1)
+            )
+        except (redis.RedisError, RuntimeError):
+            return
+
+    async def acquire(self, chat_id: int | str | None, priority: int) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        waiter = _Waiter(chat_id, loop.create_future())
+        self._queues[priority].append(waiter)
+        self._wakeup.set()
+        await waiter.future
+        metrics.observe(
+            "send_queue_wait_seconds",
+            time.monotonic() - waiter.enqueued_at,
+            buckets=_WAIT_BUCKETS,
+            priority=PRIORITY_NAMES[priority],
+        )
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(
+            float(self.settings.burst),
+            self._tokens + (now - self._refilled) * self.settings.rate_per_second,
+        )
+        self._refilled = now
+
+    def _take_shared(self, needed: float) -> float | None:
+        if self._script is None:
+            self._script = get_redis().register_script(_TAKE_SCRIPT)
+        key = self.settings.shared_key
+        taken, wait_ms, tokens = self._script(
+            keys=[f"{key}:bucket", f"{key}:paused"],
+            args=[self.settings.rate_per_second, self.settings.burst, needed],
+        )
+        self._tokens = float(tokens)
+        return None if int(taken) else max(int(wait_ms), 1) / 1000
+
+    def _take(self, needed: float, now: float) -> float | None:
+        """Take one token; ``None`` on success, else seconds to wait for it."""
+        if self.settings.shared_key is not None:
+            try:
+                return self._take_shared(needed)
+            except (redis.RedisError, RuntimeError):
+                metrics.inc("send_bucket_fallback_total")
+        self._refill(now)
+        if self._tokens < needed:
+            return (needed - self._tokens) / max(self.settings.rate_per_second, 1e-9)
+        self._tokens -= 1
+        return None
+
+    def _next(self) -> tuple[_Waiter | None, float | None]:
+        """The waiter to release now, or how long to sleep before looking again."""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return None, self._paused_until - now
+        delay: float | None = None
+        for priority, queue in self._queues.items():
+            while queue and queue[0].future.done():
+                queue.popleft()
+            if not queue:
+                continue
+            if priority == BROADCAST and self._broadcast_ready > now:
+                wait = self._broadcast_ready - now
+                delay = wait if delay is None else min(delay, wait)
+                continue
+            ready: int | None = None
+            for index, waiter in enumerate(queue):
+                if index >= _SCAN_LIMIT:
+                    break
+                if waiter.future.done():
+                    continue
+                ready_at = 0.0
+                if priority != INTERACTIVE and waiter.chat_id is not None:
+                    ready_at = self._chat_ready.get(waiter.chat_id, 0.0)
+                if ready_at > now:
+                    wait = ready_at - now
+                    delay = wait if delay is None else min(delay, wait)
+                    continue
+                ready = index
+                break
+            if ready is None:
+                continue
+            needed = 1.0
+            if priority != INTERACTIVE:
+                needed += self.settings.interactive_reserve
+            wait = self._take(needed, now)
+            if wait is not None:
+                # Lower classes need at least as many tokens.
+                delay = wait if delay is None else min(delay, wait)
+                break
+            waiter = queue[ready]
+            del queue[ready]
+            if waiter.chat_id is not None:
+                self._chat_ready[waiter.chat_id] = (
+                    now + self.settings.chat_interval_seconds
+                )
+            broadcast_rate = self.settings.broadcast_rate_per_second
+            if priority == BROADCAST and broadcast_rate > 0:
+                self._broadcast_ready = now + 1 / broadcast_rate
+            return waiter, None
+        return None, delay
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        self._chat_ready = {
+            chat_id: ready_at
+            for chat_id, ready_at in self._chat_ready.items()
+            if ready_at > now
+        }
+
+    async def _run(self) -> None:
+        while True:
+            waiter, delay = self._next()
+            if waiter is not None:
+                waiter.future.set_result(None)
+                continue
+            if len(self._chat_ready) > _PRUNE_THRESHOLD:
+                self._prune()
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+class SendSchedulerMiddleware(BaseRequestMiddleware):
+    """Route message-producing Bot API calls through ``SendScheduler``."""
+
+    def __init__(self, scheduler: SendScheduler):
+        self.scheduler = scheduler
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ):
+        if not method.__api_method__.startswith(GATED_METHODS):
+            return await make_request(bot, method)
+        chat_id = getattr(method, "chat_id", None)
+        priority = current_priority()
+        attempts = max(self.scheduler.settings.retry_attempts, 0)
+        for attempt in range(attempts + 1):
+            with span("telegram.send_queue", priority=PRIORITY_NAMES[priority]):
+                await self.scheduler.acquire(chat_id, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as exc:
+                metrics.inc(
+                    "telegram_retry_after_total", priority=PRIORITY_NAMES[priority]
+                )
+                logger.warning(
+                    "Telegram RetryAfter %ss on %s", exc.retry_after, method.__api_method__
+                )
+                self.scheduler.pause(exc.retry_after)
+                if attempt == attempts:
+                    raise
+
+
+_scheduler: SendScheduler | None = None
+
+
+def get_send_scheduler() -> SendScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = SendScheduler(get_send_settings())
+    return _scheduler
+
+
+def _collect():
+    if _scheduler is None:
+        return
+    for priority, name in PRIORITY_NAMES.items():
+        yield "send_queue_depth", {"priority": name}, _scheduler.depth(priority)
+    yield "send_tokens_available", {}, _scheduler.tokens
+
+
+metrics.register_collector(_collect)
@@ -1,13 +1,19 @@
 from __future__ import annotations
 
 import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
 import psycopg2
 import redis
 
-from app.config import get_database_url, get_redis_url
+from app.config import get_database_url, get_preflight_timeout, get_redis_url
 from app.config import get_xui_settings
 from app.services.xui_client import XuiClient
 
+logger = logging.getLogger(__name__)
+
 
 def _check_db() -> None:
     dsn = get_database_url()
@@ -51,8 +57,38 @@ async def _check_xui_optional(country: str) -> None:
         await xui.close()
 
 
+async def _timed_check(
+    name: str, check: Callable[[], Awaitable[None]], timeout: float
+) -> tuple[str, float, BaseException | None]:
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(check(), timeout)
+        error = None
+    except asyncio.TimeoutError:
+        error = TimeoutError(f"{name} check timed out after {timeout:.1f}s")
+    except Exception as exc:
+        error = exc
+    return name, time.perf_counter() - started, error
+
+
 async def run_preflight() -> None:
-    await asyncio.to_thread(_check_db)
-    await asyncio.to_thread(_check_redis)
-    await _check_xui()
-    await _check_xui_optional("nl")
+    timeout = get_preflight_timeout()
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        _timed_check("db", lambda: asyncio.to_thread(_check_db), timeout),
+        _timed_check("redis", lambda: asyncio.to_thread(_check_redis), timeout),
+        _timed_check("xui", _check_xui, timeout),
+        _timed_check("xui_nl", lambda: _check_xui_optional("nl"), timeout),
+    )
+    report = " ".join(
+        f"{name}={elapsed * 1000:.0f}ms{'' if error is None else '(failed)'}"
+        for name, elapsed, error in results
+    )
+    logger.info(
+        "Preflight finished in %.0fms: %s",
+        (time.perf_counter() - started) * 1000,
+        report,
+    )
+    for name, _, error in results:
+        if error is not None:
+            raise RuntimeError(f"Preflight check '{name}' failed: {error}") from error
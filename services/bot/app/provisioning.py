@@ -0,0 +1,228 @@
+"""Durable background provisioning of XUI clients for trial and paid orders."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from aiogram import Bot
+from aiogram.types import FSInputFile
+
+from app.config import get_provisioning_settings, get_server_settings
+from app.keyboards.menu import main_menu_keyboard
+from app.outbound import TRANSACTIONAL, send_priority
+from app.services.xui_client import create_xui_client
+from app.storage import (
+    claim_provisioning_jobs,
+    credit_balance,
+    finish_provisioning_job,
+    mark_trial_used,
+    reclaim_exhausted_provisioning_jobs,
+    record_first_payment,
+    retry_provisioning_job,
+    set_provisioning_job_end_at,
+    set_subscription,
+)
+from app.tracing import start_trace
+from app.vpn_instructions import vpn_instructions
+
+logger = logging.getLogger(__name__)
+
+LINK_IMAGE = Path(__file__).resolve().parents[1] / "img" / "link.png"
+
+_wakeup: asyncio.Event | None = None
+
+
+class PermanentProvisioningError(RuntimeError):
+    pass
+
+
+def wake_workers() -> None:
+    """Let in-process workers pick up a freshly queued job without polling."""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def _retry_delay(attempts: int, base: float, cap: float) -> float:
+    return min(cap, base * 2 ** max(attempts - 1, 0))
+
+
+async def _provision(job: dict) -> tuple[str, datetime]:
+    """Create the job's client, or extend the one the user already has.
+
+    Returns the subscription link and the end date to store.
+    """
+    xui = create_xui_client(get_server_settings(job["server"], job["country"]))
+    try:
+        await xui.login()
+        client = next(
+            (c for c in await xui.list_clients() if c.get("email") == job["email"]),
+            None,
+        )
+        if client is None:
+            await xui.add_client(
+                email=job["email"], days=job["days"], sub_id=job["sub_id"]
+            )
+            end_at = datetime.now(timezone.utc) + timedelta(days=job["days"])
+            return xui.subscription_link(job["sub_id"]), end_at
+        sub_id = client.get("subId") or client.get("sub_id")
+        if not sub_id:
+            raise PermanentProvisioningError("panel client has no subId")
+        if sub_id == job["sub_id"]:
+            logger.info("Provisioning job %s already applied on panel", job["id"])
+            end_at = datetime.now(timezone.utc) + timedelta(days=job["days"])
+            return xui.subscription_link(sub_id), end_at
+        # A returning user: renew their client instead of creating a second
+        # one under the same email. The target expiry is stored before the
+        # panel write so a retry sets the same date instead of adding twice.
+        end_at = job.get("end_at")
+        if end_at is None:
+            expiry = int(client.get("expiryTime") or 0)
+            base = datetime.now(timezone.utc)
+            if expiry > base.timestamp() * 1000:
+                base = datetime.fromtimestamp(expiry / 1000, tz=timezone.utc)
+            end_at = base + timedelta(days=job["days"])
+            set_provisioning_job_end_at(job["id"], end_at)
+        await xui.update_client(
+            dict(client, expiryTime=int(end_at.timestamp() * 1000), enable=True)
+        )
+        logger.info("Provisioning job %s renewed existing client", job["id"])
+        return xui.subscription_link(sub_id), end_at
+    finally:
+        await xui.close()
+
+
+async def _send_link(bot: Bot, tg_id: int, instructions: str) -> None:
+    if LINK_IMAGE.exists():
+        await bot.send_photo(
+            tg_id,
+            FSInputFile(str(LINK_IMAGE)),
+            caption=instructions,
+            reply_markup=main_menu_keyboard(),
+        )
+    else:
+        await bot.send_message(
+            tg_id,
+            instructions,
+            reply_markup=main_menu_keyboard(),
+            disable_web_page_preview=True,
+        )
+
+
+async def _complete(bot: Bot, job: dict, sub_link: str, end_at: datetime) -> None:
+    tg_id = job["tg_id"]
+    instructions = vpn_instructions(sub_link)
+    start_at = datetime.now(timezone.utc)
+    set_subscription(
+        tg_id,
+        start_at,
+        end_at,
+        sub_link,
+        instructions,
+        job["country"],
+        server=job["server"],
+    )
+    if job["kind"] == "trial":
+        mark_trial_used(tg_id)
+    if job["kind"] == "paid" and record_first_payment(tg_id, job["amount"]):
+        logger.info("Referral reward credited for tg_id=%s", tg_id)
+    finish_provisioning_job(job["id"], "done")
+    try:
+        await _send_link(bot, tg_id, instructions)
+        if job["kind"] == "trial":
+            await bot.send_message(
+                tg_id,
+                f"🎉 Пробный период на {job['days']} дня активирован.",
+                reply_markup=main_menu_keyboard(),
+            )
+    except Exception:
+        logger.exception("Provisioning link send failed for tg_id=%s", tg_id)
+
+
+async def _fail(bot: Bot, job: dict, error: str) -> None:
+    tg_id = job["tg_id"]
+    if job["amount"] > 0:
+        credit_balance(
+            tg_id, job["amount"], "refund", f"refund:{job['idempotency_key']}"
+        )
+    finish_provisioning_job(job["id"], "failed", error)
+    logger.error("Provisioning job %s failed for tg_id=%s: %s", job["id"], tg_id, error)
+    text = "⚠️ Не удалось активировать подписку. Попробуйте позже или напишите в поддержку."
+    if job["amount"] > 0:
+        text += "\nСредства возвращены на баланс."
+    try:
+        await bot.send_message(tg_id, text, reply_markup=main_menu_keyboard())
+    except Exception:
+        logger.exception("Provisioning failure notice failed for tg_id=%s", tg_id)
+
+
+async def process_job(bot: Bot, job: dict) -> None:
+    settings = get_provisioning_settings()
+    with start_trace("provisioning.job", job_id=job["id"], kind=job["kind"]):
+        try:
+            sub_link, end_at = await _provision(job)
+            await _complete(bot, job, sub_link, end_at)
+        except PermanentProvisioningError as exc:
+            await _fail(bot, job, str(exc))
+        except Exception as exc:
+            # Panel, SQLite and Postgres errors alike: a job must never be left
+            # 'running', where only the stale reclaim would find it again.
+            error = f"{type(exc).__name__}: {exc}"
+            if job["attempts"] >= settings.max_attempts:
+                await _fail(bot, job, error)
+                return
+            delay = _retry_delay(
+                job["attempts"], settings.retry_base_seconds, settings.retry_max_seconds
+            )
+            retry_provisioning_job(job["id"], error, delay)
+            logger.warning(
+                "Provisioning job %s attempt %s failed, retry in %.0fs: %s",
+                job["id"],
+                job["attempts"],
+                delay,
+                error,
+            )
+
+
+async def _fail_exhausted(bot: Bot, max_attempts: int) -> None:
+    for job in reclaim_exhausted_provisioning_jobs(1, max_attempts):
+        await _fail(bot, job, "worker stopped during the last attempt")
+
+
+async def _worker(
+    bot: Bot, wakeup: asyncio.Event, poll_interval: float, max_attempts: int
+) -> None:
+    while True:
+        try:
+            await _fail_exhausted(bot, max_attempts)
+            jobs = claim_provisioning_jobs(1, max_attempts)
+        except Exception:
+            logger.exception("Provisioning claim failed")
+            jobs = []
+        if not jobs:
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        for job in jobs:
+            try:
+                await process_job(bot, job)
+            except Exception:
+                logger.exception("Provisioning job %s crashed", job["id"])
+
+
+async def run_provisioning_workers(bot: Bot) -> None:
+    global _wakeup
+    settings = get_provisioning_settings()
+    _wakeup = asyncio.Event()
+    with send_priority(TRANSACTIONAL):
+        await asyncio.gather(
+            *(
+                _worker(bot, _wakeup, settings.poll_interval, settings.max_attempts)
+                for _ in range(settings.workers)
+            )
+        )
@@ -0,0 +1,120 @@
+"""Per-dependency circuit breakers with half-open probing."""
+
+from __future__ import annotations
+
+import threading
+import time
+
+from app import metrics
+from app.config import BreakerSettings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failed or slow calls.
+
+    While open every call is rejected until ``cooldown_seconds`` pass; then up
+    to ``half_open_probes`` calls are let through and the first result decides
+    whether the breaker closes or opens again.
+    """
+
+    def __init__(self, name: str, settings: BreakerSettings):
+        self.name = name
+        self.settings = settings
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.settings.cooldown_seconds:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self.probes_in_flight = 0
+            if self.state == HALF_OPEN:
+                if self.probes_in_flight >= self.settings.half_open_probes:
+                    self.rejected += 1
+                    return False
+                self.probes_in_flight += 1
+            self.calls += 1
+            return True
+
+    def check(self) -> None:
+        if not self.allow():
+            raise CircuitOpenError(f"circuit '{self.name}' is open")
+
+    def record(self, duration: float, ok: bool) -> None:
+        slow = duration >= self.settings.slow_call_seconds
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.probes_in_flight = max(self.probes_in_flight - 1, 0)
+            if slow:
+                self.slow_calls += 1
+            if ok and not slow:
+                self.consecutive_failures = 0
+                self.state = CLOSED
+                return
+            if not ok:
+                self.failures += 1
+            self.consecutive_failures += 1
+            if (
+                self.state == HALF_OPEN
+                or self.consecutive_failures >= self.settings.failure_threshold
+            ):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "calls": self.calls,
+            "failures": self.failures,
+            "slow_calls": self.slow_calls,
+            "rejected": self.rejected,
+        }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str, settings: BreakerSettings) -> CircuitBreaker:
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name, settings)
+    return breaker
+
+
+def breaker_snapshots() -> list[dict]:
+    return [breaker.snapshot() for breaker in _breakers.values()]
+
+
+def _collect():
+    for breaker in _breakers.values():
+        labels = {"breaker": breaker.name}
+        yield "circuit_breaker_state", labels, _STATE_VALUES[breaker.state]
+        yield "circuit_breaker_calls_total", labels, breaker.calls
+        yield "circuit_breaker_failures_total", labels, breaker.failures
+        yield "circuit_breaker_slow_calls_total", labels, breaker.slow_calls
+        yield "circuit_breaker_rejected_total", labels, breaker.rejected
+
+
+metrics.register_collector(_collect)
@@ -0,0 +1,61 @@
+"""Minimal Crypto Pay API client (https://help.crypt.bot/crypto-pay-api)."""
+
+from __future__ import annotations
+
+from typing import Any
+
+import httpx
+
+from app.config import PaymentSettings
+from app.tracing import span
+
+
+class CryptoBotError(RuntimeError):
+    pass
+
+
+class CryptoBotClient:
+    def __init__(self, token: str, api_url: str):
+        self._client = httpx.AsyncClient(
+            base_url=api_url,
+            headers={"Crypto-Pay-API-Token": token},
+            timeout=httpx.Timeout(10.0, connect=5.0),
+        )
+
+    @classmethod
+    def from_settings(cls, settings: PaymentSettings) -> "CryptoBotClient":
+        if not settings.cryptobot_token:
+            raise RuntimeError("CRYPTOBOT_TOKEN is not set")
+        return cls(settings.cryptobot_token, settings.cryptobot_api_url)
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    async def _call(self, method: str, **params: Any) -> Any:
+        with span(f"cryptobot.{method}"):
+            response = await self._client.post(f"/{method}", json=params)
+        response.raise_for_status()
+        data = response.json()
+        if not data.get("ok"):
+            raise CryptoBotError(f"{method} failed: {data.get('error')}")
+        return data["result"]
+
+    async def create_invoice(
+        self, amount: int, description: str, payload: str, expires_in: int
+    ) -> dict:
+        return await self._call(
+            "createInvoice",
+            currency_type="fiat",
+            fiat="RUB",
+            amount=str(amount),
+            description=description,
+            payload=payload,
+            expires_in=expires_in,
+        )
+
+    async def get_invoices(self, invoice_ids: list[str]) -> list[dict]:
+        """Current state of up to 1000 invoices in one request."""
+        result = await self._call(
+            "getInvoices", invoice_ids=",".join(invoice_ids), count=len(invoice_ids)
+        )
+        return result.get("items", [])
@@ -0,0 +1,167 @@
+"""Least-loaded placement of new subscriptions across the panel pool.
+
+``refresh_server_loads`` polls every pool server once per interval and keeps
+its active/online client counts in Redis. ``choose_server`` only reads that
+cache, so picking a server never adds a panel round trip to a user update.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+import redis
+
+from app import metrics
+from app.config import (
+    XuiSettings,
+    get_server_settings,
+    get_xui_pool,
+    get_xui_settings,
+)
+from app.services.circuit_breaker import OPEN
+from app.services.redis_client import get_redis
+from app.services.xui_client import create_xui_client, panel_breaker
+from app.storage import fetch_last_server, fetch_server_traffic
+
+logger = logging.getLogger(__name__)
+
+LOAD_TTL_SECONDS = 180
+
+
+def _redis() -> redis.Redis:
+    return get_redis()
+
+
+def _load_key(name: str) -> str:
+    return f"placement:load:{name}"
+
+
+def _is_active(client: dict, now_ms: float) -> bool:
+    if not client.get("enable", True):
+        return False
+    expiry = int(client.get("expiryTime") or 0)
+    # Zero means "never expires", negative means "starts on first connect".
+    return expiry <= 0 or expiry > now_ms
+
+
+async def _measure(server: XuiSettings) -> dict[str, int]:
+    xui = create_xui_client(server)
+    try:
+        await xui.login()
+        clients = await xui.list_clients()
+        online = set(await xui.online_emails())
+    finally:
+        await xui.close()
+    now_ms = time.time() * 1000
+    emails = {client.get("email") for client in clients if _is_active(client, now_ms)}
+    return {
+        "active": len(emails),
+        "online": len(emails & online),
+        "capacity": server.capacity,
+    }
+
+
+async def refresh_server_loads() -> dict[str, dict[str, int]]:
+    """Poll every pool server and cache its load for ``choose_server``."""
+    servers = get_xui_pool()
+    results = await asyncio.gather(
+        *(_measure(server) for server in servers), return_exceptions=True
+    )
+    since = datetime.now(timezone.utc) - timedelta(hours=1)
+    try:
+        traffic = await asyncio.to_thread(fetch_server_traffic, since)
+    except psycopg2.Error:
+        logger.warning("Placement traffic read failed")
+        traffic = {}
+    loads: dict[str, dict[str, int]] = {}
+    pipe = _redis().pipeline(transaction=False)
+    for server, result in zip(servers, results):
+        if isinstance(result, BaseException):
+            logger.warning("Load refresh failed for server %s: %s", server.name, result)
+            continue
+        result["traffic"] = traffic.get(server.name, 0)
+        loads[server.name] = result
+        key = _load_key(server.name)
+        pipe.delete(key)
+        pipe.hset(key, mapping=result)
+        pipe.expire(key, LOAD_TTL_SECONDS)
+        labels = {"server": server.name}
+        metrics.set_gauge("placement_active_clients", result["active"], **labels)
+        metrics.set_gauge("placement_online_clients", result["online"], **labels)
+        metrics.set_gauge("placement_capacity", server.capacity, **labels)
+    try:
+        await asyncio.to_thread(pipe.execute)
+    except redis.RedisError:
+        logger.warning("Placement load cache write failed")
+    return loads
+
+
+def cached_server_loads(servers: list[XuiSettings]) -> list[dict[str, str]]:
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        for server in servers:
+            pipe.hgetall(_load_key(server.name))
+        return pipe.execute()
+    except redis.RedisError:
+        return [{} for _ in servers]
+
+
+def choose_server(country: str, tg_id: int | None = None) -> XuiSettings:
+    """Pool server of ``country`` with the lowest active/capacity ratio.
+
+    A user who already had a subscription in ``country`` stays on its server:
+    their panel client (possibly expired or disabled) lives there, and
+    placing them elsewhere would create a second client under the same
+    email. Otherwise ties go to the server that moved less traffic in the
+    last hour (from ``traffic_stats``). Servers whose panel circuit is open
+    are skipped. Servers without a cached load are used only when nothing is
+    known, weighted by capacity. The chosen server's cached count is bumped
+    so the next placements before the refresh spread out instead of piling
+    onto the same inbound.
+    """
+    servers = [server for server in get_xui_pool() if server.country == country]
+    if not servers:
+        return get_xui_settings(country)
+    if tg_id is not None:
+        found, name = fetch_last_server(tg_id, country)
+        if found:
+            pinned = get_server_settings(name, country)
+            metrics.inc(
+                "placement_decisions_total", server=pinned.name, reason="pinned"
+            )
+            return pinned
+    candidates = [
+        server for server in servers if panel_breaker(server.base_url).state != OPEN
+    ] or servers
+    if len(candidates) == 1:
+        chosen = candidates[0]
+    else:
+        loads = cached_server_loads(candidates)
+        known = [
+            (
+                int(load["active"]) / max(server.capacity, 1),
+                int(load.get("traffic") or 0),
+                -server.capacity,
+                server,
+            )
+            for server, load in zip(candidates, loads)
+            if load
+        ]
+        if known:
+            chosen = min(known, key=lambda item: item[:3])[3]
+        else:
+            weights = [max(server.capacity, 1) for server in candidates]
+            chosen = random.choices(candidates, weights=weights)[0]
+        try:
+            client = _redis()
+            if client.exists(_load_key(chosen.name)):
+                client.hincrby(_load_key(chosen.name), "active", 1)
+        except redis.RedisError:
+            pass
+    metrics.inc("placement_decisions_total", server=chosen.name, reason="load")
+    return chosen
@@ -0,0 +1,172 @@
+"""Scheduled two-way reconciliation of panel clients with ``subscriptions``.
+
+Each pass lists every pool server once, diffs the listing against the
+database in bulk (see ``reconcile_panel_clients``) and fixes drift: the later
+end date wins on either side, subscriptions whose client is gone from the
+panel are archived, and expired clients are disabled or, after
+``remove_after_days``, removed. A server that passed cleanly is marked fresh
+in Redis, and while the mark lives the cabinet answers from the database
+cache instead of asking the panel on every view.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+import httpx
+import redis
+
+from app import metrics
+from app.config import (
+    ReconcileSettings,
+    XuiSettings,
+    get_reconcile_settings,
+    get_server_settings,
+    get_xui_pool,
+)
+from app.services.redis_client import get_redis
+from app.services.xui_client import create_xui_client
+from app.storage import reconcile_panel_clients
+
+logger = logging.getLogger(__name__)
+
+_DAY_MS = 86_400_000
+
+
+def _fresh_key(name: str) -> str:
+    return f"reconcile:fresh:{name}"
+
+
+def _sub_id(client: dict) -> str | None:
+    sub_id = client.get("subId") or client.get("sub_id")
+    return str(sub_id) if sub_id else None
+
+
+def _end_at(client: dict) -> datetime | None:
+    expiry = int(client.get("expiryTime") or 0)
+    # Zero never expires, negative starts counting on first connect.
+    if expiry <= 0:
+        return None
+    return datetime.fromtimestamp(expiry / 1000, tz=timezone.utc)
+
+
+def is_panel_reconciled(server: str | None, country: str) -> bool:
+    """Whether the user's panel passed reconciliation within the last intervals."""
+    try:
+        name = get_server_settings(server, country).name
+        return bool(get_redis().exists(_fresh_key(name)))
+    except (RuntimeError, redis.RedisError):
+        return False
+
+
+async def reconcile_server(
+    server: XuiSettings, settings: ReconcileSettings
+) -> dict[str, int]:
+    counts = {"pulled": 0, "archived": 0, "pushed": 0, "disabled": 0, "removed": 0}
+    failed = 0
+    xui = create_xui_client(server)
+    try:
+        await xui.login()
+        listed_at = datetime.now(timezone.utc)
+        clients = await xui.list_clients()
+        if not clients:
+            # An empty listing is more likely a wrong inbound than a panel
+            # without users; never archive every subscription because of it.
+            logger.warning("Reconcile skipped for %s: no clients listed", server.name)
+            return counts
+        by_sub_id = {_sub_id(client): client for client in clients if _sub_id(client)}
+        unassigned = get_server_settings(None, server.country).name == server.name
+        diff = await asyncio.to_thread(
+            reconcile_panel_clients,
+            server.name,
+            server.country,
+            unassigned,
+            [(sub_id, _end_at(client)) for sub_id, client in by_sub_id.items()],
+            listed_at,
+            settings.batch_size,
+        )
+        counts["pulled"] = diff.pulled
+        counts["archived"] = diff.removed
+
+        # Panel writes go one client per call, so a pass caps them and leaves
+        # the rest for the next one.
+        writes: list[tuple[str, dict]] = [
+            (
+                "pushed",
+                dict(
+                    by_sub_id[sub_id],
+                    expiryTime=int(end_at.timestamp() * 1000),
+                    enable=True,
+                ),
+            )
+            for sub_id, end_at in diff.push
+        ]
+        pushed = {sub_id for sub_id, _ in diff.push}
+        now_ms = time.time() * 1000
+        remove_before = now_ms - settings.remove_after_days * _DAY_MS
+        for client in clients:
+            expiry = int(client.get("expiryTime") or 0)
+            if _sub_id(client) in pushed or expiry <= 0 or expiry > now_ms:
+                continue
+            if settings.remove_after_days > 0 and expiry < remove_before:
+                writes.append(("removed", client))
+            elif settings.disable_expired and client.get("enable", True):
+                writes.append(("disabled", dict(client, enable=False)))
+        for action, client in writes[: settings.max_panel_writes]:
+            try:
+                if action == "removed":
+                    await xui.delete_client(client)
+                else:
+                    await xui.update_client(client)
+                counts[action] += 1
+            except (httpx.HTTPError, RuntimeError) as exc:
+                failed += 1
+                logger.warning(
+                    "Reconcile %s failed on %s for %s: %s",
+                    action,
+                    server.name,
+                    client.get("email"),
+                    exc,
+                )
+    finally:
+        await xui.close()
+    # Writes over the cap still differ from the DB, so only a pass that ran
+    # every planned write makes the server fresh.
+    if not failed and len(writes) <= settings.max_panel_writes:
+        try:
+            get_redis().setex(
+                _fresh_key(server.name), settings.interval_seconds * 2, int(time.time())
+            )
+        except redis.RedisError:
+            logger.warning("Reconcile freshness mark failed for %s", server.name)
+    return counts
+
+
+async def run_reconciliation() -> dict[str, dict[str, int]]:
+    """Reconcile every pool server concurrently; returns counts per server."""
+    started = time.perf_counter()
+    settings = get_reconcile_settings()
+    servers = get_xui_pool()
+    results = await asyncio.gather(
+        *(reconcile_server(server, settings) for server in servers),
+        return_exceptions=True,
+    )
+    summary: dict[str, dict[str, int]] = {}
+    for server, result in zip(servers, results):
+        if isinstance(result, BaseException):
+            logger.warning("Reconcile failed for server %s: %s", server.name, result)
+            metrics.inc("reconcile_errors_total", server=server.name)
+            continue
+        summary[server.name] = result
+        for action, count in result.items():
+            if count:
+                metrics.inc(
+                    "reconcile_fixes_total", count, server=server.name, action=action
+                )
+    elapsed = time.perf_counter() - started
+    metrics.observe("reconcile_seconds", elapsed)
+    logger.info("Reconcile pass in %.2fs: %s", elapsed, summary)
+    return summary
@@ -0,0 +1,118 @@
+"""The bot's shared Redis client.
+
+One bounded connection pool with socket timeouts and a short retry on
+connection errors replaces the per-call ``Redis.from_url`` clients. Every
+command and pipeline goes through the ``redis`` circuit breaker: after
+repeated connection errors or slow calls, commands fail fast with
+``RedisUnavailableError`` (a ``redis.ConnectionError``) for the cool-down.
+Callers already treat ``redis.RedisError`` as a cache miss, so the bot keeps
+working from Postgres while Redis is degraded.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+import redis
+from redis.backoff import ExponentialBackoff
+from redis.client import Pipeline
+from redis.retry import Retry
+
+from app import metrics
+from app.config import RedisSettings, get_redis_settings
+from app.services.circuit_breaker import CircuitBreaker, get_breaker
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Errors that say Redis itself is unhealthy; anything else (WRONGTYPE, a
+# script error, ...) is the caller's problem and does not trip the breaker.
+_UNHEALTHY = (redis.ConnectionError, redis.TimeoutError)
+
+
+class RedisUnavailableError(redis.ConnectionError):
+    pass
+
+
+def _guarded(breaker: CircuitBreaker, command: str, call, *args, **kwargs):
+    if not breaker.allow():
+        metrics.inc("redis_degraded_total", command=command)
+        raise RedisUnavailableError("redis circuit is open")
+    started = time.monotonic()
+    ok = False
+    try:
+        result = call(*args, **kwargs)
+        ok = True
+        return result
+    except _UNHEALTHY:
+        metrics.inc("redis_errors_total", command=command)
+        raise
+    except redis.RedisError:
+        ok = True
+        metrics.inc("redis_errors_total", command=command)
+        raise
+    finally:
+        duration = time.monotonic() - started
+        breaker.record(duration, ok)
+        metrics.observe(
+            "redis_command_seconds", duration, buckets=LATENCY_BUCKETS, command=command
+        )
+
+
+class GuardedPipeline(Pipeline):
+    breaker: CircuitBreaker
+
+    def execute(self, raise_on_error: bool = True):
+        if not self.command_stack:
+            return []
+        return _guarded(
+            self.breaker, "pipeline", super().execute, raise_on_error=raise_on_error
+        )
+
+
+class GuardedRedis(redis.Redis):
+    breaker: CircuitBreaker
+
+    def execute_command(self, *args, **options):
+        command = str(args[0]).lower() if args else "unknown"
+        return _guarded(
+            self.breaker, command, super().execute_command, *args, **options
+        )
+
+    def pipeline(self, transaction=True, shard_hint=None) -> GuardedPipeline:
+        pipe = GuardedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+        pipe.breaker = self.breaker
+        return pipe
+
+
+def create_redis(settings: RedisSettings) -> GuardedRedis:
+    pool = redis.BlockingConnectionPool.from_url(
+        settings.url,
+        max_connections=settings.max_connections,
+        timeout=settings.pool_timeout,
+        socket_timeout=settings.socket_timeout,
+        socket_connect_timeout=settings.connect_timeout,
+        health_check_interval=30,
+        decode_responses=True,
+        retry=Retry(ExponentialBackoff(cap=0.2, base=0.02), settings.retries),
+        retry_on_error=[redis.ConnectionError, redis.TimeoutError],
+    )
+    client = GuardedRedis(connection_pool=pool)
+    client.breaker = get_breaker("redis", settings.breaker)
+    return client
+
+
+_client: GuardedRedis | None = None
+_client_lock = threading.Lock()
+
+
+def get_redis() -> GuardedRedis:
+    """The process-wide client; safe to use from worker threads."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_redis(get_redis_settings())
+    return _client
@@ -0,0 +1,129 @@
+"""Routing of read-only queries to Postgres streaming replicas.
+
+A replica is used only while its replay lag is under ``max_lag_seconds``;
+the lag is re-checked at most every ``check_seconds`` per replica. After a
+write for a user, that user's reads stay on the primary for
+``sticky_seconds`` so they always see their own change (read-your-writes).
+Anything unexpected — no replicas, all lagging, a failed connect — falls back
+to the primary.
+"""
+
+from __future__ import annotations
+
+import itertools
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import psycopg2
+
+from app import metrics
+from app.config import ReplicaSettings, get_replica_settings
+
+logger = logging.getLogger(__name__)
+
+# NULL (unusable) unless the standby is streaming from the primary: a
+# disconnected standby has replayed everything it received too, so the LSN
+# check alone would report it as fresh. ``status`` is NULL for roles without
+# pg_read_all_stats; the receiver row existing is then the only signal.
+# Zero when the replica has replayed everything it received, otherwise the
+# age of the last replayed transaction.
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN NULL
+        WHEN NOT EXISTS (
+            SELECT 1 FROM pg_stat_wal_receiver
+            WHERE COALESCE(status, 'streaming') = 'streaming'
+        ) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+_PRUNE_THRESHOLD = 10_000
+
+
+def replica_name(dsn: str) -> str:
+    parsed = urlsplit(dsn)
+    return parsed.netloc.rsplit("@", 1)[-1] or dsn
+
+
+class ReplicaRouter:
+    def __init__(self, settings: ReplicaSettings):
+        self.settings = settings
+        self._checked: dict[str, tuple[float, bool]] = {}
+        self._writes: dict[int, float] = {}
+        self._order = itertools.cycle(settings.urls) if settings.urls else None
+        self._lock = threading.Lock()
+
+    def note_write(self, tg_id: int) -> None:
+        if not self.settings.urls:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if len(self._writes) > _PRUNE_THRESHOLD:
+                sticky = self.settings.sticky_seconds
+                self._writes = {
+                    key: at for key, at in self._writes.items() if now - at < sticky
+                }
+            self._writes[tg_id] = now
+
+    def _wrote_recently(self, tg_id: int) -> bool:
+        at = self._writes.get(tg_id)
+        return at is not None and time.monotonic() - at < self.settings.sticky_seconds
+
+    def _measure_lag(self, dsn: str) -> float | None:
+        conn = psycopg2.connect(dsn, connect_timeout=2)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(LAG_QUERY)
+                lag = cur.fetchone()[0]
+        finally:
+            conn.close()
+        return None if lag is None else float(lag)
+
+    def _is_usable(self, dsn: str) -> bool:
+        now = time.monotonic()
+        checked = self._checked.get(dsn)
+        if checked and now - checked[0] < self.settings.check_seconds:
+            return checked[1]
+        try:
+            lag = self._measure_lag(dsn)
+        except psycopg2.Error as exc:
+            logger.warning("Replica %s unavailable: %s", replica_name(dsn), exc)
+            lag = None
+        usable = lag is not None and lag <= self.settings.max_lag_seconds
+        if lag is not None:
+            metrics.set_gauge("db_replica_lag_seconds", lag, replica=replica_name(dsn))
+        self._checked[dsn] = (now, usable)
+        return usable
+
+    def mark_failed(self, dsn: str) -> None:
+        self._checked[dsn] = (time.monotonic(), False)
+
+    def read_dsn(self, tg_id: int | None = None) -> str | None:
+        """A replica DSN for a read, or ``None`` to read from the primary."""
+        if self._order is None:
+            return None
+        if tg_id is not None and self._wrote_recently(tg_id):
+            metrics.inc("db_reads_total", target="primary", reason="recent_write")
+            return None
+        for _ in range(len(self.settings.urls)):
+            with self._lock:
+                dsn = next(self._order)
+            if self._is_usable(dsn):
+                metrics.inc("db_reads_total", target="replica")
+                return dsn
+        metrics.inc("db_reads_total", target="primary", reason="no_replica")
+        return None
+
+
+_router: ReplicaRouter | None = None
+
+
+def get_replica_router() -> ReplicaRouter:
+    global _router
+    if _router is None:
+        _router = ReplicaRouter(get_replica_settings())
+    return _router
@@ -0,0 +1,89 @@
+"""Periodic pull of per-client traffic counters from every pool panel."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from app import metrics
+from app.config import XuiSettings, get_traffic_bucket_minutes, get_xui_pool
+from app.services.xui_client import create_xui_client
+from app.storage import record_traffic_counters
+
+logger = logging.getLogger(__name__)
+
+
+def traffic_bucket(now: datetime, minutes: int) -> datetime:
+    """Start of the ``minutes``-wide bucket containing ``now``."""
+    step = minutes * 60
+    return datetime.fromtimestamp(int(now.timestamp()) // step * step, tz=timezone.utc)
+
+
+def _from_ms(value: int) -> datetime | None:
+    if not value or value <= 0:
+        return None
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+
+async def _collect(server: XuiSettings) -> list[tuple[str, int, int, datetime | None]]:
+    xui = create_xui_client(server)
+    try:
+        await xui.login()
+        stats = await xui.client_stats()
+        try:
+            last_online = await xui.last_online()
+        except (httpx.HTTPError, RuntimeError):
+            last_online = {}
+    finally:
+        await xui.close()
+    rows: dict[str, tuple[str, int, int, datetime | None]] = {}
+    for item in stats:
+        email = item.get("email")
+        if not email:
+            continue
+        seen = last_online.get(email) or item.get("lastOnline") or 0
+        rows[email] = (
+            email,
+            int(item.get("up") or 0),
+            int(item.get("down") or 0),
+            _from_ms(int(seen)),
+        )
+    return list(rows.values())
+
+
+async def sync_traffic_stats() -> int:
+    """Collect every pool server concurrently and store the deltas.
+
+    Returns the number of ``traffic_stats`` rows written or updated.
+    """
+    started = time.perf_counter()
+    bucket = traffic_bucket(datetime.now(timezone.utc), get_traffic_bucket_minutes())
+    servers = get_xui_pool()
+    results = await asyncio.gather(
+        *(_collect(server) for server in servers), return_exceptions=True
+    )
+    written = 0
+    clients = 0
+    for server, rows in zip(servers, results):
+        if isinstance(rows, BaseException):
+            logger.warning("Traffic sync failed for server %s: %s", server.name, rows)
+            metrics.inc("traffic_sync_errors_total", server=server.name)
+            continue
+        clients += len(rows)
+        written += await asyncio.to_thread(
+            record_traffic_counters, server.name, bucket, rows
+        )
+    elapsed = time.perf_counter() - started
+    metrics.observe("traffic_sync_seconds", elapsed)
+    logger.info(
+        "Traffic sync: %s servers, %s clients, %s rows in %.2fs",
+        len(servers),
+        clients,
+        written,
+        elapsed,
+    )
+    return written
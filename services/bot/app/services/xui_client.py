@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import json
+import time
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from urllib.parse import urlsplit
@@ -8,7 +9,17 @@ from uuid import uuid4
 
 import httpx
 
-from app.config import get_xui_settings
+from app.config import (
+    get_xui_batch_size,
+    get_xui_breaker_settings,
+    get_xui_settings,
+)
+from app.services.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    get_breaker,
+)
+from app.tracing import span
 
 
 @dataclass
@@ -20,6 +31,71 @@ class XuiConfig:
     password: str
     inbound_id: int
 
+    @classmethod
+    def from_settings(cls, settings) -> "XuiConfig":
+        base_url = settings.base_url
+        parsed = urlsplit(base_url)
+        base_path = parsed.path.rstrip("/")
+        if parsed.scheme and parsed.netloc:
+            base_url = f"{parsed.scheme}://{parsed.netloc}"
+        return cls(
+            base_url=base_url.rstrip("/"),
+            base_path=base_path,
+            sub_url=settings.sub_url.rstrip("/") if settings.sub_url else None,
+            username=settings.username,
+            password=settings.password,
+            inbound_id=settings.inbound_id,
+        )
+
+    def subscription_link(self, sub_id: str) -> str:
+        if self.sub_url:
+            return f"{self.sub_url}/sub/{sub_id}"
+        return f"{self.base_url}{self.base_path}/sub/{sub_id}"
+
+
+@dataclass
+class ClientSpec:
+    email: str
+    expire_at: datetime
+    sub_id: str | None = None
+    client_id: str | None = None
+
+    def __post_init__(self) -> None:
+        self.sub_id = self.sub_id or uuid4().hex
+        self.client_id = self.client_id or str(uuid4())
+
+    def to_settings(self) -> dict:
+        return {
+            "id": self.client_id,
+            "email": self.email,
+            "enable": True,
+            "expiryTime": int(self.expire_at.timestamp() * 1000),
+            "totalGB": 0,
+            "limitIp": 0,
+            "subId": self.sub_id,
+        }
+
+
+@dataclass
+class ClientResult:
+    email: str
+    sub_id: str
+    ok: bool
+    error: str | None = None
+
+
+_resolved_paths: dict[tuple[str, str], str] = {}
+
+
+def panel_breaker(base_url: str) -> CircuitBreaker:
+    """The breaker shared by every client talking to the panel at ``base_url``."""
+    return get_breaker(f"xui:{urlsplit(base_url).netloc}", get_xui_breaker_settings())
+
+
+def client_key(client: dict) -> str:
+    """The id the panel addresses a client by; it depends on the protocol."""
+    return str(client.get("id") or client.get("password") or client.get("email"))
+
 
 class XuiClient:
     def __init__(self, config: XuiConfig):
@@ -29,6 +105,7 @@ class XuiClient:
             follow_redirects=True,
             timeout=httpx.Timeout(15.0, connect=10.0),
         )
+        self._breaker = panel_breaker(config.base_url)
 
     @classmethod
     def from_env(cls) -> "XuiClient":
@@ -37,31 +114,29 @@ class XuiClient:
 
     @classmethod
     def from_settings(cls, settings) -> "XuiClient":
-        base_url = settings.base_url
-        username = settings.username
-        password = settings.password
-        inbound_id = settings.inbound_id
-        sub_url = settings.sub_url
-        parsed = urlsplit(base_url)
-        base_path = parsed.path.rstrip("/")
-        if parsed.scheme and parsed.netloc:
-            base_url = f"{parsed.scheme}://{parsed.netloc}"
-        return cls(
-            XuiConfig(
-                base_url=base_url.rstrip("/"),
-                base_path=base_path,
-                sub_url=sub_url.rstrip("/") if sub_url else None,
-                username=username,
-                password=password,
-                inbound_id=inbound_id,
-            )
-        )
+        return cls(XuiConfig.from_settings(settings))
 
     async def close(self) -> None:
         await self._client.aclose()
 
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        endpoint = path[len(self._config.base_path) :]
+        self._breaker.check()
+        started = time.monotonic()
+        ok = False
+        try:
+            with span(f"xui.{method} {endpoint}") as item:
+                response = await self._client.request(method, path, **kwargs)
+                if item is not None:
+                    item.attributes["status"] = response.status_code
+                ok = response.status_code < 500
+                return response
+        finally:
+            self._breaker.record(time.monotonic() - started, ok)
+
     async def login(self) -> None:
-        response = await self._client.post(
+        response = await self._request(
+            "POST",
             f"{self._config.base_path}/login",
             data={"username": self._config.username, "password": self._config.password},
         )
@@ -70,52 +145,122 @@ class XuiClient:
         if not data.get("success"):
             raise RuntimeError("XUI login failed")
 
-    async def add_client(self, email: str, days: int = 30) -> str:
-        expire_at = datetime.utcnow() + timedelta(days=days)
-        expiry_time = int(expire_at.timestamp() * 1000)
-        client_id = str(uuid4())
-        sub_id = uuid4().hex
-        settings = {
-            "clients": [
-                {
-                    "id": client_id,
-                    "email": email,
-                    "enable": True,
-                    "expiryTime": expiry_time,
-                    "totalGB": 0,
-                    "limitIp": 0,
-                    "subId": sub_id,
-                }
-            ]
-        }
-        payload = {"id": self._config.inbound_id, "settings": json.dumps(settings)}
-        paths = [
-            f"{self._config.base_path}/panel/inbound/addClient",
-            f"{self._config.base_path}/panel/inbounds/addClient",
-            f"{self._config.base_path}/api/inbound/addClient",
-            f"{self._config.base_path}/panel/api/inbounds/addClient",
-            f"{self._config.base_path}/panel/api/inbound/addClient",
-        ]
+    async def _post_first(self, paths: list[str], action: str, **kwargs) -> None:
+        """POST to the first of ``paths`` the panel version serves."""
+        cache_key = (self._config.base_url + self._config.base_path, action)
+        known = _resolved_paths.get(cache_key)
+        if known in paths:
+            paths = [known] + [path for path in paths if path != known]
         last_error: str | None = None
         for path in paths:
-            response = await self._client.post(path, data=payload)
+            response = await self._request("POST", path, **kwargs)
             if response.status_code == 404:
                 last_error = f"404 on {path}"
                 continue
+            _resolved_paths[cache_key] = path
             response.raise_for_status()
             data = response.json()
             if not data.get("success"):
-                message = data.get("msg") or "XUI addClient failed"
-                raise RuntimeError(message)
-            return sub_id
-        raise RuntimeError(f"XUI addClient endpoint not found: {last_error}")
+                raise RuntimeError(data.get("msg") or f"XUI {action} failed")
+            return
+        raise RuntimeError(f"XUI {action} endpoint not found: {last_error}")
+
+    async def _post_clients(self, clients: list[dict]) -> None:
+        settings = {"clients": clients}
+        payload = {"id": self._config.inbound_id, "settings": json.dumps(settings)}
+        await self._post_first(
+            [
+                f"{self._config.base_path}/panel/inbound/addClient",
+                f"{self._config.base_path}/panel/inbounds/addClient",
+                f"{self._config.base_path}/api/inbound/addClient",
+                f"{self._config.base_path}/panel/api/inbounds/addClient",
+                f"{self._config.base_path}/panel/api/inbound/addClient",
+            ],
+            "addClient",
+            data=payload,
+        )
+
+    async def add_client(
+        self, email: str, days: int = 30, sub_id: str | None = None
+    ) -> str:
+        expire_at = datetime.utcnow() + timedelta(days=days)
+        spec = ClientSpec(email=email, expire_at=expire_at, sub_id=sub_id)
+        await self._post_clients([spec.to_settings()])
+        return spec.sub_id
+
+    async def add_clients(
+        self, specs: list[ClientSpec], chunk_size: int | None = None
+    ) -> list[ClientResult]:
+        """Create many clients with one addClient call per chunk.
+
+        When the panel rejects a chunk (e.g. a duplicate email), the chunk is
+        split in halves until the failing clients are isolated, so every spec
+        gets its own result.
+        """
+        chunk_size = chunk_size or get_xui_batch_size()
+        results: list[ClientResult] = []
+        for start in range(0, len(specs), chunk_size):
+            results.extend(await self._add_chunk(specs[start : start + chunk_size]))
+        return results
+
+    async def _add_chunk(self, specs: list[ClientSpec]) -> list[ClientResult]:
+        try:
+            await self._post_clients([spec.to_settings() for spec in specs])
+        except (CircuitOpenError, httpx.HTTPError) as exc:
+            # The panel is unreachable, not rejecting clients: splitting would
+            # only fan out more calls that fail the same way.
+            error = f"{type(exc).__name__}: {exc}"
+            return [ClientResult(spec.email, spec.sub_id, False, error) for spec in specs]
+        except RuntimeError as exc:
+            if len(specs) == 1:
+                return [ClientResult(specs[0].email, specs[0].sub_id, False, str(exc))]
+            middle = len(specs) // 2
+            return await self._add_chunk(specs[:middle]) + await self._add_chunk(
+                specs[middle:]
+            )
+        return [ClientResult(spec.email, spec.sub_id, True) for spec in specs]
+
+    async def update_client(self, client: dict) -> None:
+        """Replace one client of the configured inbound with ``client``."""
+        key = client_key(client)
+        payload = {
+            "id": self._config.inbound_id,
+            "settings": json.dumps({"clients": [client]}),
+        }
+        await self._post_first(
+            [
+                f"{self._config.base_path}/panel/api/inbounds/updateClient/{key}",
+                f"{self._config.base_path}/panel/inbound/updateClient/{key}",
+            ],
+            "updateClient",
+            data=payload,
+        )
+
+    async def delete_client(self, client: dict) -> None:
+        key = client_key(client)
+        inbound_id = self._config.inbound_id
+        await self._post_first(
+            [
+                f"{self._config.base_path}/panel/api/inbounds/{inbound_id}/delClient/{key}",
+                f"{self._config.base_path}/panel/inbound/{inbound_id}/delClient/{key}",
+            ],
+            "delClient",
+        )
+
+    async def restart_xray(self) -> None:
+        """Make xray pick up inbound changes written straight to the panel DB."""
+        await self._post_first(
+            [
+                f"{self._config.base_path}/panel/api/server/restartXrayService",
+                f"{self._config.base_path}/server/restartXrayService",
+            ],
+            "restartXrayService",
+        )
 
     def subscription_link(self, sub_id: str) -> str:
-        if self._config.sub_url:
-            return f"{self._config.sub_url}/sub/{sub_id}"
-        return f"{self._config.base_url}{self._config.base_path}/sub/{sub_id}"
+        return self._config.subscription_link(sub_id)
 
-    async def get_client_subscription(self, email: str) -> tuple[str, datetime] | None:
+    async def _list_inbounds(self) -> list[dict]:
         paths = [
             f"{self._config.base_path}/panel/api/inbounds/list",
             f"{self._config.base_path}/panel/api/inbound/list",
@@ -125,7 +270,7 @@ class XuiClient:
         ]
         last_error: str | None = None
         for path in paths:
-            response = await self._client.get(path)
+            response = await self._request("GET", path)
             if response.status_code == 404:
                 last_error = f"404 on {path}"
                 continue
@@ -136,28 +281,79 @@ class XuiClient:
             obj = data.get("obj") or data.get("data") or []
             if isinstance(obj, dict):
                 obj = obj.get("list") or obj.get("items") or []
-            for inbound in obj:
-                if inbound.get("id") != self._config.inbound_id:
-                    continue
-                settings = inbound.get("settings")
-                if isinstance(settings, str):
-                    try:
-                        settings = json.loads(settings)
-                    except json.JSONDecodeError:
-                        settings = None
-                if not isinstance(settings, dict):
-                    continue
-                clients = settings.get("clients", [])
-                for client in clients:
-                    if client.get("email") != email:
-                        continue
-                    sub_id = client.get("subId") or client.get("sub_id")
-                    expiry_time = client.get("expiryTime") or 0
-                    if not sub_id or not expiry_time:
-                        return None
-                    end_at = datetime.fromtimestamp(
-                        int(expiry_time) / 1000, tz=timezone.utc
-                    )
-                    return sub_id, end_at
-            return None
+            return obj
         raise RuntimeError(f"XUI inbounds list endpoint not found: {last_error}")
+
+    async def _own_inbound(self) -> dict | None:
+        for inbound in await self._list_inbounds():
+            if inbound.get("id") == self._config.inbound_id:
+                return inbound
+        return None
+
+    async def list_clients(self) -> list[dict]:
+        """Clients of the configured inbound, as stored in its settings JSON."""
+        inbound = await self._own_inbound()
+        if inbound is not None:
+            settings = inbound.get("settings")
+            if isinstance(settings, str):
+                try:
+                    settings = json.loads(settings)
+                except json.JSONDecodeError:
+                    settings = None
+            if isinstance(settings, dict):
+                return settings.get("clients", [])
+        return []
+
+    async def client_stats(self) -> list[dict]:
+        """Traffic counters (``email``, ``up``, ``down``) of the configured inbound."""
+        inbound = await self._own_inbound()
+        if inbound is None:
+            return []
+        return inbound.get("clientStats") or []
+
+    async def last_online(self) -> dict[str, int]:
+        """Last connection time per email, in epoch milliseconds."""
+        response = await self._request(
+            "POST", f"{self._config.base_path}/panel/api/inbounds/lastOnline"
+        )
+        if response.status_code == 404:
+            return {}
+        response.raise_for_status()
+        data = response.json()
+        if not data.get("success"):
+            raise RuntimeError("XUI lastOnline failed")
+        return dict(data.get("obj") or {})
+
+    async def online_emails(self) -> list[str]:
+        """Emails of clients currently connected to the panel (all inbounds)."""
+        response = await self._request(
+            "POST", f"{self._config.base_path}/panel/api/inbounds/onlines"
+        )
+        if response.status_code == 404:
+            return []
+        response.raise_for_status()
+        data = response.json()
+        if not data.get("success"):
+            raise RuntimeError("XUI onlines failed")
+        return list(data.get("obj") or [])
+
+    async def get_client_subscription(self, email: str) -> tuple[str, datetime] | None:
+        for client in await self.list_clients():
+            if client.get("email") != email:
+                continue
+            sub_id = client.get("subId") or client.get("sub_id")
+            expiry_time = client.get("expiryTime") or 0
+            if not sub_id or not expiry_time:
+                return None
+            end_at = datetime.fromtimestamp(int(expiry_time) / 1000, tz=timezone.utc)
+            return sub_id, end_at
+        return None
+
+
+def create_xui_client(settings) -> XuiClient:
+    """The panel client for ``settings``: local SQLite when ``db_path`` is set."""
+    if settings.db_path:
+        from app.services.xui_local import XuiLocalClient
+
+        return XuiLocalClient.from_settings(settings)
+    return XuiClient.from_settings(settings)
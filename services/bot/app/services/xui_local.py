@@ -0,0 +1,361 @@
+"""Provisioning straight into the 3x-ui SQLite database on the panel host.
+
+``XuiLocalClient`` has the same interface as ``XuiClient`` but edits
+``inbounds.settings`` and ``client_traffics`` in one SQLite transaction per
+call, so adding a thousand clients is one write instead of a thousand HTTP
+round trips. ``BEGIN IMMEDIATE`` takes the database write lock before the
+settings JSON is read, so a concurrent panel write can neither interleave
+with nor be lost by the read-modify-write; it behaves the same in rollback
+and WAL journal modes, and ``busy_timeout`` makes it wait out the panel's own
+writes instead of failing.
+
+xray only reads clients when its config is rebuilt, so every write asks for
+a reload: ``reload_command`` when configured, otherwise the panel's
+``restartXrayService`` endpoint. Reloads requested within
+``XUI_LOCAL_RELOAD_DELAY_SECONDS`` of each other are merged into one.
+Connected clients (``online_emails``) exist only in xray's memory and are
+still read over HTTP.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+
+from app import metrics
+from app.config import (
+    XuiSettings,
+    get_xui_batch_size,
+    get_xui_local_busy_timeout,
+    get_xui_local_reload_delay,
+)
+from app.services.xui_client import (
+    ClientResult,
+    ClientSpec,
+    XuiClient,
+    XuiConfig,
+    client_key,
+)
+from app.tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class _ReloadTrigger:
+    """Debounced xray reload for one panel.
+
+    Writes requested while a reload is already running start another round
+    after it, so no write is left behind a reload that read the old config.
+    """
+
+    def __init__(self, settings: XuiSettings):
+        self.settings = settings
+        self._task: asyncio.Task | None = None
+        # Resolved by the reload that picks up the writes requested so far.
+        self._pending: asyncio.Future | None = None
+        self._running: asyncio.Future | None = None
+
+    def request(self) -> None:
+        if self._pending is None:
+            self._pending = asyncio.get_running_loop().create_future()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="xui_local_reload")
+
+    async def flush(self) -> None:
+        """Wait until every write requested so far is live in xray."""
+        waiter = self._pending or self._running
+        if waiter is not None:
+            await asyncio.shield(waiter)
+
+    async def _run(self) -> None:
+        while self._pending is not None:
+            await asyncio.sleep(get_xui_local_reload_delay())
+            self._running, self._pending = self._pending, None
+            try:
+                await self._reload()
+            finally:
+                self._running.set_result(None)
+                self._running = None
+
+    async def _reload(self) -> None:
+        started = time.perf_counter()
+        try:
+            if self.settings.reload_command:
+                process = await asyncio.create_subprocess_shell(
+                    self.settings.reload_command
+                )
+                if await process.wait():
+                    raise RuntimeError(f"exit code {process.returncode}")
+            else:
+                xui = XuiClient.from_settings(self.settings)
+                try:
+                    await xui.login()
+                    await xui.restart_xray()
+                finally:
+                    await xui.close()
+        except Exception:
+            metrics.inc("xui_local_reload_errors_total", server=self.settings.name)
+            logger.exception("xray reload failed for server %s", self.settings.name)
+            return
+        metrics.observe(
+            "xui_local_reload_seconds",
+            time.perf_counter() - started,
+            server=self.settings.name,
+        )
+
+
+_triggers: dict[str, _ReloadTrigger] = {}
+
+
+def _reload_trigger(settings: XuiSettings) -> _ReloadTrigger:
+    trigger = _triggers.get(settings.db_path)
+    if trigger is None:
+        trigger = _triggers[settings.db_path] = _ReloadTrigger(settings)
+    return trigger
+
+
+class XuiLocalClient:
+    def __init__(self, settings: XuiSettings):
+        self._settings = settings
+        self._http: XuiClient | None = None
+        self._wrote = False
+
+    @classmethod
+    def from_settings(cls, settings: XuiSettings) -> "XuiLocalClient":
+        return cls(settings)
+
+    async def close(self) -> None:
+        # Callers such as migrate_inbound leave the event loop right after
+        # close(); the reload for their writes must not be cancelled with it.
+        if self._wrote:
+            await self.flush()
+        if self._http is not None:
+            await self._http.close()
+
+    async def flush(self) -> None:
+        """Wait for the xray reload covering this client's writes."""
+        await _reload_trigger(self._settings).flush()
+
+    async def login(self) -> None:
+        """Nothing to authenticate against; kept for interface parity."""
+
+    @contextmanager
+    def _connect(self, write: bool) -> Iterator[sqlite3.Connection]:
+        timeout = get_xui_local_busy_timeout()
+        con = sqlite3.connect(
+            self._settings.db_path, timeout=timeout, isolation_level=None
+        )
+        try:
+            con.execute(f"PRAGMA busy_timeout = {int(timeout * 1000)}")
+            if not write:
+                yield con
+                return
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                yield con
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            con.execute("COMMIT")
+        finally:
+            con.close()
+
+    def _load_settings(self, con: sqlite3.Connection) -> dict:
+        row = con.execute(
+            "SELECT settings FROM inbounds WHERE id = ?", (self._settings.inbound_id,)
+        ).fetchone()
+        if row is None:
+            raise RuntimeError(f"inbound {self._settings.inbound_id} not found")
+        return json.loads(row[0] or "{}")
+
+    def _store_settings(self, con: sqlite3.Connection, settings: dict) -> None:
+        con.execute(
+            "UPDATE inbounds SET settings = ? WHERE id = ?",
+            (json.dumps(settings, indent=2), self._settings.inbound_id),
+        )
+
+    async def _run(self, name: str, func, *args):
+        # Surface database errors (e.g. the lock wait timing out) as the
+        # RuntimeError callers already retry for the HTTP client.
+        try:
+            with span(f"xui_local.{name}"):
+                return await asyncio.to_thread(func, *args)
+        except sqlite3.Error as exc:
+            raise RuntimeError(f"x-ui.db {name} failed: {exc}") from exc
+
+    async def _write(self, name: str, func, *args):
+        started = time.perf_counter()
+        result = await self._run(name, func, *args)
+        metrics.observe(
+            "xui_local_write_seconds",
+            time.perf_counter() - started,
+            server=self._settings.name,
+        )
+        self._wrote = True
+        _reload_trigger(self._settings).request()
+        return result
+
+    def _add_sync(self, specs: list[ClientSpec]) -> list[ClientResult]:
+        with self._connect(write=True) as con:
+            settings = self._load_settings(con)
+            # Emails are unique across every inbound of the panel.
+            taken = {row[0] for row in con.execute("SELECT email FROM client_traffics")}
+            clients = settings.setdefault("clients", [])
+            taken.update(client.get("email") for client in clients)
+            results: list[ClientResult] = []
+            added: list[ClientSpec] = []
+            for spec in specs:
+                if spec.email in taken:
+                    results.append(
+                        ClientResult(
+                            spec.email,
+                            spec.sub_id,
+                            False,
+                            f"Duplicate email: {spec.email}",
+                        )
+                    )
+                    continue
+                taken.add(spec.email)
+                clients.append(spec.to_settings())
+                added.append(spec)
+                results.append(ClientResult(spec.email, spec.sub_id, True))
+            if added:
+                self._store_settings(con, settings)
+                con.executemany(
+                    """
+                    INSERT INTO client_traffics
+                        (inbound_id, enable, email, up, down, expiry_time, total, reset)
+                    VALUES (?, 1, ?, 0, 0, ?, 0, 0)
+                    """,
+                    [
+                        (
+                            self._settings.inbound_id,
+                            spec.email,
+                            int(spec.expire_at.timestamp() * 1000),
+                        )
+                        for spec in added
+                    ],
+                )
+        return results
+
+    async def add_client(
+        self, email: str, days: int = 30, sub_id: str | None = None
+    ) -> str:
+        expire_at = datetime.now(timezone.utc) + timedelta(days=days)
+        spec = ClientSpec(email=email, expire_at=expire_at, sub_id=sub_id)
+        [result] = await self._write("add_clients", self._add_sync, [spec])
+        if not result.ok:
+            raise RuntimeError(result.error)
+        return spec.sub_id
+
+    async def add_clients(
+        self, specs: list[ClientSpec], chunk_size: int | None = None
+    ) -> list[ClientResult]:
+        """Add ``specs`` with one transaction per chunk; duplicates fail alone."""
+        chunk_size = chunk_size or get_xui_batch_size()
+        results: list[ClientResult] = []
+        for start in range(0, len(specs), chunk_size):
+            results.extend(
+                await self._write(
+                    "add_clients", self._add_sync, specs[start : start + chunk_size]
+                )
+            )
+        return results
+
+    def _replace_sync(self, client: dict | None, key: str) -> None:
+        with self._connect(write=True) as con:
+            settings = self._load_settings(con)
+            clients = settings.get("clients", [])
+            for index, current in enumerate(clients):
+                if client_key(current) == key:
+                    break
+            else:
+                raise RuntimeError(f"client {key} not found")
+            email = current.get("email")
+            if client is None:
+                del clients[index]
+                con.execute("DELETE FROM client_traffics WHERE email = ?", (email,))
+            else:
+                clients[index] = client
+                con.execute(
+                    """
+                    UPDATE client_traffics
+                    SET enable = ?, expiry_time = ?, email = ?
+                    WHERE email = ?
+                    """,
+                    (
+                        int(bool(client.get("enable", True))),
+                        int(client.get("expiryTime") or 0),
+                        client.get("email", email),
+                        email,
+                    ),
+                )
+            self._store_settings(con, settings)
+
+    async def update_client(self, client: dict) -> None:
+        """Replace one client of the configured inbound with ``client``."""
+        key = client_key(client)
+        await self._write("update_client", self._replace_sync, client, key)
+
+    async def delete_client(self, client: dict) -> None:
+        key = client_key(client)
+        await self._write("delete_client", self._replace_sync, None, key)
+
+    def subscription_link(self, sub_id: str) -> str:
+        return XuiConfig.from_settings(self._settings).subscription_link(sub_id)
+
+    def _list_sync(self) -> list[dict]:
+        with self._connect(write=False) as con:
+            return self._load_settings(con).get("clients", [])
+
+    async def list_clients(self) -> list[dict]:
+        """Clients of the configured inbound, as stored in its settings JSON."""
+        return await self._run("list_clients", self._list_sync)
+
+    def _stats_sync(self) -> list[dict]:
+        with self._connect(write=False) as con:
+            con.row_factory = sqlite3.Row
+            rows = con.execute(
+                "SELECT * FROM client_traffics WHERE inbound_id = ?",
+                (self._settings.inbound_id,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    async def client_stats(self) -> list[dict]:
+        """Traffic counters (``email``, ``up``, ``down``) of the configured inbound."""
+        stats = await self._run("client_stats", self._stats_sync)
+        for item in stats:
+            item.setdefault("lastOnline", item.get("last_online") or 0)
+        return stats
+
+    async def last_online(self) -> dict[str, int]:
+        """Last connection time per email, where the panel version records it."""
+        return {
+            item["email"]: int(item["lastOnline"])
+            for item in await self.client_stats()
+            if item.get("lastOnline")
+        }
+
+    async def online_emails(self) -> list[str]:
+        if self._http is None:
+            self._http = XuiClient.from_settings(self._settings)
+            await self._http.login()
+        return await self._http.online_emails()
+
+    async def get_client_subscription(self, email: str) -> tuple[str, datetime] | None:
+        for client in await self.list_clients():
+            if client.get("email") != email:
+                continue
+            sub_id = client.get("subId") or client.get("sub_id")
+            expiry_time = client.get("expiryTime") or 0
+            if not sub_id or not expiry_time:
+                return None
+            end_at = datetime.fromtimestamp(int(expiry_time) / 1000, tz=timezone.utc)
+            return sub_id, end_at
+        return None
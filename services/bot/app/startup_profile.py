@@ -0,0 +1,112 @@
+"""Startup profiling: per-module import time and cold start to first update.
+
+Usage::
+
+    PYTHONPATH=. python -m app.startup_profile --top 25
+
+Set ``STARTUP_PROFILE=1`` for the running bot to log the time from process
+start to the first handled update.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+_IMPORTED_AT = time.perf_counter()
+
+PROFILE_TARGET = "import app.main; app.main.create_dispatcher()"
+
+
+@dataclass
+class ImportRecord:
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def process_uptime() -> float:
+    """Seconds since the current process started (falls back to import time)."""
+    try:
+        with open("/proc/self/stat", encoding="ascii") as fh:
+            fields = fh.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime", encoding="ascii") as fh:
+            uptime = float(fh.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.perf_counter() - _IMPORTED_AT
+
+
+def parse_importtime(output: str) -> list[ImportRecord]:
+    records = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        parts = line[len("import time:") :].split("|")
+        if len(parts) != 3:
+            continue
+        records.append(
+            ImportRecord(
+                module=parts[2].strip(),
+                self_us=int(parts[0]),
+                cumulative_us=int(parts[1]),
+            )
+        )
+    return records
+
+
+def profile_imports(target: str = PROFILE_TARGET) -> tuple[list[ImportRecord], float]:
+    env = dict(os.environ)
+    env.setdefault("PYTHONPATH", os.getcwd())
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", target],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=False,
+    )
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    return parse_importtime(completed.stderr), elapsed
+
+
+def summarize(records: list[ImportRecord], top: int) -> str:
+    by_package: dict[str, int] = defaultdict(int)
+    for record in records:
+        by_package[record.module.split(".", 1)[0]] += record.self_us
+    total = sum(record.self_us for record in records)
+    lines = [f"Total import time: {total / 1000:.1f}ms across {len(records)} modules", ""]
+    lines.append("Top packages by self time:")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+        lines.append(f"  {self_us / 1000:>8.1f}ms  {package}")
+    lines.append("")
+    lines.append("Top modules by cumulative time:")
+    for record in sorted(records, key=lambda item: -item.cumulative_us)[:top]:
+        lines.append(
+            f"  {record.cumulative_us / 1000:>8.1f}ms  "
+            f"(self {record.self_us / 1000:.1f}ms)  {record.module}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--target", default=PROFILE_TARGET)
+    args = parser.parse_args(argv)
+    records, elapsed = profile_imports(args.target)
+    print(summarize(records, args.top))
+    print("")
+    print(f"Interpreter start + imports + dispatcher setup: {elapsed * 1000:.0f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
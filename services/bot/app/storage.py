@@ -1,19 +1,50 @@
 from __future__ import annotations
 
+import ast
+import csv
+import io
 import json
-import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from typing import Iterator
 import logging
+import time
 
-from alembic import command
-from alembic.config import Config
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import redis
 
-from app.config import get_database_url, get_redis_url
+from app import metrics
+from app.config import get_archive_settings, get_database_url
+from app.services.redis_client import get_redis
+from app.services.replicas import get_replica_router
+from app.tracing import span, traced
+
+logger = logging.getLogger(__name__)
+
+HISTORY_EXPIRED = "expired"
+HISTORY_CLEARED = "cleared"
+HISTORY_MISSING = "missing_on_panel"
+
+# Moves the rows selected by ``source`` from subscriptions to history in one
+# statement; the trailing parameter is the history ``reason``.
+_ARCHIVE_SQL = """
+    WITH moved AS (
+        DELETE FROM subscriptions
+        {source}
+        RETURNING id, tg_id, start_at, end_at, subscription_link,
+                  instructions, country, server
+    )
+    INSERT INTO subscription_history (
+        subscription_id, tg_id, start_at, end_at, subscription_link,
+        instructions, country, server, reason
+    )
+    SELECT id, tg_id, start_at, end_at, subscription_link,
+           instructions, country, server, %s
+    FROM moved
+    RETURNING tg_id
+"""
 
 
 @dataclass
@@ -31,23 +62,102 @@ def _connect():
 
 
 def _redis() -> redis.Redis:
-    url = get_redis_url()
-    return redis.Redis.from_url(url, decode_responses=True)
+    return get_redis()
+
+
+class _ReplicaConnection(psycopg2.extensions.connection):
+    """Marks connections opened on a replica."""
+
+
+def _connect_read(tg_id: int | None = None):
+    """Connection for a read-only query: a fresh-enough replica or the primary."""
+    router = get_replica_router()
+    dsn = router.read_dsn(tg_id)
+    if dsn is not None:
+        try:
+            return psycopg2.connect(
+                dsn, connect_timeout=2, connection_factory=_ReplicaConnection
+            )
+        except psycopg2.OperationalError:
+            router.mark_failed(dsn)
+    return _connect()
+
+
+def _from_replica(conn) -> bool:
+    # A row read from a lagging replica must not be cached: the cache would
+    # keep serving it for the full TTL after the replica catches up.
+    return isinstance(conn, _ReplicaConnection)
+
+
+def _note_write(tg_id: int) -> None:
+    get_replica_router().note_write(tg_id)
 
 
 def init_db() -> None:
     _apply_migrations()
+    # Before any clear_subscription can land rows in the default partition.
+    ensure_history_partitions()
+
+
+def _migration_heads(versions_dir: Path) -> set[str]:
+    """Read revision ids from migration files without importing alembic."""
+    revisions: set[str] = set()
+    parents: set[str] = set()
+    for path in versions_dir.glob("*.py"):
+        values: dict[str, object] = {}
+        for node in ast.parse(path.read_text(encoding="utf-8")).body:
+            if (
+                isinstance(node, ast.Assign)
+                and len(node.targets) == 1
+                and isinstance(node.targets[0], ast.Name)
+                and node.targets[0].id in {"revision", "down_revision"}
+            ):
+                values[node.targets[0].id] = ast.literal_eval(node.value)
+        revision = values.get("revision")
+        if not isinstance(revision, str):
+            continue
+        revisions.add(revision)
+        down = values.get("down_revision")
+        if isinstance(down, str):
+            parents.add(down)
+        elif isinstance(down, (tuple, list)):
+            parents.update(down)
+    return revisions - parents
+
+
+def _current_db_revisions() -> set[str]:
+    with _connect() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('alembic_version')")
+            if cur.fetchone()[0] is None:
+                return set()
+            cur.execute("SELECT version_num FROM alembic_version")
+            return {row[0] for row in cur.fetchall()}
 
 
 def _apply_migrations() -> None:
-    alembic_ini = Path(__file__).resolve().parents[1] / "alembic.ini"
+    root = Path(__file__).resolve().parents[1]
+    alembic_ini = root / "alembic.ini"
     if not alembic_ini.exists():
         return
+    heads = _migration_heads(root / "alembic" / "versions")
+    if heads and _current_db_revisions() == heads:
+        logger.info(
+            "Database schema is current (%s), skipping migrations",
+            ", ".join(sorted(heads)),
+        )
+        return
+
+    from alembic import command
+    from alembic.config import Config
+
     alembic_cfg = Config(str(alembic_ini))
     command.upgrade(alembic_cfg, "head")
 
 
+@traced()
 def ensure_user(tg_id: int, username: str | None) -> None:
+    _note_write(tg_id)
     with _connect() as conn:
         with conn.cursor() as cur:
             cur.execute(
@@ -61,9 +171,61 @@ def ensure_user(tg_id: int, username: str | None) -> None:
             )
 
 
+@traced()
+def has_used_trial(tg_id: int) -> bool:
+    with _connect() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT trial_used_at FROM users WHERE tg_id = %s", (tg_id,))
+            row = cur.fetchone()
+            return bool(row and row[0])
+
+
+@traced()
+def mark_trial_used(tg_id: int) -> None:
+    _note_write(tg_id)
+    with _connect() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE users SET trial_used_at = COALESCE(trial_used_at, NOW())
+                WHERE tg_id = %s
+                """,
+                (tg_id,),
+            )
+
+
+@traced()
+def fetch_last_server(tg_id: int, country: str) -> tuple[bool, str | None]:
+    """Server of the user's current or most recently archived subscription.
+
+    The flag is ``False`` when the user never had a subscription in
+    ``country``; the server is ``None`` for rows from before the pool.
+    """
+    with _connect() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT server FROM (
+                    SELECT server, 0 AS source, end_at AS at
+                    FROM subscriptions WHERE tg_id = %s AND country = %s
+                    UNION ALL
+                    SELECT server, 1 AS source, archived_at AS at
+                    FROM subscription_history WHERE tg_id = %s AND country = %s
+                ) rows
+                ORDER BY source, at DESC NULLS LAST
+                LIMIT 1
+                """,
+                (tg_id, country, tg_id, country),
+            )
+            row = cur.fetchone()
+            return (False, None) if row is None else (True, row[0])
+
+
+@traced()
 def set_referrer(tg_id: int, referrer_tg_id: int) -> bool:
     if tg_id == referrer_tg_id:
         return False
+    _note_write(tg_id)
     with _connect() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
@@ -86,8 +248,9 @@ def set_referrer(tg_id: int, referrer_tg_id: int) -> bool:
     return True
 
 
+@traced()
 def get_referral_info(tg_id: int) -> ReferralInfo | None:
-    with _connect() as conn:
+    with _connect_read(tg_id) as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
                 "SELECT tg_id, username, balance, referral_balance FROM users WHERE tg_id = %s",
@@ -110,15 +273,15 @@ def get_referral_info(tg_id: int) -> ReferralInfo | None:
             )
 
 
-logger = logging.getLogger(__name__)
-
 
+@traced()
 def record_first_payment(tg_id: int, amount: int) -> bool:
     if amount <= 0:
         return False
     reward = int(amount * 0.5)
     if reward <= 0:
         return False
+    _note_write(tg_id)
     with _connect() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
@@ -173,7 +336,9 @@ def record_first_payment(tg_id: int, amount: int) -> bool:
             return True
 
 
+@traced()
 def transfer_referral_to_balance(tg_id: int, min_amount: int = 150) -> bool:
+    _note_write(tg_id)
     with _connect() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
@@ -187,46 +352,287 @@ def transfer_referral_to_balance(tg_id: int, min_amount: int = 150) -> bool:
             if referral_balance < min_amount:
                 return False
             cur.execute(
-                "UPDATE users SET referral_balance = 0, balance = balance + %s WHERE tg_id = %s",
-                (referral_balance, tg_id),
+                "UPDATE users SET referral_balance = 0 WHERE tg_id = %s",
+                (tg_id,),
             )
+            _ledger_credit(cur, tg_id, referral_balance, "referral_transfer", None)
     return True
 
 
-def deduct_balance(tg_id: int, amount: int) -> bool:
+LEDGER_OK = "ok"
+LEDGER_DUPLICATE = "duplicate"
+LEDGER_INSUFFICIENT_FUNDS = "insufficient_funds"
+
+
+def _ledger_debit(
+    cur, tg_id: int, amount: int, reason: str, idempotency_key: str | None
+) -> int | None:
+    """Debit and journal in one statement; ``None`` when funds are short.
+
+    A reused ``idempotency_key`` raises ``UniqueViolation`` from the ledger
+    insert, which also undoes the balance update.
+    """
+    cur.execute(
+        """
+        WITH debit AS (
+            UPDATE users SET balance = balance - %(amount)s
+            WHERE tg_id = %(tg_id)s AND balance >= %(amount)s
+            RETURNING tg_id, balance
+        )
+        INSERT INTO balance_ledger (tg_id, delta, balance_after, reason, idempotency_key)
+        SELECT tg_id, -%(amount)s, balance, %(reason)s, %(key)s FROM debit
+        RETURNING balance_after
+        """,
+        {"tg_id": tg_id, "amount": amount, "reason": reason, "key": idempotency_key},
+    )
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return row["balance_after"] if isinstance(row, dict) else row[0]
+
+
+def _ledger_credit(
+    cur, tg_id: int, amount: int, reason: str, idempotency_key: str | None
+) -> int | None:
+    cur.execute(
+        """
+        WITH credit AS (
+            UPDATE users SET balance = balance + %(amount)s
+            WHERE tg_id = %(tg_id)s
+            RETURNING tg_id, balance
+        )
+        INSERT INTO balance_ledger (tg_id, delta, balance_after, reason, idempotency_key)
+        SELECT tg_id, %(amount)s, balance, %(reason)s, %(key)s FROM credit
+        RETURNING balance_after
+        """,
+        {"tg_id": tg_id, "amount": amount, "reason": reason, "key": idempotency_key},
+    )
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return row["balance_after"] if isinstance(row, dict) else row[0]
+
+
+@traced()
+def debit_balance(
+    tg_id: int, amount: int, reason: str, idempotency_key: str | None = None
+) -> str:
+    """Atomically debit ``amount`` and record it in ``balance_ledger``."""
     if amount <= 0:
-        return False
+        return LEDGER_INSUFFICIENT_FUNDS
+    _note_write(tg_id)
+    try:
+        with _connect() as conn:
+            with conn.cursor() as cur:
+                if _ledger_debit(cur, tg_id, amount, reason, idempotency_key) is None:
+                    return LEDGER_INSUFFICIENT_FUNDS
+    except psycopg2.errors.UniqueViolation:
+        return LEDGER_DUPLICATE
+    return LEDGER_OK
+
+
+@traced()
+def credit_balance(
+    tg_id: int, amount: int, reason: str, idempotency_key: str | None = None
+) -> str:
+    """Credit ``amount``; a repeated ``idempotency_key`` is a no-op."""
+    if amount <= 0:
+        return LEDGER_INSUFFICIENT_FUNDS
+    _note_write(tg_id)
+    try:
+        with _connect() as conn:
+            with conn.cursor() as cur:
+                if _ledger_credit(cur, tg_id, amount, reason, idempotency_key) is None:
+                    return LEDGER_INSUFFICIENT_FUNDS
+    except psycopg2.errors.UniqueViolation:
+        return LEDGER_DUPLICATE
+    return LEDGER_OK
+
+
+@traced()
+def deduct_balance(tg_id: int, amount: int) -> bool:
+    return debit_balance(tg_id, amount, "debit") == LEDGER_OK
+
+
+@traced()
+def add_balance(tg_id: int, amount: int) -> bool:
+    return credit_balance(tg_id, amount, "credit") == LEDGER_OK
+
+
+@traced()
+def fetch_balance_history(tg_id: int, limit: int = 20) -> list[dict]:
     with _connect() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
-                "SELECT balance FROM users WHERE tg_id = %s FOR UPDATE",
-                (tg_id,),
+                """
+                SELECT id, delta, balance_after, reason, created_at
+                FROM balance_ledger
+                WHERE tg_id = %s
+                ORDER BY id DESC
+                LIMIT %s
+                """,
+                (tg_id, limit),
             )
-            row = cur.fetchone()
-            if not row:
-                return False
-            balance = int(row["balance"])
-            if balance < amount:
-                return False
+            return list(cur.fetchall())
+
+
+@traced()
+def balance_at(tg_id: int, at: datetime) -> int:
+    """Balance as of ``at``: nearest earlier snapshot plus later ledger rows."""
+    with _connect() as conn:
+        with conn.cursor() as cur:
             cur.execute(
-                "UPDATE users SET balance = balance - %s WHERE tg_id = %s",
-                (amount, tg_id),
+                """
+                WITH snap AS (
+                    SELECT balance, last_ledger_id
+                    FROM balance_snapshots
+                    WHERE tg_id = %(tg_id)s AND snapshot_at <= %(at)s
+                    ORDER BY snapshot_at DESC
+                    LIMIT 1
+                )
+                SELECT COALESCE((SELECT balance FROM snap), 0)
+                     + COALESCE(SUM(delta), 0)
+                FROM balance_ledger
+                WHERE tg_id = %(tg_id)s
+                  AND id > COALESCE((SELECT last_ledger_id FROM snap), 0)
+                  AND created_at <= %(at)s
+                """,
+                {"tg_id": tg_id, "at": at},
             )
-    return True
+            return int(cur.fetchone()[0])
 
 
-def add_balance(tg_id: int, amount: int) -> bool:
-    if amount <= 0:
-        return False
+@traced()
+def snapshot_balances() -> int:
+    """Snapshot the balance of every user with ledger activity since the last run."""
     with _connect() as conn:
         with conn.cursor() as cur:
             cur.execute(
-                "UPDATE users SET balance = balance + %s WHERE tg_id = %s",
-                (amount, tg_id),
+                """
+                INSERT INTO balance_snapshots (tg_id, snapshot_at, balance, last_ledger_id)
+                SELECT l.tg_id, NOW(), u.balance, MAX(l.id)
+                FROM balance_ledger l
+                JOIN users u ON u.tg_id = l.tg_id
+                WHERE l.id > COALESCE(
+                    (SELECT MAX(last_ledger_id) FROM balance_snapshots), 0
+                )
+                GROUP BY l.tg_id, u.balance
+                """
+            )
+            return cur.rowcount
+
+
+INVOICE_PENDING = "pending"
+INVOICE_PAID = "paid"
+INVOICE_EXPIRED = "expired"
+
+
+@traced()
+def create_invoice(
+    provider: str,
+    external_id: str,
+    tg_id: int,
+    amount: int,
+    pay_url: str | None = None,
+) -> None:
+    _note_write(tg_id)
+    with _connect() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO payment_invoices (provider, external_id, tg_id, amount, pay_url)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (provider, external_id) DO NOTHING
+                """,
+                (provider, external_id, tg_id, amount, pay_url),
+            )
+
+
+@traced()
+def get_invoice(provider: str, external_id: str) -> dict | None:
+    with _connect() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                SELECT id, external_id, tg_id, amount, status, created_at
+                FROM payment_invoices
+                WHERE provider = %s AND external_id = %s
+                """,
+                (provider, external_id),
+            )
+            return cur.fetchone()
+
+
+@traced()
+def fetch_pending_invoices(provider: str, limit: int, after_id: int = 0) -> list[dict]:
+    with _connect() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                SELECT id, external_id, tg_id, amount, created_at
+                FROM payment_invoices
+                WHERE provider = %s AND status = 'pending' AND id > %s
+                ORDER BY id
+                LIMIT %s
+                """,
+                (provider, after_id, limit),
+            )
+            return list(cur.fetchall())
+
+
+@traced()
+def settle_invoice(provider: str, external_id: str) -> dict | None:
+    """Mark an invoice paid and credit the balance in one transaction.
+
+    Returns ``tg_id``, ``amount`` and the new ``balance``, or ``None`` when the
+    invoice is unknown or was already settled, so replays credit nothing.
+    """
+    with _connect() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                UPDATE payment_invoices
+                SET status = 'paid', paid_at = NOW(), updated_at = NOW()
+                WHERE provider = %s AND external_id = %s AND status <> 'paid'
+                RETURNING tg_id, amount
+                """,
+                (provider, external_id),
+            )
+            row = cur.fetchone()
+            if row is None:
+                return None
+            balance = _ledger_credit(
+                cur,
+                row["tg_id"],
+                row["amount"],
+                f"topup:{provider}",
+                f"{provider}:{external_id}",
+            )
+            settled = {
+                "tg_id": row["tg_id"],
+                "amount": row["amount"],
+                "balance": balance,
+            }
+    _note_write(settled["tg_id"])
+    return settled
+
+
+@traced()
+def expire_invoices(provider: str, external_ids: list[str]) -> int:
+    with _connect() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE payment_invoices
+                SET status = 'expired', updated_at = NOW()
+                WHERE provider = %s AND external_id = ANY(%s) AND status = 'pending'
+                """,
+                (provider, external_ids),
             )
-            return cur.rowcount > 0
+            return cur.rowcount
 
 
+@traced()
 def set_subscription(
     tg_id: int,
     start_at: datetime,
@@ -234,37 +640,42 @@ def set_subscription(
     subscription_link: str,
     instructions: str,
     country: str = "fi",
+    server: str | None = None,
 ) -> None:
+    _note_write(tg_id)
     with _connect() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 """
-                INSERT INTO subscriptions (tg_id, start_at, end_at, subscription_link, instructions, country)
-                VALUES (%s, %s, %s, %s, %s, %s)
+                INSERT INTO subscriptions (tg_id, start_at, end_at, subscription_link, instructions, country, server)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
                 ON CONFLICT (tg_id)
                 DO UPDATE SET start_at = EXCLUDED.start_at,
                               end_at = EXCLUDED.end_at,
                               subscription_link = EXCLUDED.subscription_link,
                               instructions = EXCLUDED.instructions,
                               country = EXCLUDED.country,
+                              server = EXCLUDED.server,
                               updated_at = NOW()
                 """,
-                (tg_id, start_at, end_at, subscription_link, instructions, country),
+                (tg_id, start_at, end_at, subscription_link, instructions, country, server),
             )
     _cache_set_subscription(
-        tg_id, start_at, end_at, subscription_link, instructions, country
+        tg_id, start_at, end_at, subscription_link, instructions, country, server
     )
+    schedule_expiry_notifications(tg_id, end_at)
 
 
+@traced()
 def get_subscription(tg_id: int) -> tuple[datetime | None, datetime | None]:
     cached = _cache_get_subscription(tg_id)
     if cached:
         return cached["start_at"], cached["end_at"]
-    with _connect() as conn:
+    with _connect_read(tg_id) as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
                 """
-                SELECT start_at, end_at, subscription_link, instructions, country
+                SELECT start_at, end_at, subscription_link, instructions, country, server
                 FROM subscriptions WHERE tg_id = %s
                 """,
                 (tg_id,),
@@ -278,22 +689,25 @@ def get_subscription(tg_id: int) -> tuple[datetime | None, datetime | None]:
             if end_at and end_at < datetime.now(timezone.utc):
                 clear_subscription(tg_id)
                 return None, None
-            _cache_set_subscription(
-                tg_id,
-                start_at,
-                end_at,
-                row["subscription_link"],
-                row["instructions"],
-                row.get("country") or "nl",
-            )
+            if not _from_replica(conn):
+                _cache_set_subscription(
+                    tg_id,
+                    start_at,
+                    end_at,
+                    row["subscription_link"],
+                    row["instructions"],
+                    row.get("country") or "nl",
+                    row.get("server"),
+                )
             return start_at, end_at
 
 
+@traced()
 def get_vpn_data(tg_id: int) -> tuple[str | None, str | None]:
     cached = _cache_get_subscription(tg_id)
     if cached:
         return cached["subscription_link"], cached["instructions"]
-    with _connect() as conn:
+    with _connect_read(tg_id) as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
                 """
@@ -313,6 +727,7 @@ def get_vpn_data(tg_id: int) -> tuple[str | None, str | None]:
             return row["subscription_link"], row["instructions"]
 
 
+@traced()
 def get_subscription_meta(tg_id: int) -> dict | None:
     cached = _cache_get_subscription(tg_id)
     if cached:
@@ -322,12 +737,13 @@ def get_subscription_meta(tg_id: int) -> dict | None:
             "subscription_link": cached["subscription_link"],
             "instructions": cached["instructions"],
             "country": cached.get("country") or "nl",
+            "server": cached.get("server"),
         }
-    with _connect() as conn:
+    with _connect_read(tg_id) as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
                 """
-                SELECT start_at, end_at, subscription_link, instructions, country
+                SELECT start_at, end_at, subscription_link, instructions, country, server
                 FROM subscriptions WHERE tg_id = %s
                 """,
                 (tg_id,),
@@ -339,53 +755,205 @@ def get_subscription_meta(tg_id: int) -> dict | None:
             if end_at and end_at < datetime.now(timezone.utc):
                 clear_subscription(tg_id)
                 return None
-            _cache_set_subscription(
-                tg_id,
-                row["start_at"],
-                row["end_at"],
-                row["subscription_link"],
-                row["instructions"],
-                row.get("country") or "nl",
-            )
+            if not _from_replica(conn):
+                _cache_set_subscription(
+                    tg_id,
+                    row["start_at"],
+                    row["end_at"],
+                    row["subscription_link"],
+                    row["instructions"],
+                    row.get("country") or "nl",
+                    row.get("server"),
+                )
             return row
 
 
+@traced()
 def clear_subscription(tg_id: int) -> None:
+    """Move the user's subscription row to ``subscription_history``."""
+    _note_write(tg_id)
     with _connect() as conn:
         with conn.cursor() as cur:
-            cur.execute("DELETE FROM subscriptions WHERE tg_id = %s", (tg_id,))
+            cur.execute(
+                _ARCHIVE_SQL.format(source="WHERE tg_id = %s"),
+                (tg_id, HISTORY_CLEARED),
+            )
     _cache_clear_subscription(tg_id)
 
 
-def purge_expired_subscriptions() -> int:
-    grace_hours = int(os.getenv("SUBSCRIPTION_PURGE_GRACE_HOURS", "24"))
-    cutoff = datetime.now(timezone.utc) - timedelta(hours=grace_hours)
+def _history_partition(month: datetime) -> tuple[str, datetime, datetime]:
+    start = month.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return f"subscription_history_{start:%Y_%m}", start, end
+
+
+def ensure_history_partitions(now: datetime | None = None) -> None:
+    """Create this and next month's ``subscription_history`` partitions.
+
+    Rows archived while a month had no partition sit in the default one, and
+    Postgres refuses to create a partition whose range the default already
+    holds. So the default is detached, its rows for the month are moved into
+    the new partition and it is attached back, all in one transaction.
+    """
+    now = now or datetime.now(timezone.utc)
     with _connect() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                "DELETE FROM subscriptions WHERE end_at IS NOT NULL AND end_at < %s",
-                (cutoff,),
-            )
-            deleted = cur.rowcount
-    return deleted
+            for month in (now, now.replace(day=1) + timedelta(days=32)):
+                name, start, end = _history_partition(month)
+                cur.execute("SELECT to_regclass(%s)", (name,))
+                if cur.fetchone()[0] is not None:
+                    continue
+                # DETACH locks the parent, so no archive write can slip into
+                # the default partition between the move and the reattach.
+                cur.execute(
+                    "ALTER TABLE subscription_history "
+                    "DETACH PARTITION subscription_history_default"
+                )
+                cur.execute(
+                    f"""
+                    CREATE TABLE {name}
+                    PARTITION OF subscription_history
+                    FOR VALUES FROM (%s) TO (%s)
+                    """,
+                    (start, end),
+                )
+                cur.execute(
+                    """
+                    WITH moved AS (
+                        DELETE FROM subscription_history_default
+                        WHERE archived_at >= %s AND archived_at < %s
+                        RETURNING *
+                    )
+                    INSERT INTO subscription_history SELECT * FROM moved
+                    """,
+                    (start, end),
+                )
+                if cur.rowcount:
+                    logger.info(
+                        "Moved %s history rows from the default partition to %s",
+                        cur.rowcount,
+                        name,
+                    )
+                cur.execute(
+                    "ALTER TABLE subscription_history "
+                    "ATTACH PARTITION subscription_history_default DEFAULT"
+                )
 
 
-def fetch_subscription_end_dates() -> list[dict]:
+def drop_history_partitions(retention_months: int) -> list[str]:
+    """Drop monthly history partitions older than ``retention_months``."""
+    cutoff = datetime.now(timezone.utc).replace(day=1)
+    for _ in range(retention_months):
+        cutoff = (cutoff - timedelta(days=1)).replace(day=1)
+    oldest_kept, _, _ = _history_partition(cutoff)
+    dropped: list[str] = []
     with _connect() as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        with conn.cursor() as cur:
             cur.execute(
-                "SELECT tg_id, end_at FROM subscriptions WHERE end_at IS NOT NULL"
+                """
+                SELECT child.relname FROM pg_inherits
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE parent.relname = 'subscription_history'
+                  AND child.relname ~ '^subscription_history_[0-9]{4}_[0-9]{2}$'
+                """
             )
+            # Names sort chronologically, so a string compare finds old months.
+            for (name,) in cur.fetchall():
+                if name < oldest_kept:
+                    cur.execute(f"DROP TABLE {name}")
+                    dropped.append(name)
+    if dropped:
+        logger.info("Dropped subscription history partitions: %s", ", ".join(dropped))
+    return dropped
+
+
+@traced()
+def archive_expired_subscriptions(
+    cutoff: datetime, batch_size: int = 1000, pause_seconds: float = 0.0
+) -> int:
+    """Move subscriptions that ended before ``cutoff`` to history in batches.
+
+    Every batch is its own short transaction, so the hot table is never
+    locked for the whole sweep and autovacuum can keep up between batches.
+    """
+    total = 0
+    conn = _connect()
+    try:
+        while True:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        _ARCHIVE_SQL.format(
+                            source="""
+                            WHERE id IN (
+                                SELECT id FROM subscriptions
+                                WHERE end_at IS NOT NULL AND end_at < %s
+                                ORDER BY end_at
+                                LIMIT %s
+                                FOR UPDATE SKIP LOCKED
+                            )
+                            """
+                        ),
+                        (cutoff, batch_size, HISTORY_EXPIRED),
+                    )
+                    moved = cur.rowcount
+            total += moved
+            if moved:
+                metrics.inc("subscriptions_archived_total", moved)
+                logger.info(
+                    "Archived %s expired subscriptions (%s so far)", moved, total
+                )
+            if moved < batch_size:
+                break
+            time.sleep(pause_seconds)
+    finally:
+        conn.close()
+    return total
+
+
+@traced()
+def purge_expired_subscriptions() -> int:
+    """Archive subscriptions past the grace period and rotate history."""
+    settings = get_archive_settings()
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=settings.grace_hours)
+    ensure_history_partitions()
+    archived = archive_expired_subscriptions(
+        cutoff, settings.batch_size, settings.pause_seconds
+    )
+    drop_history_partitions(settings.retention_months)
+    return archived
+
+
+@traced()
+def fetch_subscription_end_dates(tg_ids: list[int] | None = None) -> list[dict]:
+    # The drain checks specific users right before messaging them, so that
+    # lookup stays on the primary; the full replan scan can use a replica.
+    with (_connect() if tg_ids is not None else _connect_read()) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            if tg_ids is not None:
+                cur.execute(
+                    """
+                    SELECT tg_id, end_at FROM subscriptions
+                    WHERE end_at IS NOT NULL AND tg_id = ANY(%s)
+                    """,
+                    (list(tg_ids),),
+                )
+            else:
+                cur.execute(
+                    "SELECT tg_id, end_at FROM subscriptions WHERE end_at IS NOT NULL"
+                )
             return list(cur.fetchall())
 
 
+@traced()
 def fetch_active_subscriptions_with_users(country: str | None = None) -> list[dict]:
-    with _connect() as conn:
+    with _connect_read() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             if country:
                 cur.execute(
                     """
-                    SELECT s.tg_id, s.start_at, s.end_at, u.username, s.country
+                    SELECT s.tg_id, s.start_at, s.end_at, u.username, s.country, s.server
                     FROM subscriptions s
                     LEFT JOIN users u ON u.tg_id = s.tg_id
                     WHERE s.end_at IS NOT NULL AND s.end_at > NOW() AND s.country = %s
@@ -395,7 +963,7 @@ def fetch_active_subscriptions_with_users(country: str | None = None) -> list[di
             else:
                 cur.execute(
                     """
-                    SELECT s.tg_id, s.start_at, s.end_at, u.username, s.country
+                    SELECT s.tg_id, s.start_at, s.end_at, u.username, s.country, s.server
                     FROM subscriptions s
                     LEFT JOIN users u ON u.tg_id = s.tg_id
                     WHERE s.end_at IS NOT NULL AND s.end_at > NOW()
@@ -404,6 +972,62 @@ def fetch_active_subscriptions_with_users(country: str | None = None) -> list[di
             return list(cur.fetchall())
 
 
+def stream_active_subscriptions(chunk_size: int = 1000) -> Iterator[list[dict]]:
+    """Active subscriptions in chunks, read through a server-side cursor.
+
+    Only ``chunk_size`` rows are held in memory at a time, so warming the
+    cache for every user does not load the whole table into the process.
+    """
+    conn = _connect_read()
+    try:
+        with conn:
+            with conn.cursor(
+                "active_subscriptions", cursor_factory=RealDictCursor
+            ) as cur:
+                cur.itersize = chunk_size
+                cur.execute(
+                    """
+                    SELECT tg_id, start_at, end_at, subscription_link,
+                           instructions, country, server
+                    FROM subscriptions
+                    WHERE end_at IS NOT NULL AND end_at > NOW()
+                    """
+                )
+                while rows := cur.fetchmany(chunk_size):
+                    yield rows
+    finally:
+        conn.close()
+
+
+def prime_subscription_cache(rows: list[dict]) -> int:
+    """Cache ``rows`` with one pipelined round trip; returns keys written.
+
+    Keys that already exist are kept (``SET NX``), so a subscription changed
+    while the rows were read is never overwritten with the older copy.
+    """
+    pipe = _redis().pipeline(transaction=False)
+    queued = 0
+    for row in rows:
+        encoded = _encode_cached_subscription(
+            row["start_at"],
+            row["end_at"],
+            row["subscription_link"],
+            row["instructions"],
+            row["country"],
+            row["server"],
+        )
+        if encoded is None:
+            continue
+        payload, ttl = encoded
+        pipe.set(_cache_key(row["tg_id"]), payload, ex=ttl, nx=True)
+        queued += 1
+    if not queued:
+        return 0
+    with span("redis.pipeline", commands=queued):
+        return sum(1 for written in pipe.execute() if written)
+
+
+@traced()
 def update_subscription_record(
     tg_id: int,
     start_at: datetime | None,
@@ -411,7 +1035,9 @@ def update_subscription_record(
     subscription_link: str | None,
     instructions: str | None,
     country: str | None = None,
+    server: str | None = None,
 ) -> None:
+    _note_write(tg_id)
     with _connect() as conn:
         with conn.cursor() as cur:
             cur.execute(
@@ -422,27 +1048,39 @@ def update_subscription_record(
                     subscription_link = %s,
                     instructions = %s,
                     country = COALESCE(%s, country),
+                    server = COALESCE(%s, server),
                     updated_at = NOW()
                 WHERE tg_id = %s
                 """,
-                (start_at, end_at, subscription_link, instructions, country, tg_id),
+                (
+                    start_at,
+                    end_at,
+                    subscription_link,
+                    instructions,
+                    country,
+                    server,
+                    tg_id,
+                ),
             )
     _cache_set_subscription(
-        tg_id, start_at, end_at, subscription_link, instructions, country
+        tg_id, start_at, end_at, subscription_link, instructions, country, server
     )
+    schedule_expiry_notifications(tg_id, end_at)
 
 
+@traced()
 def fetch_all_user_ids() -> list[int]:
-    with _connect() as conn:
+    with _connect_read() as conn:
         with conn.cursor() as cur:
             cur.execute("SELECT tg_id FROM users")
             return [row[0] for row in cur.fetchall()]
 
 
+@traced()
 def fetch_users_with_subscription_links(
     min_days: int = 3, max_days: int = 30
 ) -> list[dict]:
-    with _connect() as conn:
+    with _connect_read() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
                 """
@@ -460,73 +1098,557 @@ def fetch_users_with_subscription_links(
             return list(cur.fetchall())
 
 
+JOB_QUEUED = "queued"
+JOB_DUPLICATE = "duplicate"
+JOB_INSUFFICIENT_FUNDS = "insufficient_funds"
+STALE_JOB_MINUTES = 5
+
+
+@traced()
+def enqueue_provisioning_job(
+    idempotency_key: str,
+    tg_id: int,
+    kind: str,
+    country: str,
+    email: str,
+    days: int,
+    sub_id: str,
+    amount: int = 0,
+    server: str | None = None,
+) -> str:
+    """Queue a provisioning job, debiting ``amount`` in the same transaction."""
+    _note_write(tg_id)
+    with _connect() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO provisioning_jobs
+                    (idempotency_key, tg_id, kind, country, server, email, days, amount, sub_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (idempotency_key) DO UPDATE
+                SET status = 'pending',
+                    attempts = 0,
+                    last_error = NULL,
+                    run_after = NOW(),
+                    updated_at = NOW(),
+                    server = EXCLUDED.server,
+                    email = EXCLUDED.email,
+                    end_at = NULL
+                -- Only a failed job may be queued again under the same key
+                -- (one trial per user); anything else is a duplicate.
+                WHERE provisioning_jobs.status = 'failed'
+                  AND provisioning_jobs.amount = 0
+                RETURNING id
+                """,
+                (
+                    idempotency_key,
+                    tg_id,
+                    kind,
+                    country,
+                    server,
+                    email,
+                    days,
+                    amount,
+                    sub_id,
+                ),
+            )
+            if cur.fetchone() is None:
+                return JOB_DUPLICATE
+            if amount > 0:
+                debited = _ledger_debit(
+                    cur, tg_id, amount, f"subscription:{kind}", idempotency_key
+                )
+                if debited is None:
+                    conn.rollback()
+                    return JOB_INSUFFICIENT_FUNDS
+    return JOB_QUEUED
+
+
+@traced()
+def claim_provisioning_jobs(limit: int, max_attempts: int) -> list[dict]:
+    """Claim due jobs and jobs left 'running' by a dead worker.
+
+    A stale job is retried only while it has attempts left; see
+    ``reclaim_exhausted_provisioning_jobs`` for the rest.
+    """
+    with _connect() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                UPDATE provisioning_jobs
+                SET status = 'running', attempts = attempts + 1, updated_at = NOW()
+                WHERE id IN (
+                    SELECT id FROM provisioning_jobs
+                    WHERE (status = 'pending' AND run_after <= NOW())
+                       OR (status = 'running'
+                           AND attempts < %s
+                           AND updated_at < NOW() - (%s || ' minutes')::interval)
+                    ORDER BY run_after
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING *
+                """,
+                (max_attempts, STALE_JOB_MINUTES, limit),
+            )
+            return list(cur.fetchall())
+
+
+@traced()
+def reclaim_exhausted_provisioning_jobs(limit: int, max_attempts: int) -> list[dict]:
+    """Stale 'running' jobs with no attempts left, leased again to be failed."""
+    with _connect() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                UPDATE provisioning_jobs
+                SET updated_at = NOW()
+                WHERE id IN (
+                    SELECT id FROM provisioning_jobs
+                    WHERE status = 'running'
+                      AND attempts >= %s
+                      AND updated_at < NOW() - (%s || ' minutes')::interval
+                    ORDER BY run_after
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING *
+                """,
+                (max_attempts, STALE_JOB_MINUTES, limit),
+            )
+            return list(cur.fetchall())
+
+
+@traced()
+def finish_provisioning_job(job_id: int, status: str, error: str | None = None) -> None:
+    with _connect() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE provisioning_jobs
+                SET status = %s, last_error = %s, updated_at = NOW()
+                WHERE id = %s
+                """,
+                (status, error, job_id),
+            )
+
+
+@traced()
+def set_provisioning_job_end_at(job_id: int, end_at: datetime) -> None:
+    with _connect() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE provisioning_jobs SET end_at = %s WHERE id = %s",
+                (end_at, job_id),
+            )
+
+
+@traced()
+def retry_provisioning_job(job_id: int, error: str, delay_seconds: float) -> None:
+    with _connect() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE provisioning_jobs
+                SET status = 'pending',
+                    last_error = %s,
+                    run_after = NOW() + make_interval(secs => %s),
+                    updated_at = NOW()
+                WHERE id = %s
+                """,
+                (error, delay_seconds, job_id),
+            )
+
+
+@traced()
+def record_traffic_counters(
+    server: str,
+    bucket: datetime,
+    rows: list[tuple[str, int, int, datetime | None]],
+) -> int:
+    """Add counter deltas since the previous pass to ``bucket``.
+
+    ``rows`` are raw panel counters ``(email, up, down, last_online)``. They are
+    COPYed into a temp table and diffed against ``traffic_counters`` in SQL, so
+    a pass costs the same three statements for ten clients or ten thousand.
+    The first sighting of an email only records its baseline; a counter that
+    went backwards (reset on the panel) counts from zero.
+    """
+    if not rows:
+        return 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for email, up, down, last_online in rows:
+        seen = last_online.isoformat() if last_online else ""
+        writer.writerow([email, up, down, seen])
+    buffer.seek(0)
+    with _connect() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                CREATE TEMP TABLE traffic_pass (
+                    email TEXT PRIMARY KEY,
+                    up_bytes BIGINT NOT NULL,
+                    down_bytes BIGINT NOT NULL,
+                    last_online TIMESTAMPTZ
+                ) ON COMMIT DROP
+                """
+            )
+            cur.copy_expert("COPY traffic_pass FROM STDIN WITH (FORMAT csv)", buffer)
+            cur.execute(
+                """
+                INSERT INTO traffic_stats
+                    (bucket, server, email, up_bytes, down_bytes, last_online)
+                SELECT %(bucket)s, %(server)s, p.email,
+                       CASE WHEN p.up_bytes >= c.up_bytes
+                            THEN p.up_bytes - c.up_bytes ELSE p.up_bytes END,
+                       CASE WHEN p.down_bytes >= c.down_bytes
+                            THEN p.down_bytes - c.down_bytes ELSE p.down_bytes END,
+                       p.last_online
+                FROM traffic_pass p
+                JOIN traffic_counters c ON c.server = %(server)s AND c.email = p.email
+                WHERE p.up_bytes <> c.up_bytes OR p.down_bytes <> c.down_bytes
+                ON CONFLICT (bucket, server, email)
+                DO UPDATE SET up_bytes = traffic_stats.up_bytes + EXCLUDED.up_bytes,
+                              down_bytes = traffic_stats.down_bytes + EXCLUDED.down_bytes,
+                              last_online = GREATEST(
+                                  traffic_stats.last_online, EXCLUDED.last_online
+                              )
+                """,
+                {"bucket": bucket, "server": server},
+            )
+            written = cur.rowcount
+            cur.execute(
+                """
+                INSERT INTO traffic_counters (server, email, up_bytes, down_bytes)
+                SELECT %s, email, up_bytes, down_bytes FROM traffic_pass
+                ON CONFLICT (server, email)
+                DO UPDATE SET up_bytes = EXCLUDED.up_bytes,
+                              down_bytes = EXCLUDED.down_bytes,
+                              updated_at = NOW()
+                WHERE traffic_counters.up_bytes <> EXCLUDED.up_bytes
+                   OR traffic_counters.down_bytes <> EXCLUDED.down_bytes
+                """,
+                (server,),
+            )
+    return written
+
+
+@dataclass
+class ReconcileDiff:
+    pulled: int = 0
+    removed: int = 0
+    # Clients whose DB end date is later than the panel's: ``(sub_id, end_at)``.
+    push: list[tuple[str, datetime]] = field(default_factory=list)
+
+
+@traced()
+def reconcile_panel_clients(
+    server: str,
+    country: str,
+    include_unassigned: bool,
+    clients: list[tuple[str, datetime | None]],
+    listed_at: datetime,
+    batch_size: int = 500,
+) -> ReconcileDiff:
+    """Diff one panel inbound listing against ``subscriptions`` and fix drift.
+
+    ``clients`` are ``(sub_id, end_at)`` pairs from a single listing taken at
+    ``listed_at``; ``end_at`` is ``None`` for clients that never expire. They
+    are COPYed into a temp table and joined with the server's subscriptions
+    (``include_unassigned`` also takes rows without a server in ``country``):
+
+    - a later panel end date is pulled into the DB,
+    - a later DB end date is returned in ``push`` for the caller to write to
+      the panel,
+    - subscriptions whose client is gone from the panel are archived.
+
+    Rows changed after ``listed_at`` are left alone, so a subscription
+    provisioned during the pass is never mistaken for drift. Fixes are applied
+    in batches of ``batch_size``, each in its own transaction.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for sub_id, end_at in clients:
+        writer.writerow([sub_id, end_at.isoformat() if end_at else ""])
+    buffer.seek(0)
+    diff = ReconcileDiff()
+    conn = _connect()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    CREATE TEMP TABLE panel_clients (
+                        sub_id TEXT PRIMARY KEY,
+                        end_at TIMESTAMPTZ
+                    )
+                    """
+                )
+                cur.copy_expert(
+                    "COPY panel_clients FROM STDIN WITH (FORMAT csv)", buffer
+                )
+                cur.execute(
+                    """
+                    CREATE TEMP TABLE server_subscriptions AS
+                    SELECT tg_id, end_at,
+                           substring(subscription_link FROM '/sub/([^/?#]+)') AS sub_id
+                    FROM subscriptions
+                    WHERE (server = %(server)s
+                           OR (%(unassigned)s AND server IS NULL
+                               AND country = %(country)s))
+                      AND updated_at < %(listed_at)s
+                    """,
+                    {
+                        "server": server,
+                        "country": country,
+                        "unassigned": include_unassigned,
+                        "listed_at": listed_at,
+                    },
+                )
+                cur.execute(
+                    """
+                    SELECT s.tg_id, s.sub_id, s.end_at AS db_end_at,
+                           p.end_at AS panel_end_at, p.sub_id IS NULL AS missing
+                    FROM server_subscriptions s
+                    LEFT JOIN panel_clients p ON p.sub_id = s.sub_id
+                    WHERE s.sub_id IS NOT NULL
+                      AND (p.sub_id IS NULL
+                           OR (p.end_at IS NOT NULL
+                               AND (s.end_at IS NULL
+                                    OR ABS(EXTRACT(EPOCH FROM p.end_at - s.end_at)) >= 1)))
+                    """
+                )
+                drift = cur.fetchall()
+        pull: list[tuple[int, datetime]] = []
+        missing: list[int] = []
+        for tg_id, sub_id, db_end_at, panel_end_at, is_missing in drift:
+            if is_missing:
+                missing.append(tg_id)
+            elif db_end_at is None or panel_end_at > db_end_at:
+                pull.append((tg_id, panel_end_at))
+            else:
+                diff.push.append((sub_id, db_end_at))
+
+        for start in range(0, len(pull), batch_size):
+            chunk = pull[start : start + batch_size]
+            with conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute(
+                        """
+                        UPDATE subscriptions s
+                        SET end_at = d.end_at, updated_at = NOW()
+                        FROM unnest(%s::bigint[], %s::timestamptz[]) AS d(tg_id, end_at)
+                        WHERE s.tg_id = d.tg_id AND s.updated_at < %s
+                        RETURNING s.tg_id, s.start_at, s.end_at, s.subscription_link,
+                                  s.instructions, s.country, s.server
+                        """,
+                        (
+                            [tg_id for tg_id, _ in chunk],
+                            [end_at for _, end_at in chunk],
+                            listed_at,
+                        ),
+                    )
+                    updated = cur.fetchall()
+            for row in updated:
+                _note_write(row["tg_id"])
+                _cache_set_subscription(
+                    row["tg_id"],
+                    row["start_at"],
+                    row["end_at"],
+                    row["subscription_link"],
+                    row["instructions"],
+                    row["country"],
+                    row["server"],
+                )
+                schedule_expiry_notifications(row["tg_id"], row["end_at"])
+            diff.pulled += len(updated)
+
+        for start in range(0, len(missing), batch_size):
+            chunk = missing[start : start + batch_size]
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        _ARCHIVE_SQL.format(
+                            source="WHERE tg_id = ANY(%s) AND updated_at < %s"
+                        ),
+                        (chunk, listed_at, HISTORY_MISSING),
+                    )
+                    removed = [row[0] for row in cur.fetchall()]
+            for tg_id in removed:
+                _note_write(tg_id)
+                _cache_clear_subscription(tg_id)
+            diff.removed += len(removed)
+    finally:
+        conn.close()
+    return diff
+
+
+@traced()
+def fetch_server_traffic(since: datetime) -> dict[str, int]:
+    """Total bytes per pool server in buckets starting at or after ``since``."""
+    with _connect_read() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT server, SUM(up_bytes + down_bytes)
+                FROM traffic_stats
+                WHERE bucket >= %s
+                GROUP BY server
+                """,
+                (since,),
+            )
+            return {row[0]: int(row[1]) for row in cur.fetchall()}
+
+
 def _cache_key(tg_id: int) -> str:
     return f"subscription:{tg_id}"
 
 
-def _cache_set_subscription(
-    tg_id: int,
+def _encode_cached_subscription(
     start_at: datetime | None,
     end_at: datetime | None,
     subscription_link: str | None,
     instructions: str | None,
     country: str | None = None,
-) -> None:
-    if not end_at:
-        return
+    server: str | None = None,
+) -> tuple[str, int] | None:
     end_at = _normalize_dt(end_at)
     if not end_at:
-        return
+        return None
     ttl = int((end_at - datetime.now(timezone.utc)).total_seconds())
     if ttl <= 0:
-        return
+        return None
     payload = json.dumps(
         {
             "start_at": start_at.isoformat() if start_at else None,
-            "end_at": end_at.isoformat() if end_at else None,
+            "end_at": end_at.isoformat(),
             "subscription_link": subscription_link,
             "instructions": instructions,
             "country": country,
+            "server": server,
         }
     )
+    return payload, ttl
+
+
+def _decode_cached_subscription(raw: str) -> dict:
+    data = json.loads(raw)
+    start_at = (
+        datetime.fromisoformat(data["start_at"]) if data.get("start_at") else None
+    )
+    end_at = datetime.fromisoformat(data["end_at"]) if data.get("end_at") else None
+    return {
+        "start_at": _normalize_dt(start_at),
+        "end_at": _normalize_dt(end_at),
+        "subscription_link": data.get("subscription_link"),
+        "instructions": data.get("instructions"),
+        "country": data.get("country") or "nl",
+        "server": data.get("server"),
+    }
+
+
+def _cache_set_subscription(
+    tg_id: int,
+    start_at: datetime | None,
+    end_at: datetime | None,
+    subscription_link: str | None,
+    instructions: str | None,
+    country: str | None = None,
+    server: str | None = None,
+) -> None:
+    encoded = _encode_cached_subscription(
+        start_at, end_at, subscription_link, instructions, country, server
+    )
+    if encoded is None:
+        return
+    payload, ttl = encoded
     try:
-        _redis().setex(_cache_key(tg_id), ttl, payload)
+        with span("redis.setex"):
+            _redis().setex(_cache_key(tg_id), ttl, payload)
     except redis.RedisError:
         return
 
 
 def _cache_get_subscription(tg_id: int) -> dict | None:
     try:
-        raw = _redis().get(_cache_key(tg_id))
+        with span("redis.get"):
+            raw = _redis().get(_cache_key(tg_id))
     except redis.RedisError:
         return None
     if not raw:
         return None
-    data = json.loads(raw)
-    start_at = (
-        datetime.fromisoformat(data["start_at"]) if data.get("start_at") else None
-    )
-    end_at = datetime.fromisoformat(data["end_at"]) if data.get("end_at") else None
-    end_at = _normalize_dt(end_at)
+    cached = _decode_cached_subscription(raw)
+    end_at = cached["end_at"]
     if end_at and end_at < datetime.now(timezone.utc):
         _cache_clear_subscription(tg_id)
         return None
-    return {
-        "start_at": _normalize_dt(start_at),
-        "end_at": end_at,
-        "subscription_link": data.get("subscription_link"),
-        "instructions": data.get("instructions"),
-        "country": data.get("country") or "nl",
-    }
+    return cached
 
 
 def _cache_clear_subscription(tg_id: int) -> None:
     try:
-        _redis().delete(_cache_key(tg_id))
+        with span("redis.delete"):
+            _redis().delete(_cache_key(tg_id))
     except redis.RedisError:
         return
 
 
+NOTIFY_DUE_KEY = "notify:due"
+NOTIFY_THREE_DAYS = "three_days"
+NOTIFY_EXPIRED = "expired"
+NOTIFY_LEAD = timedelta(days=3)
+
+
+def notification_member(kind: str, tg_id: int, end_at: datetime) -> str:
+    return f"{kind}:{tg_id}:{int(end_at.timestamp())}"
+
+
+def parse_notification_member(member: str) -> tuple[str, int, datetime]:
+    kind, tg_id, end_ts = member.split(":")
+    return kind, int(tg_id), datetime.fromtimestamp(int(end_ts), tz=timezone.utc)
+
+
+def _notification_plan(tg_id: int, end_at: datetime) -> dict[str, float]:
+    """``notify:due`` members with their due time in epoch seconds."""
+    return {
+        notification_member(NOTIFY_THREE_DAYS, tg_id, end_at): (
+            end_at - NOTIFY_LEAD
+        ).timestamp(),
+        notification_member(NOTIFY_EXPIRED, tg_id, end_at): end_at.timestamp(),
+    }
+
+
+def schedule_expiry_notifications(tg_id: int, end_at: datetime | None) -> None:
+    """Plan the 3-day and expiry notices of a subscription ending at ``end_at``.
+
+    Members planned for an older end date stay in the set; the drain drops
+    them once they no longer match the subscription.
+    """
+    end_at = _normalize_dt(end_at)
+    if end_at is None:
+        return
+    try:
+        with span("redis.zadd"):
+            _redis().zadd(NOTIFY_DUE_KEY, _notification_plan(tg_id, end_at))
+    except redis.RedisError:
+        logger.warning("Expiry notification planning failed for tg_id=%s", tg_id)
+
+
+@traced()
+def schedule_all_expiry_notifications(batch_size: int = 1000) -> int:
+    """Re-plan every subscription; members are deterministic, so this is idempotent."""
+    rows = fetch_subscription_end_dates()
+    client = _redis()
+    for start in range(0, len(rows), batch_size):
+        plan: dict[str, float] = {}
+        for row in rows[start : start + batch_size]:
+            plan.update(_notification_plan(row["tg_id"], _normalize_dt(row["end_at"])))
+        with span("redis.zadd"):
+            client.zadd(NOTIFY_DUE_KEY, plan)
+    return len(rows)
+
+
 def _normalize_dt(value: datetime | None) -> datetime | None:
     if not value:
         return None
@@ -0,0 +1,290 @@
+"""Request-scoped span tracing for updates, storage, Redis and XUI calls."""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import httpx
+
+from app.config import TraceSettings, get_trace_settings
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 2.0
+MAX_BUFFER = 2048
+
+
+@dataclass
+class Span:
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+    name: str
+    start_ns: int
+    start: float
+    duration_ms: float | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: str | None = None
+
+
+@dataclass
+class Trace:
+    trace_id: str
+    spans: list[Span] = field(default_factory=list)
+
+
+_current_trace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar(
+    "trace", default=None
+)
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "span", default=None
+)
+_buffer: list[Span] = []
+_listeners: list[Callable[[Trace], None]] = []
+_settings: TraceSettings | None = None
+
+
+def _get_settings() -> TraceSettings:
+    global _settings
+    if _settings is None:
+        _settings = get_trace_settings()
+    return _settings
+
+
+def current_trace_id() -> str | None:
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+
+def _open_span(
+    trace: Trace, name: str, attributes: dict[str, Any], parent: Span | None
+) -> Span:
+    item = Span(
+        trace_id=trace.trace_id,
+        span_id=os.urandom(8).hex(),
+        parent_id=parent.span_id if parent else None,
+        name=name,
+        start_ns=time.time_ns(),
+        start=time.perf_counter(),
+        attributes=dict(attributes),
+    )
+    trace.spans.append(item)
+    return item
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span | None]:
+    """Record a child span of the current trace; no-op outside a trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    item = _open_span(trace, name, attributes, _current_span.get())
+    token = _current_span.set(item)
+    try:
+        yield item
+    except BaseException as exc:
+        item.error = type(exc).__name__
+        raise
+    finally:
+        item.duration_ms = (time.perf_counter() - item.start) * 1000
+        _current_span.reset(token)
+
+
+@contextmanager
+def start_trace(name: str, **attributes: Any) -> Iterator[Span]:
+    """Open a root span with a fresh trace ID and export it on exit."""
+    trace = Trace(trace_id=os.urandom(16).hex())
+    trace_token = _current_trace.set(trace)
+    root = _open_span(trace, name, attributes, None)
+    span_token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as exc:
+        root.error = type(exc).__name__
+        raise
+    finally:
+        root.duration_ms = (time.perf_counter() - root.start) * 1000
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        _finish_trace(trace, root)
+
+
+def add_listener(callback: Callable[[Trace], None]) -> None:
+    """Register a callback that receives every finished trace in-process."""
+    _listeners.append(callback)
+
+
+def traced(name: str | None = None):
+    """Decorate a sync or async function so each call runs inside a span."""
+
+    def decorator(func):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _finish_trace(trace: Trace, root: Span) -> None:
+    for callback in _listeners:
+        callback(trace)
+    settings = _get_settings()
+    if settings.slow_update_ms and (root.duration_ms or 0) >= settings.slow_update_ms:
+        logger.warning(
+            "Slow update %.1fms trace=%s\n%s",
+            root.duration_ms,
+            trace.trace_id,
+            format_span_tree(trace.spans),
+        )
+    if not settings.exporter:
+        return
+    if len(_buffer) + len(trace.spans) > MAX_BUFFER:
+        logger.warning("Trace buffer full, dropping trace=%s", trace.trace_id)
+        return
+    _buffer.extend(trace.spans)
+
+
+def format_span_tree(spans: list[Span]) -> str:
+    children: dict[str | None, list[Span]] = {}
+    for item in spans:
+        children.setdefault(item.parent_id, []).append(item)
+    lines: list[str] = []
+
+    def walk(parent_id: str | None, depth: int) -> None:
+        for item in sorted(children.get(parent_id, []), key=lambda s: s.start):
+            duration = item.duration_ms if item.duration_ms is not None else -1.0
+            suffix = f" error={item.error}" if item.error else ""
+            attrs = " ".join(f"{k}={v}" for k, v in item.attributes.items())
+            lines.append(
+                f"{'  ' * depth}{item.name} {duration:.1f}ms {attrs}{suffix}".rstrip()
+            )
+            walk(item.span_id, depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+def _span_to_dict(item: Span) -> dict:
+    return {
+        "trace_id": item.trace_id,
+        "span_id": item.span_id,
+        "parent_id": item.parent_id,
+        "name": item.name,
+        "start_ns": item.start_ns,
+        "duration_ms": round(item.duration_ms or 0.0, 3),
+        "attributes": item.attributes,
+        "error": item.error,
+    }
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_payload(spans: list[Span], service_name: str) -> dict:
+    otlp_spans = []
+    for item in spans:
+        end_ns = item.start_ns + int((item.duration_ms or 0.0) * 1_000_000)
+        otlp_span = {
+            "traceId": item.trace_id,
+            "spanId": item.span_id,
+            "name": item.name,
+            "kind": 1,
+            "startTimeUnixNano": str(item.start_ns),
+            "endTimeUnixNano": str(end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in item.attributes.items()
+            ],
+            "status": {"code": 2, "message": item.error} if item.error else {},
+        }
+        if item.parent_id:
+            otlp_span["parentSpanId"] = item.parent_id
+        otlp_spans.append(otlp_span)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": service_name}}
+                    ]
+                },
+                "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": otlp_spans}],
+            }
+        ]
+    }
+
+
+def _write_jsonl(path: str, spans: list[Span]) -> None:
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with target.open("a", encoding="utf-8") as fh:
+        for item in spans:
+            fh.write(json.dumps(_span_to_dict(item), ensure_ascii=False) + "\n")
+
+
+async def flush(client: httpx.AsyncClient | None = None) -> None:
+    if not _buffer:
+        return
+    spans = _buffer[:]
+    del _buffer[:]
+    settings = _get_settings()
+    try:
+        if settings.exporter == "jsonl":
+            await asyncio.to_thread(_write_jsonl, settings.file_path, spans)
+        elif settings.exporter == "otlp" and client is not None:
+            response = await client.post(
+                settings.otlp_endpoint,
+                json=_otlp_payload(spans, settings.service_name),
+            )
+            response.raise_for_status()
+    except (OSError, httpx.HTTPError):
+        logger.exception("Trace export failed, dropped %s spans", len(spans))
+
+
+async def run_exporter() -> None:
+    """Periodically flush finished spans to the configured exporter."""
+    settings = _get_settings()
+    if not settings.exporter:
+        return
+    client = None
+    if settings.exporter == "otlp":
+        client = httpx.AsyncClient(timeout=httpx.Timeout(5.0))
+    try:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await flush(client)
+    finally:
+        await flush(client)
+        if client is not None:
+            await client.aclose()
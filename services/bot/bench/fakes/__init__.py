@@ -0,0 +1,3 @@
+from bench.fakes import cryptobot, telegram, xui
+
+__all__ = ["cryptobot", "telegram", "xui"]
@@ -0,0 +1,82 @@
+"""Minimal stand-in for the Crypto Pay API used by invoice top-ups."""
+
+from __future__ import annotations
+
+import itertools
+from collections import Counter
+
+from aiohttp import web
+
+TOKEN_HEADER = "Crypto-Pay-API-Token"
+
+
+class FakeCryptoBot:
+    def __init__(self, token: str = "bench-token"):
+        self.token = token
+        self.invoices: dict[str, dict] = {}
+        self.calls: Counter[str] = Counter()
+        self._ids = itertools.count(1)
+        self._runner: web.AppRunner | None = None
+        self.base_url = ""
+
+    def pay(self, invoice_id: str | int) -> None:
+        self.invoices[str(invoice_id)]["status"] = "paid"
+
+    def expire(self, invoice_id: str | int) -> None:
+        self.invoices[str(invoice_id)]["status"] = "expired"
+
+    @staticmethod
+    def _error(name: str, code: int = 400) -> web.Response:
+        return web.json_response(
+            {"ok": False, "error": {"code": code, "name": name}}, status=code
+        )
+
+    async def _params(self, request: web.Request) -> dict:
+        if request.can_read_body:
+            return await request.json()
+        return dict(request.query)
+
+    async def _dispatch(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        if request.headers.get(TOKEN_HEADER) != self.token:
+            return self._error("UNAUTHORIZED", 401)
+        params = await self._params(request)
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {"name": "bench"}})
+        if method == "createInvoice":
+            invoice_id = next(self._ids)
+            invoice = {
+                "invoice_id": invoice_id,
+                "status": "active",
+                "currency_type": params.get("currency_type", "crypto"),
+                "fiat": params.get("fiat"),
+                "amount": str(params.get("amount")),
+                "description": params.get("description"),
+                "payload": params.get("payload"),
+                "bot_invoice_url": f"https://t.me/CryptoBot?start=IV{invoice_id}",
+            }
+            self.invoices[str(invoice_id)] = invoice
+            return web.json_response({"ok": True, "result": invoice})
+        if method == "getInvoices":
+            ids = str(params.get("invoice_ids", "")).split(",")
+            items = [self.invoices[item] for item in ids if item in self.invoices]
+            return web.json_response({"ok": True, "result": {"items": items}})
+        return self._error("METHOD_NOT_FOUND", 404)
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/api/{method}", self._dispatch)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        bound_host, bound_port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{bound_host}:{bound_port}/api"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
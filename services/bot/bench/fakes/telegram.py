@@ -0,0 +1,78 @@
+"""Minimal stand-in for the Telegram Bot API with configurable latency."""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+from collections import Counter
+
+from aiohttp import web
+
+BOT_USER = {
+    "id": 100000001,
+    "is_bot": True,
+    "first_name": "NYX Bench",
+    "username": "nyx_bench_bot",
+}
+
+
+class FakeTelegram:
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.calls: Counter[str] = Counter()
+        self._message_ids = itertools.count(1)
+        self._runner: web.AppRunner | None = None
+        self.base_url = ""
+
+    def _message(self, form) -> dict:
+        chat_id = int(form.get("chat_id") or 0)
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        if "text" in form:
+            message["text"] = form["text"]
+        if "caption" in form:
+            message["caption"] = form["caption"]
+        if "photo" in form:
+            message["photo"] = [
+                {
+                    "file_id": "bench-photo",
+                    "file_unique_id": "bench-photo",
+                    "width": 640,
+                    "height": 640,
+                }
+            ]
+        return message
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        form = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == "getMe":
+            result: object = BOT_USER
+        elif method in {"sendMessage", "sendPhoto", "editMessageText", "editMessageCaption"}:
+            result = self._message(form)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application(client_max_size=32 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_host, bound_port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{bound_host}:{bound_port}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,136 @@
+"""Minimal stand-in for a 3x-ui panel with configurable latency and size."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from collections import Counter
+from pathlib import Path
+from uuid import uuid4
+
+from aiohttp import web
+
+BASE_PATH = "/bench"
+
+
+def make_clients(count: int, prefix: str = "seed") -> list[dict]:
+    expiry = int((time.time() + 30 * 86400) * 1000)
+    return [
+        {
+            "id": str(uuid4()),
+            "email": f"@{prefix}_{index}",
+            "enable": True,
+            "expiryTime": expiry,
+            "totalGB": 0,
+            "limitIp": 0,
+            "subId": uuid4().hex,
+        }
+        for index in range(count)
+    ]
+
+
+def load_clients(path: str | Path, server: str | None = None) -> list[dict]:
+    """Clients of one server from a ``bench.seed --panel-json`` dataset."""
+    servers = json.loads(Path(path).read_text())["servers"]
+    name = server or next(iter(servers))
+    return servers[name]["clients"]
+
+
+class FakeXui:
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        clients: int = 0,
+        inbound_id: int = 1,
+        clients_data: list[dict] | None = None,
+    ):
+        self.latency = latency_ms / 1000
+        self.inbound_id = inbound_id
+        self.clients: list[dict] = (
+            clients_data if clients_data is not None else make_clients(clients)
+        )
+        self.online: list[str] = []
+        self.traffic: dict[str, tuple[int, int]] = {}
+        self.calls: Counter[str] = Counter()
+        self._runner: web.AppRunner | None = None
+        self.base_url = ""
+
+    async def _delay(self, name: str) -> None:
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def _login(self, request: web.Request) -> web.Response:
+        await self._delay("login")
+        response = web.json_response({"success": True, "msg": "", "obj": None})
+        response.set_cookie("3x-ui", "bench-session")
+        return response
+
+    def _inbound(self) -> dict:
+        return {
+            "id": self.inbound_id,
+            "remark": "bench",
+            "protocol": "vless",
+            "port": 443,
+            "enable": True,
+            "settings": json.dumps({"clients": self.clients, "decryption": "none"}),
+            "clientStats": [
+                {
+                    "inboundId": self.inbound_id,
+                    "email": client["email"],
+                    "up": self.traffic.get(client["email"], (0, 0))[0],
+                    "down": self.traffic.get(client["email"], (0, 0))[1],
+                }
+                for client in self.clients
+            ],
+        }
+
+    async def _list(self, request: web.Request) -> web.Response:
+        await self._delay("list")
+        return web.json_response(
+            {"success": True, "msg": "", "obj": [self._inbound()]}
+        )
+
+    async def _onlines(self, request: web.Request) -> web.Response:
+        await self._delay("onlines")
+        return web.json_response({"success": True, "msg": "", "obj": self.online})
+
+    async def _add_client(self, request: web.Request) -> web.Response:
+        await self._delay("addClient")
+        form = await request.post()
+        if int(form.get("id") or 0) != self.inbound_id:
+            return web.json_response({"success": False, "msg": "inbound not found"})
+        settings = json.loads(form.get("settings") or "{}")
+        new_clients = settings.get("clients") or []
+        existing = {client["email"] for client in self.clients}
+        for client in new_clients:
+            if client.get("email") in existing:
+                return web.json_response(
+                    {"success": False, "msg": f"Duplicate email: {client['email']}"}
+                )
+        self.clients.extend(new_clients)
+        return web.json_response({"success": True, "msg": "", "obj": None})
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(f"{BASE_PATH}/login", self._login)
+        app.router.add_get(f"{BASE_PATH}/panel/api/inbounds/list", self._list)
+        app.router.add_post(
+            f"{BASE_PATH}/panel/api/inbounds/addClient", self._add_client
+        )
+        app.router.add_post(f"{BASE_PATH}/panel/api/inbounds/onlines", self._onlines)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_host, bound_port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{bound_host}:{bound_port}{BASE_PATH}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
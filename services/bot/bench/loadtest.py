@@ -0,0 +1,294 @@
+"""Replay scripted user journeys against the real dispatcher.
+
+Starts fake Telegram Bot API and 3x-ui servers, wires the bot to them and
+feeds updates through ``create_dispatcher()``. Postgres and Redis are the
+real local instances from ``DATABASE_URL`` / ``REDIS_URL``.
+
+Usage::
+
+    PYTHONPATH=. python -m bench.loadtest --journey trial --users 200 --rate 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+from bench.fakes.telegram import BOT_USER, FakeTelegram
+from bench.fakes.xui import FakeXui, load_clients
+
+BENCH_TOKEN = "100000001:BENCH-TOKEN"
+
+JOURNEYS: dict[str, list[tuple[str, str]]] = {
+    "trial": [
+        ("message", "/start"),
+        ("message", "💼 Тарифы"),
+        ("callback", "tariff:trial"),
+        ("message", "👤 Личный кабинет"),
+    ],
+    "browse": [
+        ("message", "/start"),
+        ("message", "💼 Тарифы"),
+        ("callback", "tariff:connect"),
+        ("callback", "country:nl"),
+        ("message", "👤 Личный кабинет"),
+        ("callback", "balance:open"),
+    ],
+    "cabinet": [
+        ("message", "👤 Личный кабинет"),
+        ("callback", "balance:open"),
+        ("callback", "back:cabinet"),
+    ],
+}
+
+
+@dataclass
+class Stats:
+    latencies: list[float] = field(default_factory=list)
+    per_step: dict[str, list[float]] = field(default_factory=dict)
+    errors: int = 0
+    calls: Counter[str] = field(default_factory=Counter)
+
+
+class UpdateFactory:
+    def __init__(self) -> None:
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    @staticmethod
+    def _user(tg_id: int) -> dict:
+        return {
+            "id": tg_id,
+            "is_bot": False,
+            "first_name": "Bench",
+            "username": f"bench_{tg_id}",
+        }
+
+    def message(self, tg_id: int, text: str) -> dict:
+        return {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": tg_id, "type": "private"},
+                "from": self._user(tg_id),
+                "text": text,
+            },
+        }
+
+    def callback(self, tg_id: int, data: str) -> dict:
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": f"{tg_id}-{next(self._message_ids)}",
+                "from": self._user(tg_id),
+                "chat_instance": str(tg_id),
+                "data": data,
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": tg_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": "bench",
+                },
+            },
+        }
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def _count_spans(stats: Stats):
+    def listener(trace) -> None:
+        for item in trace.spans:
+            stats.calls[item.name.split(".", 1)[0]] += 1
+
+    return listener
+
+
+def _cleanup(tg_ids: list[int]) -> None:
+    from app.storage import _cache_clear_subscription, _connect
+
+    with _connect() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM subscriptions WHERE tg_id = ANY(%s)", (tg_ids,))
+            cur.execute(
+                "DELETE FROM provisioning_jobs WHERE tg_id = ANY(%s)", (tg_ids,)
+            )
+            cur.execute("DELETE FROM users WHERE tg_id = ANY(%s)", (tg_ids,))
+    for tg_id in tg_ids:
+        _cache_clear_subscription(tg_id)
+
+
+async def _run_user(
+    dp, bot, factory: UpdateFactory, tg_id: int, steps, stats: Stats, think: float
+) -> None:
+    from aiogram.types import Update
+
+    for kind, payload in steps:
+        raw = (
+            factory.message(tg_id, payload)
+            if kind == "message"
+            else factory.callback(tg_id, payload)
+        )
+        update = Update.model_validate(raw, context={"bot": bot})
+        started = time.perf_counter()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception:
+            stats.errors += 1
+            logging.getLogger(__name__).exception("Update failed: %s", payload)
+        elapsed = (time.perf_counter() - started) * 1000
+        stats.latencies.append(elapsed)
+        stats.per_step.setdefault(f"{kind}:{payload}", []).append(elapsed)
+        if think:
+            await asyncio.sleep(think)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    fake_tg = FakeTelegram(latency_ms=args.tg_latency_ms)
+    fake_xui = FakeXui(
+        latency_ms=args.xui_latency_ms,
+        clients=args.xui_clients,
+        clients_data=(
+            load_clients(args.xui_dataset, args.xui_server) if args.xui_dataset else None
+        ),
+    )
+    await fake_tg.start()
+    xui_url = await fake_xui.start()
+    for prefix in ("", "NL_"):
+        os.environ[f"{prefix}XUI_URL"] = xui_url
+        os.environ[f"{prefix}XUI_USERNAME"] = "bench"
+        os.environ[f"{prefix}XUI_PASSWORD"] = "bench"
+        os.environ[f"{prefix}XUI_INBOUND_ID"] = str(fake_xui.inbound_id)
+        os.environ.pop(f"{prefix}XUI_SUB_URL", None)
+    os.environ.setdefault("TRACE_SLOW_UPDATE_MS", "0")
+
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    from app import tracing
+    from app.main import create_bot, create_dispatcher
+    from app.provisioning import run_provisioning_workers
+    from app.storage import init_db
+
+    if args.migrate:
+        init_db()
+    tg_ids = [args.tg_id_base + index for index in range(args.users)]
+    if not args.keep_data:
+        _cleanup(tg_ids)
+
+    stats = Stats()
+    tracing.add_listener(_count_spans(stats))
+    session = AiohttpSession(api=TelegramAPIServer.from_base(fake_tg.base_url))
+    bot = create_bot(BENCH_TOKEN, session=session)
+    dp = create_dispatcher()
+    factory = UpdateFactory()
+    steps = JOURNEYS[args.journey]
+
+    workers = asyncio.create_task(run_provisioning_workers(bot))
+    started = time.perf_counter()
+    tasks = []
+    try:
+        for tg_id in tg_ids:
+            tasks.append(
+                asyncio.create_task(
+                    _run_user(
+                        dp, bot, factory, tg_id, steps, stats, args.think_ms / 1000
+                    )
+                )
+            )
+            await asyncio.sleep(1 / args.rate)
+        await asyncio.gather(*tasks)
+    finally:
+        wall = time.perf_counter() - started
+        workers.cancel()
+        await bot.session.close()
+        await fake_tg.stop()
+        await fake_xui.stop()
+
+    return {
+        "journey": args.journey,
+        "users": args.users,
+        "rate": args.rate,
+        "updates": len(stats.latencies),
+        "errors": stats.errors,
+        "wall_s": round(wall, 3),
+        "updates_per_s": round(len(stats.latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(_percentile(stats.latencies, 0.50), 2),
+        "p95_ms": round(_percentile(stats.latencies, 0.95), 2),
+        "p99_ms": round(_percentile(stats.latencies, 0.99), 2),
+        "db_calls": stats.calls["storage"],
+        "redis_calls": stats.calls["redis"],
+        "xui_calls": stats.calls["xui"],
+        "telegram_calls": stats.calls["telegram"],
+        "steps": {
+            name: {
+                "p50_ms": round(_percentile(values, 0.50), 2),
+                "p95_ms": round(_percentile(values, 0.95), 2),
+            }
+            for name, values in stats.per_step.items()
+        },
+    }
+
+
+def _print_report(result: dict) -> None:
+    print(
+        f"journey={result['journey']} users={result['users']} rate={result['rate']}/s "
+        f"updates={result['updates']} errors={result['errors']} wall={result['wall_s']}s"
+    )
+    print(
+        f"throughput={result['updates_per_s']} updates/s "
+        f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms"
+    )
+    print(
+        f"db_calls={result['db_calls']} redis_calls={result['redis_calls']} "
+        f"xui_calls={result['xui_calls']} telegram_calls={result['telegram_calls']}"
+    )
+    for name, values in result["steps"].items():
+        print(f"  {name:<32} p50={values['p50_ms']}ms p95={values['p95_ms']}ms")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--journey", choices=sorted(JOURNEYS), default="trial")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=10.0, help="new users per second")
+    parser.add_argument("--think-ms", type=float, default=0.0)
+    parser.add_argument("--tg-latency-ms", type=float, default=30.0)
+    parser.add_argument("--xui-latency-ms", type=float, default=50.0)
+    parser.add_argument("--xui-clients", type=int, default=500)
+    parser.add_argument("--xui-dataset", help="bench.seed --panel-json file")
+    parser.add_argument("--xui-server", help="server of --xui-dataset to serve")
+    parser.add_argument("--tg-id-base", type=int, default=9_000_000_000)
+    parser.add_argument("--migrate", action="store_true", help="run init_db() first")
+    parser.add_argument("--keep-data", action="store_true")
+    parser.add_argument("--json", dest="json_path", help="write the report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+    _print_report(result)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, ensure_ascii=False, indent=2)
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
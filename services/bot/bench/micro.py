@@ -0,0 +1,262 @@
+"""Micro-benchmarks for per-tap hot paths with stored baselines.
+
+Cases follow the pytest-benchmark shape: each receives a ``benchmark``
+callable and passes it the function under test plus its arguments.
+
+Usage::
+
+    PYTHONPATH=. python -m bench.micro                 # run and print
+    PYTHONPATH=. python -m bench.micro --save          # overwrite the baseline
+    PYTHONPATH=. python -m bench.micro --compare       # fail on regressions
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable
+from uuid import uuid4
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baselines" / "micro.json"
+MIN_ROUND_SECONDS = 0.05
+
+CASES: dict[str, Callable] = {}
+
+
+def case(name: str):
+    def decorator(func):
+        CASES[name] = func
+        return func
+
+    return decorator
+
+
+class Benchmark:
+    def __init__(self, rounds: int):
+        self.rounds = rounds
+        self.result: dict | None = None
+
+    def __call__(self, func: Callable, *args, **kwargs):
+        iterations = 1
+        while True:
+            started = time.perf_counter()
+            for _ in range(iterations):
+                value = func(*args, **kwargs)
+            elapsed = time.perf_counter() - started
+            if elapsed >= MIN_ROUND_SECONDS or iterations >= 1_000_000:
+                break
+            iterations *= 2
+        samples = []
+        for _ in range(self.rounds):
+            started = time.perf_counter()
+            for _ in range(iterations):
+                func(*args, **kwargs)
+            samples.append((time.perf_counter() - started) / iterations * 1e6)
+        self.result = {
+            "iterations": iterations,
+            "rounds": self.rounds,
+            "min_us": round(min(samples), 3),
+            "median_us": round(statistics.median(samples), 3),
+            "mean_us": round(statistics.fmean(samples), 3),
+        }
+        return value
+
+
+def _inbounds_payload(inbounds: int, clients_per_inbound: int) -> dict:
+    expiry = int((time.time() + 30 * 86400) * 1000)
+    obj = []
+    for inbound_id in range(1, inbounds + 1):
+        clients = [
+            {
+                "id": str(uuid4()),
+                "email": f"@user_{inbound_id}_{index}",
+                "enable": True,
+                "expiryTime": expiry,
+                "totalGB": 0,
+                "limitIp": 0,
+                "subId": uuid4().hex,
+            }
+            for index in range(clients_per_inbound)
+        ]
+        obj.append(
+            {
+                "id": inbound_id,
+                "protocol": "vless",
+                "settings": json.dumps({"clients": clients, "decryption": "none"}),
+            }
+        )
+    return {"success": True, "msg": "", "obj": obj}
+
+
+def _xui_db(path: Path, inbounds: int, clients_per_inbound: int) -> None:
+    con = sqlite3.connect(path)
+    try:
+        con.execute("CREATE TABLE inbounds (id INTEGER PRIMARY KEY, settings TEXT)")
+        payload = _inbounds_payload(inbounds, clients_per_inbound)
+        con.executemany(
+            "INSERT INTO inbounds (id, settings) VALUES (?, ?)",
+            [(item["id"], item["settings"]) for item in payload["obj"]],
+        )
+        con.commit()
+    finally:
+        con.close()
+
+
+@case("cache.encode_subscription")
+def bench_cache_encode(benchmark) -> None:
+    from app.storage import _encode_cached_subscription
+    from app.vpn_instructions import vpn_instructions
+
+    now = datetime.now(timezone.utc)
+    link = f"https://example.test/sub/{uuid4().hex}"
+    benchmark(
+        _encode_cached_subscription,
+        now,
+        now + timedelta(days=30),
+        link,
+        vpn_instructions(link),
+        "nl",
+    )
+
+
+@case("cache.decode_subscription")
+def bench_cache_decode(benchmark) -> None:
+    from app.storage import _decode_cached_subscription, _encode_cached_subscription
+    from app.vpn_instructions import vpn_instructions
+
+    now = datetime.now(timezone.utc)
+    link = f"https://example.test/sub/{uuid4().hex}"
+    payload, _ = _encode_cached_subscription(
+        now, now + timedelta(days=30), link, vpn_instructions(link), "nl"
+    )
+    benchmark(_decode_cached_subscription, payload)
+
+
+@case("xui.get_client_subscription_15k")
+def bench_xui_parse(benchmark) -> None:
+    import httpx
+
+    from app.config import XuiSettings
+    from app.services.xui_client import XuiClient
+
+    body = json.dumps(_inbounds_payload(3, 5000)).encode()
+    transport = httpx.MockTransport(
+        lambda request: httpx.Response(
+            200, content=body, headers={"content-type": "application/json"}
+        )
+    )
+    client = XuiClient.from_settings(
+        XuiSettings("http://xui.test/base", "u", "p", 3, None)
+    )
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(client.close())
+        client._client = httpx.AsyncClient(
+            base_url="http://xui.test", transport=transport
+        )
+        benchmark(
+            lambda: loop.run_until_complete(
+                client.get_client_subscription("@user_3_4999")
+            )
+        )
+        loop.run_until_complete(client.close())
+    finally:
+        loop.close()
+
+
+@case("xui_db.find_sub_id_15k")
+def bench_find_sub_id(benchmark) -> None:
+    from app.services.xui_db import _find_sub_id
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "x-ui.db"
+        _xui_db(path, 3, 5000)
+        benchmark(_find_sub_id, "user_3_4999", str(path))
+
+
+@case("vpn_instructions.render")
+def bench_vpn_instructions(benchmark) -> None:
+    from app.vpn_instructions import vpn_instructions
+
+    benchmark(vpn_instructions, f"https://example.test/sub/{uuid4().hex}")
+
+
+def run_cases(names: list[str], rounds: int) -> dict[str, dict]:
+    results = {}
+    for name in names:
+        bench = Benchmark(rounds)
+        CASES[name](bench)
+        results[name] = bench.result
+        print(
+            f"{name:<36} median={bench.result['median_us']:>12.3f}us "
+            f"min={bench.result['min_us']:>12.3f}us iterations={bench.result['iterations']}"
+        )
+    return results
+
+
+def compare(
+    results: dict[str, dict], baseline: dict[str, dict], threshold: float
+) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"{name:<36} no baseline")
+            continue
+        ratio = result["min_us"] / base["min_us"] if base["min_us"] else 1.0
+        status = "REGRESSION" if ratio > 1 + threshold else "ok"
+        print(f"{name:<36} {ratio:>6.2f}x baseline  {status}")
+        if status != "ok":
+            regressions.append(name)
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", dest="pattern", help="run cases containing this text")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--save", action="store_true", help="write results as baseline")
+    parser.add_argument("--compare", action="store_true", help="compare to baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.20,
+        help="allowed slowdown before flagging a regression (0.20 = 20%%)",
+    )
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    args = parser.parse_args(argv)
+
+    names = [name for name in CASES if not args.pattern or args.pattern in name]
+    results = run_cases(names, args.rounds)
+    if args.save:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        document = {
+            "machine": {
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+            },
+            "results": results,
+        }
+        args.baseline.write_text(json.dumps(document, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline written to {args.baseline}")
+    if args.compare:
+        if not args.baseline.exists():
+            print(f"Baseline not found: {args.baseline}")
+            return 2
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))["results"]
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,474 @@
+"""Reproducible synthetic dataset for scale tests.
+
+Generates ``users`` with referral chains and ``subscriptions`` with a trial
+and paid mix across countries and servers, and bulk-loads both with ``COPY``.
+The same pass produces the panel side: a 3x-ui ``x-ui.db`` with one inbound
+per server and a JSON dataset that ``bench.fakes.xui.load_clients`` feeds to
+``FakeXui``. The same ``--seed`` always yields the same rows, ids and links.
+
+Seeded users live in ``[--tg-id-base, --tg-id-base + 10**9)``; ``--reset``
+deletes exactly that range before loading.
+
+Usage::
+
+    PYTHONPATH=. python -m bench.seed --users 1000000 --migrate --reset
+    PYTHONPATH=. python -m bench.seed --users 100000 --no-db \\
+        --xui-db /tmp/x-ui.db --panel-json /tmp/panel.json --drift 0.01
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import json
+import random
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterator
+
+SEED_SPAN = 10**9
+COPY_CHUNK = 100_000
+DAY = timedelta(days=1)
+
+USER_COLUMNS = (
+    "tg_id",
+    "username",
+    "referrer_tg_id",
+    "referral_balance",
+    "balance",
+    "first_payment_done",
+    "created_at",
+)
+SUBSCRIPTION_COLUMNS = (
+    "tg_id",
+    "start_at",
+    "end_at",
+    "subscription_link",
+    "instructions",
+    "country",
+    "server",
+    "updated_at",
+)
+
+
+@dataclass(frozen=True)
+class SeedConfig:
+    users: int = 100_000
+    seed: int = 1
+    tg_id_base: int = 7_000_000_000
+    subscribed_share: float = 0.6
+    trial_share: float = 0.35
+    referral_share: float = 0.3
+    unnamed_share: float = 0.1
+    # server name -> (country, weight)
+    servers: dict[str, tuple[str, float]] = field(
+        default_factory=lambda: {"nl": ("nl", 0.7), "fi": ("fi", 0.3)}
+    )
+    sub_url: str = "https://sub.seed.test"
+    drift: float = 0.0
+
+
+@dataclass
+class PanelClient:
+    email: str
+    sub_id: str
+    client_id: str
+    expiry_ms: int
+    enable: bool = True
+
+    def to_settings(self) -> dict:
+        return {
+            "id": self.client_id,
+            "flow": "",
+            "email": self.email,
+            "limitIp": 0,
+            "totalGB": 0,
+            "expiryTime": self.expiry_ms,
+            "enable": self.enable,
+            "tgId": "",
+            "subId": self.sub_id,
+            "reset": 0,
+        }
+
+
+@dataclass
+class SeedReport:
+    users: int = 0
+    subscriptions: int = 0
+    active: int = 0
+    trials: int = 0
+    referred: int = 0
+    panel_clients: int = 0
+    seconds: float = 0.0
+
+
+def _uuid(rng: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def _ms(value: datetime) -> int:
+    return int(value.timestamp() * 1000)
+
+
+def generate(
+    config: SeedConfig, now: datetime, report: SeedReport
+) -> Iterator[tuple[tuple, tuple | None, str | None, PanelClient | None]]:
+    """Yield ``(user_row, subscription_row, server, panel_client)`` per user.
+
+    Referrers are picked among recent earlier users, so invites form chains
+    rather than a flat star. Trials last three days and mostly ended already;
+    paid subscriptions are 1, 3 or 6 months started within the last half
+    year, which leaves a realistic share expiring in the next few days.
+    """
+    rng = random.Random(config.seed)
+    names = list(config.servers)
+    weights = [config.servers[name][1] for name in names]
+    for index in range(config.users):
+        tg_id = config.tg_id_base + index
+        username = None if rng.random() < config.unnamed_share else f"seed_{index}"
+        created_at = now - timedelta(seconds=rng.uniform(0, 365 * 86400))
+        referrer = None
+        if index and rng.random() < config.referral_share:
+            back = 1 + int(rng.expovariate(1 / 50))
+            referrer = config.tg_id_base + max(index - back, 0)
+            report.referred += 1
+        subscription = None
+        server = None
+        client = None
+        paid = False
+        if rng.random() < config.subscribed_share:
+            server = rng.choices(names, weights)[0]
+            if rng.random() < config.trial_share:
+                start_at = now - timedelta(days=rng.uniform(0, 30))
+                end_at = start_at + 3 * DAY
+                report.trials += 1
+            else:
+                start_at = now - timedelta(days=rng.uniform(0, 180))
+                end_at = start_at + 30 * rng.choice((1, 1, 1, 1, 3, 6)) * DAY
+                paid = True
+            sub_id = _uuid(rng).hex
+            subscription = (
+                tg_id,
+                start_at,
+                end_at,
+                f"{config.sub_url}/sub/{sub_id}",
+                None,
+                config.servers[server][0],
+                server,
+                start_at,
+            )
+            client = PanelClient(
+                email=f"@{username or f'tg_{tg_id}'}",
+                sub_id=sub_id,
+                client_id=str(_uuid(rng)),
+                expiry_ms=_ms(end_at),
+            )
+            report.subscriptions += 1
+            if end_at > now:
+                report.active += 1
+        user = (
+            tg_id,
+            username,
+            referrer,
+            rng.choice((0, 0, 0, 0, 75, 150)),
+            rng.choice((0, 0, 150, 300, 500)) if paid else 0,
+            paid,
+            created_at,
+        )
+        report.users += 1
+        yield user, subscription, server, client
+
+
+def apply_drift(
+    clients: list[PanelClient], share: float, rng: random.Random, now: datetime
+) -> list[PanelClient]:
+    """Make a ``share`` of panel clients disagree with the database.
+
+    A third are missing, a third have a shifted expiry and the rest stay but
+    get an orphan twin that has no subscription, so reconciliation has every
+    kind of drift to fix.
+    """
+    if share <= 0:
+        return clients
+    result = []
+    for client in clients:
+        if rng.random() >= share:
+            result.append(client)
+            continue
+        kind = rng.randrange(3)
+        if kind == 1:
+            shift = rng.choice((-1, 1)) * rng.randint(1, 10) * 86_400_000
+            client.expiry_ms += shift
+        if kind != 0:
+            result.append(client)
+        if kind == 2:
+            result.append(
+                PanelClient(
+                    email=f"{client.email}_orphan",
+                    sub_id=_uuid(rng).hex,
+                    client_id=str(_uuid(rng)),
+                    expiry_ms=_ms(now - timedelta(days=rng.uniform(0, 60))),
+                )
+            )
+    return result
+
+
+def _to_csv(rows: list[tuple]) -> io.StringIO:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(
+            [value.isoformat() if isinstance(value, datetime) else value for value in row]
+        )
+    buffer.seek(0)
+    return buffer
+
+
+class CopyLoader:
+    """Stream rows into Postgres with ``COPY`` in ``COPY_CHUNK`` slices."""
+
+    def __init__(self, cur):
+        self.cur = cur
+        self.pending: dict[str, list[tuple]] = {"users": [], "subscriptions": []}
+
+    def add(self, table: str, row: tuple) -> None:
+        rows = self.pending[table]
+        rows.append(row)
+        if len(rows) >= COPY_CHUNK:
+            self.flush(table)
+
+    def flush(self, table: str | None = None) -> None:
+        columns = {"users": USER_COLUMNS, "subscriptions": SUBSCRIPTION_COLUMNS}
+        for name in [table] if table else list(self.pending):
+            rows = self.pending[name]
+            if not rows:
+                continue
+            self.cur.copy_expert(
+                f"COPY {name} ({', '.join(columns[name])}) FROM STDIN WITH (FORMAT csv)",
+                _to_csv(rows),
+            )
+            rows.clear()
+
+
+def reset(cur, config: SeedConfig) -> None:
+    bounds = (config.tg_id_base, config.tg_id_base + SEED_SPAN)
+    for table in ("subscriptions", "subscription_history", "users"):
+        cur.execute(f"DELETE FROM {table} WHERE tg_id >= %s AND tg_id < %s", bounds)
+
+
+def write_xui_db(
+    path: Path, config: SeedConfig, panel: dict[str, list[PanelClient]]
+) -> None:
+    """A 3x-ui database with the tables and columns the bot and panel read."""
+    path.unlink(missing_ok=True)
+    con = sqlite3.connect(path)
+    try:
+        con.executescript(
+            """
+            CREATE TABLE inbounds (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER, up INTEGER, down INTEGER, total INTEGER,
+                remark TEXT, enable NUMERIC, expiry_time INTEGER,
+                listen TEXT, port INTEGER UNIQUE, protocol TEXT,
+                settings TEXT, stream_settings TEXT, tag TEXT UNIQUE,
+                sniffing TEXT
+            );
+            CREATE TABLE client_traffics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                inbound_id INTEGER, enable NUMERIC, email TEXT UNIQUE,
+                up INTEGER, down INTEGER, expiry_time INTEGER,
+                total INTEGER, reset INTEGER DEFAULT 0
+            );
+            """
+        )
+        for inbound_id, name in enumerate(config.servers, start=1):
+            clients = panel.get(name, [])
+            port = 443 + inbound_id - 1
+            con.execute(
+                """
+                INSERT INTO inbounds (id, user_id, up, down, total, remark, enable,
+                    expiry_time, listen, port, protocol, settings,
+                    stream_settings, tag, sniffing)
+                VALUES (?, 1, 0, 0, 0, ?, 1, 0, '', ?, 'vless', ?, ?, ?, ?)
+                """,
+                (
+                    inbound_id,
+                    f"seed-{name}",
+                    port,
+                    json.dumps(
+                        {
+                            "clients": [client.to_settings() for client in clients],
+                            "decryption": "none",
+                            "fallbacks": [],
+                        }
+                    ),
+                    json.dumps({"network": "tcp", "security": "reality"}),
+                    f"inbound-{port}",
+                    json.dumps({"enabled": False}),
+                ),
+            )
+            con.executemany(
+                """
+                INSERT INTO client_traffics
+                    (inbound_id, enable, email, up, down, expiry_time, total)
+                VALUES (?, ?, ?, 0, 0, ?, 0)
+                """,
+                (
+                    (inbound_id, int(client.enable), client.email, client.expiry_ms)
+                    for client in clients
+                ),
+            )
+        con.commit()
+    finally:
+        con.close()
+
+
+def write_panel_json(
+    path: Path, config: SeedConfig, panel: dict[str, list[PanelClient]]
+) -> None:
+    servers = {
+        name: {
+            "country": config.servers[name][0],
+            "inbound_id": inbound_id,
+            "clients": [client.to_settings() for client in panel.get(name, [])],
+        }
+        for inbound_id, name in enumerate(config.servers, start=1)
+    }
+    path.write_text(json.dumps({"seed": config.seed, "servers": servers}))
+
+
+def seed(
+    config: SeedConfig,
+    load_db: bool = True,
+    do_reset: bool = False,
+    xui_db: Path | None = None,
+    panel_json: Path | None = None,
+) -> SeedReport:
+    report = SeedReport()
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    want_panel = xui_db is not None or panel_json is not None
+    panel: dict[str, list[PanelClient]] = {name: [] for name in config.servers}
+    rows = generate(config, now, report)
+
+    def consume(loader: CopyLoader | None) -> None:
+        for user, subscription, server, client in rows:
+            if loader is not None:
+                loader.add("users", user)
+                if subscription is not None:
+                    loader.add("subscriptions", subscription)
+            if want_panel and client is not None:
+                panel[server].append(client)
+            if report.users % COPY_CHUNK == 0:
+                print(f"  {report.users} users generated", flush=True)
+        if loader is not None:
+            loader.flush()
+
+    if load_db:
+        from app.storage import _connect
+
+        conn = _connect()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    if do_reset:
+                        reset(cur, config)
+                    consume(CopyLoader(cur))
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("ANALYZE users")
+                cur.execute("ANALYZE subscriptions")
+        finally:
+            conn.close()
+    else:
+        consume(None)
+
+    if want_panel:
+        rng = random.Random(config.seed + 1)
+        for name in panel:
+            panel[name] = apply_drift(panel[name], config.drift, rng, now)
+        report.panel_clients = sum(len(clients) for clients in panel.values())
+        if xui_db is not None:
+            write_xui_db(xui_db, config, panel)
+        if panel_json is not None:
+            write_panel_json(panel_json, config, panel)
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def _parse_servers(raw: str) -> dict[str, tuple[str, float]]:
+    """``nl=nl:0.5,nl2=nl:0.2,fi=fi:0.3`` -> name -> (country, weight)."""
+    servers = {}
+    for item in raw.split(","):
+        name, _, rest = item.strip().partition("=")
+        country, _, weight = (rest or name).partition(":")
+        servers[name] = (country, float(weight or 1))
+    return servers
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=SeedConfig.users)
+    parser.add_argument("--seed", type=int, default=SeedConfig.seed)
+    parser.add_argument("--tg-id-base", type=int, default=SeedConfig.tg_id_base)
+    parser.add_argument(
+        "--subscribed-share", type=float, default=SeedConfig.subscribed_share
+    )
+    parser.add_argument("--trial-share", type=float, default=SeedConfig.trial_share)
+    parser.add_argument(
+        "--referral-share", type=float, default=SeedConfig.referral_share
+    )
+    parser.add_argument(
+        "--servers",
+        default="nl=nl:0.7,fi=fi:0.3",
+        help="name=country:weight list",
+    )
+    parser.add_argument("--sub-url", default=SeedConfig.sub_url)
+    parser.add_argument(
+        "--drift", type=float, default=0.0, help="share of panel clients out of sync"
+    )
+    parser.add_argument("--xui-db", type=Path, help="write a synthetic x-ui.db here")
+    parser.add_argument("--panel-json", type=Path, help="write a FakeXui dataset here")
+    parser.add_argument("--no-db", action="store_true", help="skip Postgres")
+    parser.add_argument("--reset", action="store_true", help="delete the seed range")
+    parser.add_argument("--migrate", action="store_true", help="run init_db() first")
+    args = parser.parse_args()
+
+    config = SeedConfig(
+        users=args.users,
+        seed=args.seed,
+        tg_id_base=args.tg_id_base,
+        subscribed_share=args.subscribed_share,
+        trial_share=args.trial_share,
+        referral_share=args.referral_share,
+        servers=_parse_servers(args.servers),
+        sub_url=args.sub_url.rstrip("/"),
+        drift=args.drift,
+    )
+    if args.migrate and not args.no_db:
+        from app.storage import init_db
+
+        init_db()
+    report = seed(
+        config,
+        load_db=not args.no_db,
+        do_reset=args.reset,
+        xui_db=args.xui_db,
+        panel_json=args.panel_json,
+    )
+    print(
+        f"Seed done in {report.seconds:.1f}s: users={report.users} "
+        f"referred={report.referred} subscriptions={report.subscriptions} "
+        f"active={report.active} trials={report.trials} "
+        f"panel_clients={report.panel_clients}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
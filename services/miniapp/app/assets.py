@@ -0,0 +1,125 @@
+"""Fingerprinted, precompressed static bundle of the miniapp.
+
+``python -m app.assets`` copies ``static/src`` into ``dist`` under
+content-hashed names (``app.<hash>.css``), rewrites the references in
+``templates/index.html`` and stores ``.gz`` and ``.br`` variants next to every
+file. The server loads ``dist`` into memory once and never compresses per
+request.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import logging
+import shutil
+from dataclasses import dataclass, field
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+SRC_DIR = BASE_DIR / "static" / "src"
+TEMPLATE = BASE_DIR / "templates" / "index.html"
+DIST_DIR = BASE_DIR / "dist"
+MANIFEST = "manifest.json"
+INDEX = "index.html"
+
+MEDIA_TYPES = {
+    ".css": "text/css; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+    ".html": "text/html; charset=utf-8",
+    ".svg": "image/svg+xml",
+    ".png": "image/png",
+}
+_COMPRESSIBLE = {".css", ".js", ".html", ".svg"}
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _write(path: Path, data: bytes) -> None:
+    path.write_bytes(data)
+    if path.suffix not in _COMPRESSIBLE:
+        return
+    path.with_name(path.name + ".gz").write_bytes(
+        gzip.compress(data, compresslevel=9, mtime=0)
+    )
+    if brotli is not None:
+        path.with_name(path.name + ".br").write_bytes(
+            brotli.compress(data, quality=11)
+        )
+
+
+def build(src_dir: Path = SRC_DIR, out_dir: Path = DIST_DIR) -> dict[str, str]:
+    """Build the bundle into ``out_dir`` and return the source -> hashed name map."""
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    out_dir.mkdir(parents=True)
+    manifest: dict[str, str] = {}
+    for source in sorted(src_dir.iterdir()):
+        if not source.is_file():
+            continue
+        data = source.read_bytes()
+        hashed = f"{source.stem}.{_digest(data)}{source.suffix}"
+        _write(out_dir / hashed, data)
+        manifest[source.name] = hashed
+    html = TEMPLATE.read_text(encoding="utf-8")
+    for name, hashed in manifest.items():
+        html = html.replace(f"/static/{name}", f"/assets/{hashed}")
+    _write(out_dir / INDEX, html.encode("utf-8"))
+    (out_dir / MANIFEST).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    logger.info("Built miniapp bundle: %s", ", ".join(manifest.values()))
+    return manifest
+
+
+@dataclass
+class Asset:
+    media_type: str
+    etag: str
+    variants: dict[str, bytes] = field(default_factory=dict)
+
+    def pick(self, accept_encoding: str) -> tuple[str | None, bytes]:
+        accepted = {
+            item.split(";")[0].strip().lower() for item in accept_encoding.split(",")
+        }
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self.variants:
+                return encoding, self.variants[encoding]
+        return None, self.variants["identity"]
+
+
+def _load_asset(path: Path) -> Asset:
+    data = path.read_bytes()
+    asset = Asset(
+        MEDIA_TYPES.get(path.suffix, "application/octet-stream"),
+        f'"{_digest(data)}"',
+        {"identity": data},
+    )
+    for encoding, suffix in (("gzip", ".gz"), ("br", ".br")):
+        variant = path.with_name(path.name + suffix)
+        if variant.exists():
+            asset.variants[encoding] = variant.read_bytes()
+    return asset
+
+
+def load_bundle(out_dir: Path = DIST_DIR) -> dict[str, Asset]:
+    """Load the built bundle, building it first if ``dist`` is missing."""
+    if not (out_dir / MANIFEST).exists():
+        build(out_dir=out_dir)
+    manifest = json.loads((out_dir / MANIFEST).read_text(encoding="utf-8"))
+    bundle = {name: _load_asset(out_dir / name) for name in manifest.values()}
+    bundle[INDEX] = _load_asset(out_dir / INDEX)
+    return bundle
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    build()
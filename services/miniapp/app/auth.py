@@ -0,0 +1,47 @@
+"""Validation of Telegram WebApp ``initData``.
+
+See https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import time
+from urllib.parse import parse_qsl
+
+
+class InitDataError(ValueError):
+    pass
+
+
+def _secret_key(bot_token: str) -> bytes:
+    return hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+
+
+def validate_init_data(init_data: str, bot_token: str, max_age: int) -> dict:
+    """Return the ``user`` object of signed ``initData`` or raise ``InitDataError``."""
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received = fields.pop("hash", None)
+    if not received:
+        raise InitDataError("hash is missing")
+    check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+    expected = hmac.new(
+        _secret_key(bot_token), check_string.encode(), hashlib.sha256
+    ).hexdigest()
+    if not hmac.compare_digest(expected, received):
+        raise InitDataError("hash mismatch")
+    try:
+        auth_date = int(fields.get("auth_date", "0"))
+    except ValueError as exc:
+        raise InitDataError("bad auth_date") from exc
+    if max_age and time.time() - auth_date > max_age:
+        raise InitDataError("initData expired")
+    try:
+        user = json.loads(fields.get("user", ""))
+    except json.JSONDecodeError as exc:
+        raise InitDataError("bad user") from exc
+    if not isinstance(user, dict) or not isinstance(user.get("id"), int):
+        raise InitDataError("bad user")
+    return user
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import os
+
+from dotenv import find_dotenv, load_dotenv
+
+_ENV_LOADED = False
+
+
+def load_env() -> None:
+    global _ENV_LOADED
+    if _ENV_LOADED:
+        return
+    load_dotenv(find_dotenv())
+    _ENV_LOADED = True
+
+
+def _require(name: str) -> str:
+    load_env()
+    value = os.getenv(name)
+    if not value:
+        raise RuntimeError(f"{name} is not set")
+    return value
+
+
+def get_bot_token() -> str:
+    return _require("BOT_TOKEN")
+
+
+def get_database_url() -> str:
+    return _require("DATABASE_URL")
+
+
+def get_redis_url() -> str:
+    load_env()
+    return os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+def get_init_data_max_age() -> int:
+    load_env()
+    return int(os.getenv("MINIAPP_INITDATA_MAX_AGE", "86400"))
+
+
+def get_api_cache_seconds() -> int:
+    load_env()
+    return int(os.getenv("MINIAPP_API_CACHE_SECONDS", "30"))
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+
+from fastapi import FastAPI, Header, HTTPException, Request, Response, status
+
+from app.assets import INDEX, Asset, load_bundle
+from app.auth import InitDataError, validate_init_data
+from app.config import (
+    get_api_cache_seconds,
+    get_bot_token,
+    get_init_data_max_age,
+    load_env,
+)
+from app.subscription import get_subscription_view
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def _tg_user(authorization: str | None) -> dict:
+    scheme, _, init_data = (authorization or "").partition(" ")
+    if scheme.lower() != "tma" or not init_data:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    try:
+        return validate_init_data(init_data, get_bot_token(), get_init_data_max_age())
+    except InitDataError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+
+
+def _asset_response(
+    request: Request, asset: Asset, cache_control: str
+) -> Response:
+    headers = {
+        "ETag": asset.etag,
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    if request.headers.get("if-none-match") == asset.etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    encoding, body = asset.pick(request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=asset.media_type, headers=headers)
+
+
+def create_app() -> FastAPI:
+    load_env()
+    app = FastAPI(title="VPN Miniapp")
+    bundle = load_bundle()
+
+    @app.get("/")
+    async def index(request: Request):
+        # The page is tiny and names the current hashed assets: always revalidate.
+        return _asset_response(request, bundle[INDEX], "no-cache")
+
+    @app.get("/assets/{name}")
+    async def asset(name: str, request: Request):
+        item = bundle.get(name)
+        if item is None or name == INDEX:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+        return _asset_response(request, item, IMMUTABLE)
+
+    @app.get("/api/subscription")
+    async def subscription(
+        request: Request, authorization: str | None = Header(default=None)
+    ):
+        user = _tg_user(authorization)
+        view = await asyncio.to_thread(get_subscription_view, user["id"])
+        body = json.dumps(view).encode()
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"private, max-age={get_api_cache_seconds()}",
+            "Vary": "Authorization",
+        }
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    return app
+
+
+app = create_app()
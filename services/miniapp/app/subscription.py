@@ -0,0 +1,108 @@
+"""User subscription read through the bot's ``subscription:<tg_id>`` cache.
+
+The cache entry format matches ``services/bot/app/storage.py``; on a miss the
+row is read from Postgres and written back in the same format, so the bot and
+the miniapp warm the same key.
+"""
+
+from __future__ import annotations
+
+import json
+from datetime import datetime, timezone
+
+import psycopg2
+import redis
+from psycopg2.extras import RealDictCursor
+
+from app.config import get_database_url, get_redis_url
+
+_redis_client: redis.Redis | None = None
+
+
+def _redis() -> redis.Redis:
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(
+            get_redis_url(),
+            decode_responses=True,
+            socket_timeout=1.0,
+            socket_connect_timeout=1.0,
+        )
+    return _redis_client
+
+
+def _connect():
+    return psycopg2.connect(get_database_url())
+
+
+def _cache_key(tg_id: int) -> str:
+    return f"subscription:{tg_id}"
+
+
+def _parse_dt(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _from_db(tg_id: int) -> dict | None:
+    with _connect() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                SELECT start_at, end_at, subscription_link, instructions, country, server
+                FROM subscriptions WHERE tg_id = %s
+                """,
+                (tg_id,),
+            )
+            row = cur.fetchone()
+    if not row or not row["end_at"]:
+        return None
+    end_at = row["end_at"]
+    if end_at.tzinfo is None:
+        end_at = end_at.replace(tzinfo=timezone.utc)
+    start_at = row["start_at"]
+    cached = {
+        "start_at": start_at.isoformat() if start_at else None,
+        "end_at": end_at.isoformat(),
+        "subscription_link": row["subscription_link"],
+        "instructions": row["instructions"],
+        "country": row["country"],
+        "server": row["server"],
+    }
+    ttl = int((end_at - datetime.now(timezone.utc)).total_seconds())
+    if ttl > 0:
+        try:
+            _redis().setex(_cache_key(tg_id), ttl, json.dumps(cached))
+        except redis.RedisError:
+            pass
+    return cached
+
+
+def _load(tg_id: int) -> dict | None:
+    try:
+        raw = _redis().get(_cache_key(tg_id))
+    except redis.RedisError:
+        raw = None
+    if raw:
+        return json.loads(raw)
+    return _from_db(tg_id)
+
+
+def get_subscription_view(tg_id: int) -> dict:
+    """JSON-ready subscription of ``tg_id`` for the miniapp."""
+    data = _load(tg_id)
+    now = datetime.now(timezone.utc)
+    end_at = _parse_dt(data.get("end_at")) if data else None
+    if data is None or end_at is None or end_at <= now:
+        return {"active": False}
+    return {
+        "active": True,
+        "end_at": end_at.isoformat(),
+        "days_left": (end_at - now).days,
+        "country": data.get("country") or "nl",
+        "subscription_link": data.get("subscription_link"),
+    }
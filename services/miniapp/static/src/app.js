@@ -0,0 +1,152 @@
+// Ссылка подписки приходит из /api/subscription
+let subUrl = null;
+
+// initData передается Telegram в hash страницы; telegram-web-app.js не нужен
+const initData = window.Telegram?.WebApp?.initData
+    || new URLSearchParams(window.location.hash.slice(1)).get('tgWebAppData')
+    || '';
+
+// Определения приложений
+const HAPP = { id: 'HAPP', name: 'Happ', scheme: 'happ' };
+const V2RAY = { id: 'V2RAY', name: 'V2rayTun', scheme: 'v2raytun' };
+const V2RAYN = { id: 'V2RAYN', name: 'v2rayN', scheme: 'v2rayn' };
+
+// Данные по платформам
+const appsData = {
+    ios: [
+        { ...HAPP, links: [{ text: 'App Store (RU)', url: 'https://apps.apple.com/ru/app/happ-proxy/id6444641723' }, { text: 'App Store (Global)', url: 'https://apps.apple.com/us/app/happ-proxy/id6444641723' }] },
+        { ...V2RAY, links: [{ text: 'App Store', url: 'https://apps.apple.com/app/v2raytun/id1645005021' }] }
+    ],
+    android: [
+        { ...HAPP, links: [{ text: 'Google Play', url: '#' }, { text: 'Download APK', url: '#' }] },
+        { ...V2RAY, links: [{ text: 'Direct Link', url: '#' }] }
+    ],
+    windows: [
+        { ...V2RAYN, links: [{ text: 'GitHub Client', url: 'https://github.com/v2rayN/v2rayN/releases' }] },
+        { ...V2RAY, links: [{ text: 'Direct Download', url: '#' }] }
+    ],
+    macos: [
+        { ...HAPP, links: [{ text: 'Mac App Store', url: 'https://apps.apple.com/us/app/happ-proxy/id6444641723' }] },
+        { ...V2RAY, links: [{ text: 'GitHub DMG', url: '#' }] }
+    ]
+};
+
+let currentOS = 'ios';
+let currentAppIdx = 0;
+
+// Всплывающее уведомление
+function showToast(text) {
+    const t = document.getElementById('toast');
+    t.textContent = text;
+    t.className = "show";
+    setTimeout(() => t.className = "", 3000);
+}
+
+// Загрузка подписки пользователя
+async function loadSubscription() {
+    const status = document.getElementById('sub-status');
+    if (!initData) {
+        status.textContent = 'Откройте приложение из бота';
+        return;
+    }
+    try {
+        const response = await fetch('/api/subscription', {
+            headers: { Authorization: `tma ${initData}` },
+        });
+        if (!response.ok) throw new Error(response.status);
+        const data = await response.json();
+        if (!data.active) {
+            status.textContent = 'Нет активной подписки';
+            return;
+        }
+        subUrl = data.subscription_link;
+        const endAt = new Date(data.end_at).toLocaleDateString('ru-RU');
+        status.textContent = `Активна до ${endAt} · осталось дней: ${data.days_left}`;
+    } catch (e) {
+        status.textContent = 'Не удалось загрузить подписку';
+    }
+}
+
+// Основная функция рендеринга
+function render() {
+    const tabsContainer = document.getElementById('app-tabs');
+    const linksContainer = document.getElementById('install-links');
+    const apps = appsData[currentOS];
+
+    // Отрисовка вкладок
+    tabsContainer.innerHTML = '';
+    apps.forEach((app, i) => {
+        const tab = document.createElement('div');
+        tab.className = `app-tab p-6 cursor-pointer flex flex-col justify-between relative overflow-hidden ${i === currentAppIdx ? 'active' : ''}`;
+        tab.innerHTML = `
+            <div class="flex items-center mb-6">
+                <div class="dot w-2 h-2 rounded-full bg-zinc-800 transition-all"></div>
+                <span class="tab-label ml-2 text-[9px] font-black uppercase tracking-tight opacity-70">${app.id}</span>
+            </div>
+            <div class="tab-name font-black text-lg">${app.name}</div>
+        `;
+        tab.onclick = () => { currentAppIdx = i; render(); };
+        tabsContainer.appendChild(tab);
+    });
+
+    // Отрисовка ссылок для скачивания
+    linksContainer.innerHTML = '';
+    const currentApp = apps[currentAppIdx];
+    currentApp.links.forEach(l => {
+        const a = document.createElement('a');
+        a.href = l.url;
+        a.target = "_blank";
+        a.className = "text-zinc-200 text-[11px] font-bold py-4 px-6 rounded-2xl border border-white/5 bg-white/5 hover:bg-white/10 transition-all flex justify-between items-center";
+        a.innerHTML = `<span>${l.text}</span> <span class="text-amber-500 font-black">→</span>`;
+        linksContainer.appendChild(a);
+    });
+
+    // Обновление текста на кнопке импорта
+    document.getElementById('importBtn').innerText = `Импорт в ${currentApp.name}`;
+}
+
+// Выбор ОС
+document.getElementById('os-selector').onchange = (e) => {
+    currentOS = e.target.value;
+    currentAppIdx = 0;
+    render();
+};
+
+// Логика копирования ссылки
+document.getElementById('copyBtn').onclick = () => {
+    if (!subUrl) {
+        showToast('Подписка не найдена');
+        return;
+    }
+    const el = document.createElement('textarea');
+    el.value = subUrl;
+    document.body.appendChild(el);
+    el.select();
+    document.execCommand('copy');
+    document.body.removeChild(el);
+
+    showToast('Конфигурация скопирована');
+};
+
+// Логика быстрого импорта
+document.getElementById('importBtn').onclick = () => {
+    if (!subUrl) {
+        showToast('Подписка не найдена');
+        return;
+    }
+    const app = appsData[currentOS][currentAppIdx];
+    window.location.href = `${app.scheme}://install-config?url=${encodeURIComponent(subUrl)}`;
+};
+
+// Автоопределение устройства при загрузке страницы
+window.onload = () => {
+    const ua = navigator.userAgent.toLowerCase();
+    if (ua.includes("win")) currentOS = "windows";
+    else if (ua.includes("mac") && !('ontouchend' in document)) currentOS = "macos";
+    else if (ua.includes("android")) currentOS = "android";
+    else currentOS = "ios";
+
+    document.getElementById('os-selector').value = currentOS;
+    render();
+    loadSubscription();
+};
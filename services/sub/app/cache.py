@@ -0,0 +1,144 @@
+"""Per-subId cache of rendered panel subscriptions.
+
+Subscription apps poll ``/sub/<subId>`` every few minutes. A fresh entry is
+served without touching the panel; when it expires, the first request
+refreshes it and every concurrent request for the same subId awaits that one
+refresh instead of sending its own.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import httpx
+
+from app.config import GatewaySettings
+
+# Panel headers subscription apps read: traffic/expiry, refresh interval, title.
+FORWARDED_HEADERS = (
+    "content-type",
+    "content-disposition",
+    "subscription-userinfo",
+    "profile-update-interval",
+    "profile-title",
+    "profile-web-page-url",
+    "support-url",
+)
+
+
+class UpstreamError(RuntimeError):
+    pass
+
+
+@dataclass
+class Entry:
+    status: int
+    body: bytes = b""
+    headers: dict[str, str] = field(default_factory=dict)
+    etag: str = ""
+    upstream: str | None = None
+    fetched_at: float = 0.0
+    rendered_at: float = 0.0
+
+
+def make_etag(body: bytes) -> str:
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match or not etag:
+        return False
+    candidates = [item.strip() for item in if_none_match.split(",")]
+    return "*" in candidates or any(
+        item.removeprefix("W/") == etag for item in candidates
+    )
+
+
+class SubscriptionCache:
+    """LRU of ``Entry`` per subId with request coalescing.
+
+    Entries are fresh for ``ttl_seconds``. A subId unknown to every panel is
+    cached as a 404 too, so deleted subscriptions that keep polling cost
+    nothing. If the panel fails during a refresh, the previous body is served
+    for up to ``stale_seconds`` after it was rendered.
+    """
+
+    def __init__(self, settings: GatewaySettings, client: httpx.AsyncClient):
+        self.settings = settings
+        self.client = client
+        self._entries: OrderedDict[str, Entry] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task[Entry]] = {}
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "stale": 0,
+            "errors": 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, sub_id: str) -> Entry:
+        entry = self._entries.get(sub_id)
+        now = time.monotonic()
+        if entry is not None and now - entry.fetched_at < self.settings.ttl_seconds:
+            self.stats["hits"] += 1
+            self._entries.move_to_end(sub_id)
+            return entry
+        task = self._inflight.get(sub_id)
+        if task is None:
+            self.stats["misses"] += 1
+            task = asyncio.create_task(self._refresh(sub_id, entry))
+            self._inflight[sub_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(sub_id, None))
+        else:
+            self.stats["coalesced"] += 1
+        # Shielded so a client hanging up does not cancel the shared refresh.
+        return await asyncio.shield(task)
+
+    async def _refresh(self, sub_id: str, previous: Entry | None) -> Entry:
+        now = time.monotonic()
+        try:
+            entry = await self._fetch(sub_id, previous)
+        except (httpx.HTTPError, UpstreamError):
+            self.stats["errors"] += 1
+            if (
+                previous is None
+                or now - previous.rendered_at >= self.settings.stale_seconds
+            ):
+                raise
+            self.stats["stale"] += 1
+            # Retry the panel after another TTL, not on every poll.
+            previous.fetched_at = now
+            return previous
+        entry.fetched_at = entry.rendered_at = now
+        self._entries[sub_id] = entry
+        self._entries.move_to_end(sub_id)
+        while len(self._entries) > self.settings.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    async def _fetch(self, sub_id: str, previous: Entry | None) -> Entry:
+        upstreams = list(self.settings.upstreams)
+        if previous is not None and previous.upstream in upstreams:
+            upstreams.remove(previous.upstream)
+            upstreams.insert(0, previous.upstream)
+        for upstream in upstreams:
+            response = await self.client.get(f"{upstream}/sub/{sub_id}")
+            if response.status_code == 404:
+                continue
+            if response.status_code != 200:
+                raise UpstreamError(f"{upstream} answered {response.status_code}")
+            body = response.content
+            headers = {
+                name: response.headers[name]
+                for name in FORWARDED_HEADERS
+                if name in response.headers
+            }
+            return Entry(200, body, headers, make_etag(body), upstream)
+        return Entry(404)
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+
+from dotenv import find_dotenv, load_dotenv
+
+_ENV_LOADED = False
+
+
+def load_env() -> None:
+    global _ENV_LOADED
+    if _ENV_LOADED:
+        return
+    load_dotenv(find_dotenv())
+    _ENV_LOADED = True
+
+
+@dataclass(frozen=True)
+class GatewaySettings:
+    upstreams: tuple[str, ...]
+    ttl_seconds: float
+    stale_seconds: float
+    max_entries: int
+    timeout_seconds: float
+    verify_tls: bool
+
+
+def get_gateway_settings() -> GatewaySettings:
+    load_env()
+    raw = os.getenv("SUB_UPSTREAM_URLS", "https://nyxvpnnl.home.kg:15499")
+    upstreams = tuple(
+        url.strip().rstrip("/") for url in raw.split(",") if url.strip()
+    )
+    if not upstreams:
+        raise RuntimeError("SUB_UPSTREAM_URLS is not set")
+    return GatewaySettings(
+        upstreams=upstreams,
+        ttl_seconds=float(os.getenv("SUB_CACHE_TTL_SECONDS", "60")),
+        stale_seconds=float(os.getenv("SUB_STALE_SECONDS", "3600")),
+        max_entries=int(os.getenv("SUB_CACHE_MAX_ENTRIES", "20000")),
+        timeout_seconds=float(os.getenv("SUB_UPSTREAM_TIMEOUT", "10")),
+        verify_tls=os.getenv("SUB_UPSTREAM_VERIFY", "1") != "0",
+    )
+
+
+def get_landing_path() -> str | None:
+    load_env()
+    return os.getenv("SUB_LANDING_HTML") or None
+
+
+def get_public_url() -> str | None:
+    """Public address of the gateway, when it sits behind a proxy."""
+    load_env()
+    url = os.getenv("SUB_PUBLIC_URL")
+    return url.rstrip("/") if url else None
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import html
+import re
+from contextlib import asynccontextmanager
+
+import httpx
+from fastapi import FastAPI, Request, Response, status
+from fastapi.responses import HTMLResponse
+
+from app.cache import SubscriptionCache, UpstreamError, etag_matches
+from app.config import (
+    get_gateway_settings,
+    get_landing_path,
+    get_public_url,
+    load_env,
+)
+
+SUB_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = get_gateway_settings()
+    client = httpx.AsyncClient(
+        timeout=httpx.Timeout(settings.timeout_seconds),
+        verify=settings.verify_tls,
+        # A fixed client so the panel always renders the plain subscription body.
+        headers={"User-Agent": "sub-gateway", "Accept": "*/*"},
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+    )
+    app.state.cache = SubscriptionCache(settings, client)
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+def create_app() -> FastAPI:
+    load_env()
+    app = FastAPI(title="VPN Subscription Gateway", lifespan=lifespan)
+
+    @app.api_route("/sub/{sub_id}", methods=["GET", "HEAD"])
+    async def subscription(sub_id: str, request: Request):
+        if not SUB_ID_RE.match(sub_id):
+            return Response(status_code=status.HTTP_404_NOT_FOUND)
+        cache: SubscriptionCache = request.app.state.cache
+        try:
+            entry = await cache.get(sub_id)
+        except (httpx.HTTPError, UpstreamError):
+            return Response(status_code=status.HTTP_502_BAD_GATEWAY)
+        if entry.status != 200:
+            return Response(status_code=entry.status)
+        headers = {
+            "ETag": entry.etag,
+            "Cache-Control": f"private, max-age={int(cache.settings.ttl_seconds)}",
+        }
+        if etag_matches(request.headers.get("if-none-match"), entry.etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        headers.update(entry.headers)
+        body = b"" if request.method == "HEAD" else entry.body
+        return Response(content=body, headers=headers)
+
+    @app.get("/health")
+    async def health(request: Request):
+        cache: SubscriptionCache = request.app.state.cache
+        return {"entries": len(cache), **cache.stats}
+
+    landing = get_landing_path()
+    if landing:
+        with open(landing, encoding="utf-8") as handle:
+            landing_html = handle.read()
+        public_url = get_public_url()
+
+        @app.get("/", response_class=HTMLResponse)
+        async def landing_page(request: Request):
+            # Subscription links on the page point back at this gateway.
+            base = public_url or str(request.base_url).rstrip("/")
+            return landing_html.replace(
+                '<meta name="subscription-base" content="">',
+                f'<meta name="subscription-base" content="{html.escape(base)}">',
+                1,
+            )
+
+    return app
+
+
+app = create_app()